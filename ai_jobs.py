@@ -0,0 +1,96 @@
+# -----------------------------------------------------------------------------
+# Market Logic AI 작업 큐 (정해진 수의 작업자 + 요금제 우선순위 + 제한 시간 + 취소)
+# -----------------------------------------------------------------------------
+# 💡 버튼을 누른 세션은 작업 번호만 받아 바로 돌아가고, 결과는 나중에 status() 로 확인합니다.
+# 동시에 도는 gpt-4o 호출은 작업자 수(workers)를 넘지 않고, 대기열이 가득 차면 새 요청은 바로 거절됩니다.
+import itertools
+import queue
+import threading
+import time
+import uuid
+
+PRIORITY_PRO = 0
+PRIORITY_FREE = 1
+
+class AIQueueFull(Exception):
+    pass
+
+class AIJobQueue:
+    def __init__(self, workers=4, max_pending=32, timeout=90, keep_sec=600):
+        self.q = queue.PriorityQueue()
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.seq = itertools.count() # 같은 우선순위끼리는 먼저 온 순서대로
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.keep_sec = keep_sec
+        self.threads = [threading.Thread(target=self.work, name=f"ai-worker-{i}", daemon=True) for i in range(workers)]
+        for t in self.threads: t.start()
+
+    def submit(self, fn, *args, priority=PRIORITY_FREE, timeout=None, **kwargs):
+        # fn(*args, timeout=남은 초, **kwargs) 형태로 호출합니다. (OpenAI 클라이언트에 그대로 넘겨 실제 요청도 끊기게)
+        self.prune()
+        with self.lock:
+            pending = sum(1 for j in self.jobs.values() if j['state'] == "queued")
+            if pending >= self.max_pending: raise AIQueueFull(f"대기 중인 AI 작업이 {pending}개입니다.")
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            self.jobs[job_id] = {"state": "queued", "priority": priority, "submitted": now,
+                                 "deadline": now + (timeout or self.timeout), "result": None, "error": None, "finished": None}
+        self.q.put((priority, next(self.seq), job_id, fn, args, kwargs))
+        return job_id
+
+    def work(self):
+        while True:
+            _, _, job_id, fn, args, kwargs = self.q.get()
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None or job['state'] != "queued": continue # 취소된 작업은 건너뜀
+                remaining = job['deadline'] - time.time()
+                if remaining <= 0:
+                    self.finish(job, "timeout", error="대기 중 제한 시간을 넘었습니다.")
+                    continue
+                job['state'], job['started'] = "running", time.time()
+            try:
+                result, error, state = fn(*args, timeout=remaining, **kwargs), None, "done"
+            except Exception as e:
+                result, error, state = None, str(e), "failed"
+            with self.lock:
+                if job['state'] != "running": continue # 실행 중에 취소/시간 초과 처리된 작업은 결과를 버림
+                if time.time() > job['deadline']: state, result, error = "timeout", None, "제한 시간을 넘었습니다."
+                self.finish(job, state, result, error)
+
+    def finish(self, job, state, result=None, error=None):
+        job.update(state=state, result=result, error=error, finished=time.time())
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None: return None
+            if job['state'] in ("queued", "running") and time.time() > job['deadline']:
+                self.finish(job, "timeout", error="제한 시간을 넘었습니다.")
+            out = dict(job)
+            if job['state'] == "queued":
+                # 내 앞에 있는 작업 수 (우선순위가 높거나, 같은데 먼저 온 작업)
+                out['position'] = sum(1 for j in self.jobs.values() if j['state'] == "queued"
+                                      and (j['priority'], j['submitted']) < (job['priority'], job['submitted']))
+            return out
+
+    def cancel(self, job_id):
+        # 대기 중이면 실행되지 않고, 실행 중이면 끝나도 결과를 버립니다.
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job['state'] not in ("queued", "running"): return False
+            self.finish(job, "cancelled")
+            return True
+
+    def prune(self):
+        cutoff = time.time() - self.keep_sec
+        with self.lock:
+            for job_id in [k for k, j in self.jobs.items() if j['finished'] and j['finished'] < cutoff]:
+                del self.jobs[job_id]
+
+    def stats(self):
+        with self.lock:
+            states = [j['state'] for j in self.jobs.values()]
+        return {s: states.count(s) for s in ("queued", "running", "done", "failed", "timeout", "cancelled")}
@@ -1,8 +1,6 @@
 import streamlit as st
 import pandas as pd
-import openai
 import yfinance as yf
-import requests
 import altair as alt
 import plotly.graph_objects as go
 from io import StringIO
@@ -12,6 +10,26 @@ import urllib.parse
 from streamlit_gsheets import GSheetsConnection 
 import extra_streamlit_components as stx
 import concurrent.futures
+import uuid
+from data_engine import (
+    get_yahoo_data, get_fred_data, get_interest_rate_hybrid, get_derived_value, get_freeze_key, get_shared_cache,
+    get_market_calendar, get_traffic_light_status,
+    LIVE_POLL_SEC, get_live_board, apply_live_quote,
+    get_frozen_market_map, get_frozen_constituent_map,
+    BACKTEST_TARGETS, STATE_ORDER, run_signal_backtest, signal_segments,
+    ANALYTICS_PAIRS, VOL_REGIMES, VOL_REGIME_ORDER, refresh_rolling_kernel, classify_vol_regime,
+    get_ai_queue, run_market_analysis, vip_report_job, get_pregenerated_analysis, get_risk_stats,
+    WATCHLIST_LIMITS, normalize_symbols, parse_watchlist, get_watchlist_hub,
+    ALERT_METRICS, ALERT_PRESETS, get_alert_store, get_alert_engine, split_vip_report, vip_report_sections,
+    log_event, usage_report, is_admin, quality_notice, BREADTH_GROUPS, get_sector_breadth, breadth_summary,
+    COMPARE_SERIES, COMPARE_USD, PERIOD_DAYS, compare_epochs, get_index_comparison, get_http,
+)
+from shared_cache import flight_stats
+from ai_jobs import AIQueueFull, PRIORITY_PRO, PRIORITY_FREE
+from components import (
+    begin_page, end_page, payload_stats, html, use_css, spacer, section_header, metric_card, traffic_light,
+    chart_meta, ai_summary, ai_card, report_card, ai_box, gauge_meta, pro_box, vip_status, vip_locked,
+)
 
 # 1. 쿠키 매니저 및 새로고침 방어 로직 (최상단 배치)
 cookie_manager = stx.CookieManager()
@@ -35,6 +53,7 @@ if saved_email and not st.session_state.get('logged_in', False):
             st.session_state.user_name = df.at[user_idx, 'Name']
             st.session_state.remaining_calls = int(df.at[user_idx, 'Remaining_Calls'])
             st.session_state.plan = df.at[user_idx, 'Plan']
+            st.session_state.watchlist = parse_watchlist(df.at[user_idx, 'Watchlist']) if 'Watchlist' in df.columns else []
             
             st.rerun()
         else:
@@ -73,24 +92,8 @@ st.set_page_config(
     initial_sidebar_state="auto"
 )
 
-st.markdown("""
-    <style>
-    @import url('https://cdn.jsdelivr.net/gh/orioncactus/pretendard/dist/web/static/pretendard.css');
-    html, body, .stApp { font-family: 'Pretendard', sans-serif !important; background-color: #f5f7f9; }
-    .section-header { font-size: 20px; font-weight: 700; color: #111827; margin-top: 30px; margin-bottom: 15px; border-left: 4px solid #111827; padding-left: 10px; }
-    div[data-testid="stVerticalBlockBorderWrapper"] { background-color: #ffffff; border: 1px solid #e5e7eb; border-radius: 12px; box-shadow: 0 1px 3px rgba(0,0,0,0.05); padding: 20px; margin-bottom: 15px; }
-    div.d-day-container { background-color: #1e293b; color: white; padding: 30px; border-radius: 16px; text-align: center; margin-bottom: 20px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
-    .d-day-title { font-size: 16px; color: #94a3b8; margin-bottom: 10px; letter-spacing: 1px; text-transform: uppercase; }
-    .d-day-count { font-size: 56px; font-weight: 800; color: #ffffff; line-height: 1.1; margin: 10px 0; }
-    .d-day-date { font-size: 18px; color: #cbd5e1; margin-top: 10px; }
-    .ai-box { background-color: #f0fdf4; border: 1px solid #bbf7d0; border-radius: 8px; padding: 20px; height: 100%; }
-    .ai-title { font-weight: 700; font-size: 16px; margin-bottom: 10px; color: #166534; border-bottom: 1px solid #bbf7d0; padding-bottom: 5px; }
-    .ai-text { font-size: 14px; line-height: 1.7; color: #14532d; word-break: keep-all; }
-    .info-box { background-color: #eff6ff; border: 1px solid #bfdbfe; border-radius: 8px; padding: 15px; color: #1e3a8a; font-size: 14px; line-height: 1.6; margin-bottom: 20px; }
-    .warning-box { background-color: #fefce8; border: 1px solid #fde047; border-radius: 8px; padding: 15px; color: #854d0e; font-size: 14px; line-height: 1.6; margin-bottom: 20px; }
-    .footer-disclaimer { text-align: center; color: #9ca3af; font-size: 13px; padding: 20px 0; margin-top: 40px; border-top: 1px solid #e5e7eb; line-height: 1.6; }
-    </style>
-    """, unsafe_allow_html=True)
+# 💡 공통 CSS 는 components.py 에 모아 두고 실행마다 1번만 보냅니다. (이번 실행의 전송량 계측도 여기서 시작)
+begin_page()
 
 # -----------------------------------------------------------------------------
 # 구글 로그인 리디렉션 처리
@@ -106,13 +109,21 @@ if "code" in query_params and not st.session_state.logged_in:
         "redirect_uri": GOOGLE_REDIRECT_URI,
         "grant_type": "authorization_code"
     }
-    res = requests.post(token_url, data=token_data)
-    if res.status_code == 200:
-        access_token = res.json().get("access_token")
-        user_info_url = "https://www.googleapis.com/oauth2/v1/userinfo"
-        user_res = requests.get(user_info_url, headers={"Authorization": f"Bearer {access_token}"})
-
-        if user_res.status_code == 200:
+    # 💡 공용 HTTP 클라이언트: 연결 재사용 + 제한 시간. 인가 코드는 한 번만 쓸 수 있어 토큰 교환은 연결 실패일 때만 다시 보냅니다.
+    http = get_http()
+    try:
+        res = http.post(token_url, data=token_data, endpoint="google/token")
+        user_res = None
+        if res.status_code == 200:
+            access_token = res.json().get("access_token")
+            user_info_url = "https://www.googleapis.com/oauth2/v1/userinfo"
+            user_res = http.get(user_info_url, headers={"Authorization": f"Bearer {access_token}"}, endpoint="google/userinfo")
+    except Exception:
+        res = user_res = None
+        st.error("구글 로그인 서버 응답이 늦습니다. 잠시 후 다시 로그인해 주세요.")
+        st.query_params.clear()
+    if res is not None and res.status_code == 200:
+        if user_res is not None and user_res.status_code == 200:
             user_info = user_res.json()
             user_email = user_info.get("email")
             user_name = user_info.get("name")
@@ -126,13 +137,14 @@ if "code" in query_params and not st.session_state.logged_in:
             today_str = date.today().strftime('%Y-%m-%d')
             
             if df.empty or 'Email' not in df.columns:
-                df = pd.DataFrame(columns=['Email', 'Name', 'Plan', 'Remaining_Calls', 'Last_Free_Date'])
+                df = pd.DataFrame(columns=['Email', 'Name', 'Plan', 'Remaining_Calls', 'Last_Free_Date', 'Watchlist'])
                 
             if user_email in df['Email'].values:
                 user_idx = df.index[df['Email'] == user_email].tolist()[0]
                 plan = df.at[user_idx, 'Plan']
                 calls = int(df.at[user_idx, 'Remaining_Calls'])
                 last_free = str(df.at[user_idx, 'Last_Free_Date'])
+                watchlist = parse_watchlist(df.at[user_idx, 'Watchlist']) if 'Watchlist' in df.columns else []
                 
                 if last_free != today_str:
                     if calls < 1:  
@@ -144,12 +156,14 @@ if "code" in query_params and not st.session_state.logged_in:
                 plan = "Free"
                 calls = 1
                 last_free = today_str
-                new_row = pd.DataFrame([{'Email': user_email, 'Name': user_name, 'Plan': plan, 'Remaining_Calls': calls, 'Last_Free_Date': last_free}])
+                watchlist = []
+                new_row = pd.DataFrame([{'Email': user_email, 'Name': user_name, 'Plan': plan, 'Remaining_Calls': calls, 'Last_Free_Date': last_free, 'Watchlist': ""}])
                 df = pd.concat([df, new_row], ignore_index=True)
                 conn.update(worksheet="Users", data=df) 
                 
             st.session_state.remaining_calls = calls
             st.session_state.plan = plan
+            st.session_state.watchlist = watchlist
             st.query_params.clear()
 
 # -----------------------------------------------------------------------------
@@ -178,24 +192,41 @@ with st.sidebar:
         st.markdown("---")
         
         if st.session_state.get('plan', 'Free') == 'Free':
-            st.markdown("""
-            <div style='background-color:#fffbeb; border:1px solid #fde68a; border-radius:10px; padding:15px; margin-bottom:15px; box-shadow: 0 2px 4px rgba(0,0,0,0.05);'>
-                <div style='font-size:15px; font-weight:800; color:#b45309; margin-bottom:8px;'>👑 Pro 멤버십 업그레이드</div>
-                <div style='font-size:13px; color:#92400e; line-height:1.5; margin-bottom:0px; word-break:keep-all;'>
-                    무제한 AI 펀드매니저 분석과<br>VIP 시크릿 탭을 열어보세요! (월 9,900원)
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            pro_box()
             st.link_button("💸 간편 송금하기 (모바일 카카오페이)", "https://qr.kakaopay.com/Ej7mwSX0V135606469", use_container_width=True)
             st.link_button("📝 무통장 입금 확인 및 승인 요청", "https://forms.google.com", type="primary", use_container_width=True)
         else:
             st.success("👑 Pro 멤버십 이용 중")
+
+        # 🔔 지표 알림 구독 (평가/발송은 서버의 알림 엔진이 백그라운드에서 모든 구독을 한 번에 처리)
+        with st.expander("🔔 지표 알림"):
+            get_alert_engine()
+            alert_store = get_alert_store()
+            preset = st.selectbox("알림 규칙", list(ALERT_PRESETS) + ["직접 입력"], key="alert_preset")
+            if preset == "직접 입력":
+                a_metric = st.selectbox("지표", list(ALERT_METRICS), key="alert_metric")
+                a_op = st.radio("조건", [">=", "<="], horizontal=True, key="alert_op")
+                a_thr = st.number_input("기준값", value=0.0, key="alert_thr")
+                a_label = ""
+            else:
+                (a_metric, a_op, a_thr), a_label = ALERT_PRESETS[preset], preset
+            if st.button("알림 추가", use_container_width=True):
+                alert_store.subscribe(st.session_state.user_email, a_metric, a_op, a_thr, label=a_label)
+            my_alerts = alert_store.subscriptions(st.session_state.user_email)
+            for row in my_alerts.itertuples():
+                a1, a2 = st.columns([4, 1])
+                with a1: st.caption(row.label or f"{row.metric} {row.op} {row.threshold:g}")
+                with a2:
+                    if st.button("✕", key=f"alert_del_{row.id}"):
+                        alert_store.unsubscribe(st.session_state.user_email, row.id)
+                        st.rerun()
+            if my_alerts.empty: st.caption("구독 중인 알림이 없습니다. (조건이 처음 성립할 때 메일로 알려 드립니다)")
     else:
         st.warning("로그인 후 AI 분석 기능을 이용하세요.")
         st.link_button("Google 로그인", get_google_login_url(), type="primary", use_container_width=True)
         
     st.markdown("---")
-    menu = st.radio("메뉴 선택", ["주가 지수", "투자 지표", "시장 심리", "시장 지도", "주요 일정", "🔒 VIP 포트폴리오"], index=0)
+    menu = st.radio("메뉴 선택", ["주가 지수", "투자 지표", "시장 심리", "시장 지도", "상관관계 분석", "신호등 백테스트", "주요 일정", "⭐ 관심 종목", "🔒 VIP 포트폴리오"], index=0)
     st.markdown("---")
     st.subheader("설정 (Settings)")
     if "openai_api_key" in st.secrets:
@@ -204,163 +235,55 @@ with st.sidebar:
     else:
         api_key = st.text_input("OpenAI API Key", type="password")
         
-    if st.button("🔄 서버 캐시 초기화 (관리자용)"):
-        st.cache_data.clear() 
-        keys_to_clear = ["vip_report", "dash_us", "dash_kr", "dash_cash", "dash_risk"]
-        for key in keys_to_clear:
-            if key in st.session_state:
-                del st.session_state[key]
-        st.rerun() 
-
-# -----------------------------------------------------------------------------
-# 3. 데이터 엔진
-# -----------------------------------------------------------------------------
-@st.cache_data(ttl=300)
-def get_yahoo_data(ticker, period="10y"):
-    try:
-        data = yf.Ticker(ticker).history(period=period) 
-        if len(data) < 2 and ticker == "^DJI":
-            data = yf.Ticker("DIA").history(period=period)
-        if len(data) > 1:
-            curr = data['Close'].iloc[-1]
-            prev = data['Close'].iloc[-2]
-            change = curr - prev
-            pct_change = (change / prev) * 100
-            chart_df = data[['Close']].reset_index()
-            chart_df.columns = ['Date', 'Value']
-            chart_df['Date'] = chart_df['Date'].dt.tz_localize(None)
-            return curr, change, pct_change, chart_df
-    except: pass
-    return None, None, None, None
-
-# 💡 이 줄을 추가하세요! (86400초 = 24시간 동안 안 바뀜)
-@st.cache_data(ttl=86400) 
-def get_fred_data(series_id, calculation_type='raw'):
-    # 금고에서 키를 꺼낼 수 없는 상황이면 에러 없이 안전하게 종료
-    if "FRED_API_KEY" not in st.secrets:
-        return None, None, None, None
-
-    api_key = st.secrets["FRED_API_KEY"]
-    url = f"https://api.stlouisfed.org/fred/series/observations?series_id={series_id}&api_key={api_key}&file_type=json"
-    
-    for _ in range(3):
-        try:
-            r = requests.get(url, timeout=5)
-            if r.status_code == 200:
-                data = r.json()
-                observations = data.get('observations', [])
-                if not observations: continue
-                
-                df = pd.DataFrame(observations)
-                df = df.rename(columns={'date': 'Date', 'value': 'Value'})
-                df['Date'] = pd.to_datetime(df['Date'])
-                df = df.set_index('Date').sort_index()
-                
-                # 💡 핵심 수정 파트: FRED API의 미세한 찌꺼기를 완벽히 걸러내고 순수 숫자만 추출!
-                # 1. 값이 '.' 이거나 빈칸인 것을 진짜 NaN(결측치)으로 바꿉니다.
-                df['Value'] = df['Value'].replace('.', pd.NA) 
-                df = df.dropna(subset=['Value']) # 빈칸 날리기
-                # 2. 안전하게 숫자로 변환합니다.
-                df['Value'] = pd.to_numeric(df['Value'], errors='coerce')
-                df = df.dropna(subset=['Value']) # 변환 실패한 찌꺼기 한 번 더 날리기
-                
-                if df.empty: continue # 남은 데이터가 없으면 패스
-                
-                if calculation_type == 'yoy': 
-                    df['Value'] = df['Value'].pct_change(12) * 100
-                elif calculation_type == 'diff': 
-                    df['Value'] = df['Value'].diff()
-                    
-                df = df.dropna(subset=['Value']) # 계산 후 생긴 앞쪽 빈칸 날리기
-                
-                if len(df) < 2: continue 
-                
-                curr = float(df['Value'].iloc[-1]) # 💡 확실하게 소수점 숫자로 못 박기
-                prev = float(df['Value'].iloc[-2])
-                change = curr - prev
-                
-                # 💡 0으로 고정되어 있던 부분에 정확한 퍼센트(%) 계산식을 추가했습니다!
-                pct_change = (change / prev) * 100 if prev != 0 else 0
-                
-                return curr, change, pct_change, df.reset_index()
-        except: 
-            time.sleep(0.5)
-            continue
-            
-    return None, None, None, None
-
-# 💡 이 줄을 추가하세요! (금리도 하루에 한 번만 갱신)
-@st.cache_data(ttl=86400) 
-def get_interest_rate_hybrid():
-    res = get_yahoo_data("^TNX")
-    if res[0] is not None: return res
-    return get_fred_data("DGS10", "raw")
-
-def calculate_rsi(data, window=14):
-    if data is None or len(data) < window: return None
-    delta = data['Value'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=window).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=window).mean()
-    rs = gain / loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi.iloc[-1]
+    # 💡 관리자 도구(공유 캐시 초기화 포함)는 secrets 의 admin_emails 에 있는 계정으로 로그인했을 때만 보입니다.
+    if st.session_state.logged_in and is_admin(st.session_state.get('user_email')):
+        if st.button("🔄 서버 캐시 초기화 (관리자용)"):
+            st.cache_data.clear() 
+            shared_cache = get_shared_cache() # 💡 다른 복제본과 함께 쓰는 저장소도 비워야 원천에서 다시 받아옵니다.
+            if shared_cache is not None: shared_cache.clear()
+            keys_to_clear = ["vip_report", "dash_us", "dash_kr", "dash_cash", "dash_risk"]
+            for key in keys_to_clear:
+                if key in st.session_state:
+                    del st.session_state[key]
+            st.rerun() 
+
+        # 💡 캐시가 동시에 비었을 때 같은 키 요청을 몇 번이나 1회로 묶었는지 (saved = 기다렸다가 결과를 받은 호출 수)
+        with st.expander("캐시 요청 묶음 통계 (관리자용)"):
+            stats = flight_stats()
+            if stats:
+                stats_df = pd.DataFrame(stats)
+                st.caption(f"원천 호출 {int(stats_df['upstream'].sum())}회 / 절약한 중복 호출 {int(stats_df['saved'].sum())}회")
+                st.dataframe(stats_df.drop(columns=['last']), hide_index=True, use_container_width=True)
+            else:
+                st.caption("아직 기록이 없습니다.")
+
+        # 💡 요금제별 AI 호출 / 메뉴 조회 / 외부 원천 지연 시간 (백그라운드에서 쌓인 사용 기록만 읽음)
+        with st.expander("사용 기록 (관리자용)"):
+            usage = usage_report()
+            w = usage['writer']
+            st.caption(f"기록 {w['logged']}건 / 저장 {w['written']}건 / 대기 {w['queued']}건 / 버림 {w['dropped']}건 / 세그먼트 {w['segments']}개")
+            for title, key in [("일간 AI 호출 (요금제별)", "ai_calls"), ("일간 메뉴 조회", "page_views"), ("외부 원천 지연 (최근 24시간)", "upstream")]:
+                if not usage[key].empty:
+                    st.markdown(f"**{title}**")
+                    st.dataframe(usage[key], use_container_width=True)
+            http_stats = usage['http']
+            if not http_stats.empty:
+                st.markdown("**외부 HTTP 호출 (이 프로세스)**")
+                st.dataframe(http_stats, use_container_width=True)
+
+        # 💡 페이지별 HTML/CSS 전송량 (이 세션의 직전 실행 기준, 차트 데이터 제외)
+        with st.expander("화면 전송량 (관리자용)"):
+            payload = payload_stats()
+            if payload: st.dataframe(pd.DataFrame(payload), hide_index=True, use_container_width=True)
+            else: st.caption("아직 기록이 없습니다.")
 
 # -----------------------------------------------------------------------------
 # 4. 시각화 컴포넌트
 # -----------------------------------------------------------------------------
 
-# 🚦 1. 신호등 로직 추가
-def get_traffic_light_status(topic, val1, val2=None):
-    try:
-        if topic == "금융 시장": 
-            if val1 >= 4.5 or val2 >= 1400: return "위험"
-            elif val1 >= 4.0 or val2 >= 1350: return "경계"
-            else: return "안정"
-        elif topic == "물가 지표": 
-            if val1 >= 4.0 or val2 >= 4.0: return "위험"
-            elif val1 >= 3.0 or val2 >= 3.0: return "경계"
-            else: return "안정"
-        elif topic == "고용 지표": 
-            if val2 >= 5.0: return "위험"
-            elif val2 >= 4.0: return "경계"
-            else: return "안정"
-        elif topic == "VIX": 
-            if val1 >= 30: return "위험"
-            elif val1 >= 20: return "경계"
-            else: return "안정"
-        elif topic == "RSI": 
-            if val1 >= 70 or val1 <= 30: return "위험"
-            elif val1 >= 60 or val1 <= 40: return "경계"
-            else: return "안정"
-        elif topic == "종합": 
-            if val1 >= 30 or val2 >= 70 or val2 <= 30: return "위험"
-            elif val1 >= 20 or val2 >= 60 or val2 <= 40: return "경계"
-            else: return "안정"
-    except: pass
-    return "안정"
-
 # 🚦 2. 3구 발광 신호등 UI 추가
 def draw_traffic_light_card(title, status):
-    c_red, c_yel, c_grn = "#ef4444", "#f59e0b", "#22c55e"
-    op_r, glow_r = ("1", f"0 0 10px {c_red}") if status == "위험" else ("0.2", "none")
-    op_y, glow_y = ("1", f"0 0 10px {c_yel}") if status == "경계" else ("0.2", "none")
-    op_g, glow_g = ("1", f"0 0 10px {c_grn}") if status == "안정" else ("0.2", "none")
-    
-    if status == "위험": bg_c, border_c, txt_c = "#fef2f2", "#fca5a5", "#dc2626"
-    elif status == "경계": bg_c, border_c, txt_c = "#fffbeb", "#fcd34d", "#d97706"
-    else: bg_c, border_c, txt_c = "#f0fdf4", "#86efac", "#16a34a"
-    
-    st.markdown(f"""
-    <div style='background-color:{bg_c}; border:1px solid {border_c}; border-radius:12px; padding:12px; margin-bottom:15px; display:flex; flex-direction:column; align-items:center; box-shadow: 0 2px 4px rgba(0,0,0,0.05);'>
-        <div style='font-size:13px; color:#4b5563; margin-bottom:10px; font-weight:700;'>{title}</div>
-        <div style='display:flex; gap:8px; margin-bottom:8px; background-color:#374151; padding:6px 14px; border-radius:30px; border:2px solid #1f2937;'>
-            <div style='width:18px; height:18px; border-radius:50%; background-color:{c_red}; opacity:{op_r}; box-shadow:{glow_r};'></div>
-            <div style='width:18px; height:18px; border-radius:50%; background-color:{c_yel}; opacity:{op_y}; box-shadow:{glow_y};'></div>
-            <div style='width:18px; height:18px; border-radius:50%; background-color:{c_grn}; opacity:{op_g}; box-shadow:{glow_g};'></div>
-        </div>
-        <div style='font-size:14px; font-weight:800; color:{txt_c};'>{status}</div>
-    </div>
-    """, unsafe_allow_html=True)
+    traffic_light(title, status)
 
 indicator_meta = {
     "다우존스": {"source": "Yahoo Finance", "unit": "포인트"},
@@ -398,8 +321,10 @@ def create_chart(data, color, period="1년", height=180):
     # 원본 데이터를 보호하기 위해 복사본을 만듭니다.
     chart_data = data.copy()
     
-    # 💡 노이즈 제거: 데이터가 많으면 주간/월간 단위로 압축하여 선을 깔끔하게 만듭니다.
-    if len(chart_data) > 200:
+    # 💡 노이즈 제거: 데이터가 많으면 주간/월간 단위로 압축하여 선을 깔끔하게 만듭니다. (당일 분봉은 압축 안 함)
+    if period == "당일":
+        pass
+    elif len(chart_data) > 200:
         # 데이터가 200개 이상(약 1년치 이상)이면 월간(M) 마지막 영업일 기준으로 압축
         chart_data = chart_data.set_index('Date').resample('M').last().dropna().reset_index()
     elif len(chart_data) > 60:
@@ -407,7 +332,9 @@ def create_chart(data, color, period="1년", height=180):
         chart_data = chart_data.set_index('Date').resample('W').last().dropna().reset_index()
 
     # (선생님이 기존에 설정하신 x축 포맷 그대로 유지)
-    if period in ["1개월", "3개월", "6개월"]:
+    if period == "당일":
+        x_format = '%H:%M'; tick_cnt = 5
+    elif period in ["1개월", "3개월", "6개월"]:
         x_format = '%m/%d'; tick_cnt = 5
     else:
         x_format = '%y.%m'; tick_cnt = 6
@@ -422,76 +349,54 @@ def create_chart(data, color, period="1년", height=180):
         y=alt.Y('Value:Q', scale=alt.Scale(zero=False), axis=alt.Axis(title=None)),
         # (선생님이 기존에 설정하신 한글 툴팁 그대로 유지)
         tooltip=[
-            alt.Tooltip('Date:T', title='날짜', format='%Y-%m-%d'), 
+            alt.Tooltip('Date:T', title='날짜', format='%Y-%m-%d %H:%M' if period == "당일" else '%Y-%m-%d'), 
             alt.Tooltip('Value:Q', title='값', format=',.2f')
         ]
     ).properties(height=height).interactive()
     
     return st.altair_chart(chart, use_container_width=True)
 
-def styled_metric(label, value, change, pct_change, unit="", up_color="#ef4444", down_color="#3b82f6"):
+def styled_metric(label, value, change, pct_change, unit="", up_color="#ef4444", down_color="#3b82f6", stats=None):
     if value is None: 
         st.metric(label, "-")
         return
-    if change > 0: color, bg_color, arrow, sign = up_color, f"{up_color}15", "▲", "+"
-    elif change < 0: color, bg_color, arrow, sign = down_color, f"{down_color}15", "▼", ""
-    else: color, bg_color, arrow, sign = "#6b7280", "#f3f4f6", "-", ""
-    
-    st.markdown(f"""
-    <div style="display: flex; flex-direction: column;">
-        <div style="font-size: 13px; font-weight: 600; color: #6b7280; margin-bottom: 4px;">{label}</div>
-        <div style="font-size: 26px; font-weight: 800; color: #111827; white-space: nowrap;">
-            {value:,.2f}<span style="font-size: 16px; color: #9ca3af; margin-left: 2px;">{unit}</span>
-        </div>
-        <div style="margin-top: 6px;">
-            <span style="font-size: 12px; font-weight: 700; color: {color}; background-color: {bg_color}; padding: 3px 6px; border-radius: 4px; display: inline-block;">
-                {arrow} {sign}{change:,.2f} ({sign}{pct_change:.2f}%)
-            </span>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    metric_card(label, value, change, pct_change, unit, up_color, down_color, stats)
 
-def draw_chart_unit(label, val, chg, pct, data, color, periods, default_idx, key, up_c, down_c, unit="", use_columns=True):
+def draw_chart_unit(label, val, chg, pct, data, color, periods, default_idx, key, up_c, down_c, unit="", use_columns=True, live_data=None):
     with st.container(border=True):
-        # 💡 마법의 CSS: 버튼 줄바꿈 방지 + 버튼 우측 정렬(flex-end) + 맨 끝에서 살짝 띄우기(padding-right)
-        st.markdown("""
-        <style>
-        div[data-testid="stVerticalBlockBorderWrapper"] { padding: 20px 25px !important; }
-        div[role="radiogroup"] { 
-            flex-wrap: wrap !important; /* 💡 nowrap을 wrap으로 변경하여 좁을 때 줄바꿈 허용! */
-            gap: 5px 8px !important; /* 💡 줄이 바뀌었을 때 위아래 간격(5px)을 추가로 줌 */
-            justify-content: flex-end !important; /* 버튼 우측 밀기 */
-            padding-right: 8px !important; /* 너무 끝에 붙지 않게 살짝 띄움 */
-        }
-        div[role="radiogroup"] label { white-space: nowrap !important; margin-right: 5px !important; }
-        div[role="radiogroup"] p { font-size: 13px !important; }
-        </style>
-        """, unsafe_allow_html=True)
+        # 💡 마법의 CSS(버튼 줄바꿈 허용 + 우측 정렬)는 차트가 몇 개든 실행당 1번만 보냅니다.
+        use_css("chart_unit")
+        # 💡 변동성/낙폭/52주 위치/z-score 배지는 위험 통계 서비스(증분 커널)에서 꺼내기만 합니다.
+        risk = get_risk_stats(label) if val is not None else None
 
         if use_columns:
             c1, c2 = st.columns([1.5, 1.5])
-            with c1: styled_metric(label, val, chg, pct, unit, up_c, down_c)
+            with c1: styled_metric(label, val, chg, pct, unit, up_c, down_c, risk)
             with c2: 
-                st.markdown('<div style="height: 10px;"></div>', unsafe_allow_html=True)
+                spacer()
                 selected_period = st.radio("기간", periods, index=default_idx, key=key, horizontal=True, label_visibility="collapsed")
         else:
             # 💡 미국 3대 지수도 위아래로 쌓지 않고 무조건 가로(좌-우) 1줄 배치로 양식 통일! (비율만 1.2 : 1.8로 맞춰줌)
             c1, c2 = st.columns([1.2, 1.8])
-            with c1: styled_metric(label, val, chg, pct, unit, up_c, down_c)
+            with c1: styled_metric(label, val, chg, pct, unit, up_c, down_c, risk)
             with c2: 
-                st.markdown('<div style="height: 10px;"></div>', unsafe_allow_html=True)
+                spacer()
                 selected_period = st.radio("기간", periods, index=default_idx, key=key, horizontal=True, label_visibility="collapsed")
         
         meta = indicator_meta.get(label) 
         if meta:
             today_str = datetime.now().strftime("%Y-%m-%d")
             # 💡 메타데이터가 기간 버튼 밑, 차트 위로 겹침 없이 한 줄로 쫙 펴집니다!
-            st.markdown(f"<div style='text-align: right; font-size: 11px; color: #9ca3af; margin-top: 15px; margin-bottom: 10px; white-space: nowrap;'>출처: {meta['source']} &nbsp;|&nbsp; 기준일: {today_str} &nbsp;|&nbsp; 단위: {meta['unit']}</div>", unsafe_allow_html=True)
+            chart_meta(meta['source'], today_str, meta['unit'])
         else:
-            st.markdown('<div style="margin-top: 15px;"></div>', unsafe_allow_html=True)
+            spacer("ml-gap-15")
             
-        filtered_data = filter_data_by_period(data, selected_period)
+        # 💡 실시간 모드의 '당일' 버튼은 시세판에 쌓인 분봉을 그대로 그립니다.
+        filtered_data = live_data if selected_period == "당일" else filter_data_by_period(data, selected_period)
         create_chart(filtered_data, color, period=selected_period, height=120)
+        # 💡 수집 단계에서 걸린 품질 문제(끊김/급변/대체 데이터 등)가 있으면 차트 밑에 한 줄로 알려 줍니다.
+        notice = quality_notice(data.attrs.get('quality')) if data is not None else ""
+        if notice: st.caption(f"⚠️ 데이터 점검: {notice}")
 
 def draw_gauge_chart(title, value, min_val, max_val, thresholds, inverse=False):
     steps = []
@@ -510,7 +415,7 @@ def draw_gauge_chart(title, value, min_val, max_val, thresholds, inverse=False):
     meta = indicator_meta.get(title)
     if meta:
         today_str = datetime.now().strftime("%Y-%m-%d")
-        st.markdown(f"<div style='position: relative; width: 100%; height: 0px; z-index: 99; pointer-events: none;'><div style='position: absolute; top: -5px; right: 0px; text-align: right; font-size: 11px; color: #9ca3af; white-space: nowrap;'>출처: {meta['source']} &nbsp;|&nbsp; 기준일: {today_str} &nbsp;|&nbsp; 단위: {meta['unit']}</div></div>", unsafe_allow_html=True)
+        gauge_meta(meta['source'], today_str, meta['unit'])
         
     fig = go.Figure(go.Indicator(
         mode = "gauge+number", value = value,
@@ -523,8 +428,13 @@ def draw_gauge_chart(title, value, min_val, max_val, thresholds, inverse=False):
 # -----------------------------------------------------------------------------
 # 5. AI 분석 엔진
 # -----------------------------------------------------------------------------
+def track(kind, name=None, value=None, **meta):
+    # 💡 사용 기록은 메모리 큐에 넣기만 하고 바로 돌아옵니다. (쓰기는 백그라운드, data_engine 3-17)
+    log_event(kind, st.session_state.get('user_email'), st.session_state.get('plan', 'Free') if st.session_state.get('logged_in') else "guest", name, value, **meta)
+
 def deduct_user_call():
     """DB(구글 시트)에서 사용자의 횟수를 1회 차감하는 함수"""
+    track("quota_deduct", value=1)
     conn = st.connection("gsheets", type=GSheetsConnection)
     df = conn.read(worksheet="Users", ttl=0)
     user_email = st.session_state.user_email
@@ -534,43 +444,85 @@ def deduct_user_call():
         if current_calls > 0:
             df.at[user_idx, 'Remaining_Calls'] = current_calls - 1
             conn.update(worksheet="Users", data=df)
-            
-def analyze_market_ai(topic, data_summary):
-    if not api_key: return "API Key 필요", "설정 탭에서 API Key를 입력해주세요."
-    client = openai.OpenAI(api_key=api_key)
-    
-    prompt = f"""당신은 전설적인 투자자 '버나드 바루크'의 철학(세계경제지표의 비밀)을 계승한 탑클래스 펀드매니저입니다.
-주제: {topic}
-데이터: {data_summary}
-
-[중요 지침]
-1. 이모지(아이콘)와 볼드체(**)를 절대 사용하지 마세요. 오직 텍스트만 사용하세요.
-2. 각 항목은 정확히 2문장으로만 아주 간결하고 냉철하게 작성하세요.
-3. 아래의 대괄호 '[목차명]'을 반드시 그대로 출력하세요.
-4. 모든 문장은 VIP 고객에게 브리핑하듯 정중한 존댓말(~입니다, ~습니다)로 작성하세요.
 
-[핵심 요약]
-현재 데이터를 바탕으로 시장의 전체적인 국면과 포지션 방향을 2문장으로 요약하세요.
-
-[시장의 이면]
-이 지표가 숨기고 있는 대중의 심리와 경제의 진짜 상황을 바루크의 관점에서 2문장으로 꿰뚫어보세요.
-
-[자금의 이동 경로]
-현재 지표의 결과로 인해 스마트머니(거대 자본)가 주식, 금리, 환율 중 어디로 어떻게 이동하고 있는지 2문장으로 추적하세요.
-
-[리스크와 기회]
-현재 국면에서 가장 취약한 섹터(리스크)와 자금이 몰릴 유망 자산(기회)을 2문장으로 명확히 구분하여 제시하세요.
+def save_user_watchlist(symbols):
+    """DB(구글 시트)의 Watchlist 칸에 관심 종목을 저장하는 함수 (쉼표로 구분)"""
+    conn = st.connection("gsheets", type=GSheetsConnection)
+    df = conn.read(worksheet="Users", ttl=0)
+    user_email = st.session_state.user_email
+    if user_email in df['Email'].values:
+        if 'Watchlist' not in df.columns: df['Watchlist'] = ""
+        df['Watchlist'] = df['Watchlist'].astype(object)
+        user_idx = df.index[df['Email'] == user_email].tolist()[0]
+        df.at[user_idx, 'Watchlist'] = ",".join(symbols)
+        conn.update(worksheet="Users", data=df)
+    st.session_state.watchlist = symbols
+            
+# 💡 AI 분석은 작업 큐(ai_jobs.py)에 넣고 바로 돌아옵니다. 화면은 아래 조각(fragment)이 몇 초마다 상태만 확인합니다.
+AI_POLL_SEC = 2
 
-[행동 지침]
-향후 1~3개월 시나리오에 대비해 투자자가 지금 당장 실행해야 할 구체적인 행동을 2문장으로 지시하세요.
-"""
+def submit_ai_job(slot, fn, *args):
+    # Pro 는 우선순위 0, Free 는 1 -> 대기열이 밀려도 Pro 요청이 먼저 처리됩니다.
+    priority = PRIORITY_PRO if st.session_state.get('plan', 'Free') == 'Pro' else PRIORITY_FREE
     try:
-        resp = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": prompt}])
-        return "AI 펀드매니저 리포트", resp.choices[0].message.content
-    except Exception as e: return "오류 발생", str(e)
+        st.session_state[f"{slot}_job"] = get_ai_queue().submit(fn, *args, priority=priority)
+    except AIQueueFull:
+        st.warning("지금 AI 분석 요청이 많습니다. 잠시 후 다시 시도해주세요.")
+
+def poll_ai_job(slot, on_done, wait_text="AI 펀드매니저가 데이터를 분석 중입니다."):
+    # 진행 중인 작업이 있을 때만 주기적으로 도는 조각을 띄웁니다. (없으면 아무것도 안 함)
+    if f"{slot}_job" not in st.session_state: return
+
+    @st.fragment(run_every=AI_POLL_SEC)
+    def job_status():
+        job_id = st.session_state.get(f"{slot}_job")
+        if job_id is None: return
+        job = get_ai_queue().status(job_id)
+        state = job['state'] if job else "failed"
+        if state in ("queued", "running"):
+            ahead = job.get('position', 0)
+            st.info(f"{wait_text} (앞에 {ahead}건 대기 중)" if state == "queued" and ahead else wait_text)
+            if st.button("분석 취소", key=f"{slot}_cancel", use_container_width=True):
+                get_ai_queue().cancel(job_id)
+                del st.session_state[f"{slot}_job"]
+                st.rerun()
+            return
+        del st.session_state[f"{slot}_job"]
+        track("ai_call", slot, (job['finished'] or time.time()) - job['submitted'] if job else None, state=state)
+        if state == "done":
+            on_done(job['result'])
+            st.rerun()
+        elif state == "timeout": st.error("AI 응답 시간이 초과되었습니다. 잠시 후 다시 시도해주세요. (횟수는 차감되지 않았습니다)")
+        elif state == "failed": st.error(f"오류 발생: {job['error'] if job else '작업을 찾을 수 없습니다.'}")
+    job_status()
+
+def request_ai_analysis(slot, topic, data_summary):
+    # 💡 오늘(6:40 꼬리표) 미리 만들어 둔 분석이 있으면 바로 꺼내 보여줍니다. (횟수는 똑같이 차감)
+    ready = get_pregenerated_analysis(get_freeze_key(), topic)
+    if ready:
+        track("ai_call", slot, 0, state="done", source="pregen")
+        store_ai_result(slot)(ready)
+    else: submit_ai_job(slot, run_market_analysis, api_key, topic, data_summary)
+
+def available_calls():
+    # 💡 진행 중인 섹션 분석(ai_res_*_job)은 완료될 때 차감되므로, 그 수만큼 미리 예약된 것으로 봅니다.
+    # (남은 1회로 네 섹션을 동시에 눌러 횟수가 음수가 되는 것 방지. 실패/시간 초과/취소되면 예약도 함께 풀림)
+    pending = sum(1 for k in st.session_state if k.startswith("ai_res_") and k.endswith("_job"))
+    return st.session_state.remaining_calls - pending
+
+def store_ai_result(slot):
+    # 완료된 섹션 분석 결과 저장 + 이용 횟수 차감 (성공한 분석만 차감)
+    def done(result):
+        t_text, content = result
+        for emoji in ['💡', '🔍', '🎯', '🚀', '📌', '👔', '✅']:
+            content = content.replace(emoji, '')
+        st.session_state.remaining_calls -= 1
+        deduct_user_call()
+        st.session_state[slot] = (t_text, content)
+    return done
         
 def draw_section_with_ai(title, chart1, chart2, key_suffix, ai_topic, ai_data):
-    st.markdown(f"<div class='section-header'>{title}</div>", unsafe_allow_html=True)
+    section_header(title)
     col_main, col_ai = st.columns([3, 1])
     with col_main:
         c1, c2 = st.columns(2)
@@ -587,19 +539,14 @@ def draw_section_with_ai(title, chart1, chart2, key_suffix, ai_topic, ai_data):
             # 아이콘 제거 정책에 따라 체크 아이콘 삭제
             btn_text = "분석 완료" if is_analyzed else f"{ai_topic} 분석"
             
-            if st.button(btn_text, key=f"btn_{key_suffix}", type="primary", disabled=is_analyzed, use_container_width=True):
-                if st.session_state.remaining_calls > 0:
-                    with st.spinner("AI 펀드매니저가 데이터를 분석 중입니다."):
-                        t_text, content = analyze_market_ai(ai_topic, ai_data)
-                        
-                        for emoji in ['💡', '🔍', '🎯', '🚀', '📌', '👔', '✅']:
-                            content = content.replace(emoji, '')
-                            
-                        st.session_state.remaining_calls -= 1
-                        deduct_user_call()
-                        st.session_state[f"ai_res_{key_suffix}"] = (t_text, content)
-                    st.rerun() 
+            is_running = f"ai_res_{key_suffix}_job" in st.session_state
+            if st.button(btn_text, key=f"btn_{key_suffix}", type="primary", disabled=is_analyzed or is_running, use_container_width=True):
+                if not api_key: st.error("설정 탭에서 API Key를 입력해주세요.")
+                elif available_calls() > 0:
+                    request_ai_analysis(f"ai_res_{key_suffix}", ai_topic, ai_data)
+                    st.rerun()
                 else: st.error("⚠️ 현재 유료 멤버십 결제 시스템을 준비 중입니다.")
+            poll_ai_job(f"ai_res_{key_suffix}", store_ai_result(f"ai_res_{key_suffix}"))
         else:
             st.link_button("AI 투자 전략 보기", get_google_login_url(), type="primary", use_container_width=True)
             
@@ -619,71 +566,113 @@ def draw_section_with_ai(title, chart1, chart2, key_suffix, ai_topic, ai_data):
             part1, part2, part3, part4 = "", "", "", ""
         
         # 1. 하단 가로형 풀사이즈 핵심 요약 (파란색)
-        st.markdown(f"""
-        <div style='background-color:#eff6ff; padding:20px 25px; border-radius:12px; border-left:5px solid #3b82f6; margin-top:10px; box-shadow: 0 2px 4px rgba(0,0,0,0.05);'>
-            <div style='font-size:17px; color:#1d4ed8; font-weight:800; margin-bottom:10px;'>펀드매니저 핵심 요약</div>
-            <div style='font-size:16px; font-weight:700; color:#1e3a8a; line-height:1.6; word-break:keep-all;'>{summary}</div>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # 2. 아이콘 없는 모던하고 정갈한 2x2 카드 그리드
-        st.markdown("<div style='margin-top:20px;'></div>", unsafe_allow_html=True)
+        ai_summary(summary)
         
-       # 2. 아이콘 없는 모던하고 정갈한 2x2 카드 그리드
-        st.markdown("<div style='margin-top:20px;'></div>", unsafe_allow_html=True)
+        # 2. 아이콘 없는 모던하고 정갈한 2x2 카드 그리드 (카드 모양은 components.py 의 ai_cards CSS, 180px 고정 + 길면 스크롤)
+        spacer("ml-gap-40")
         
         if part1:
-            # 💡 공통 카드 스타일 설정 (기존 높이와 비슷한 180px로 고정 + 길면 스크롤)
-            card_style = "background-color:#ffffff; border:1px solid #e5e7eb; border-radius:12px; padding:22px; height:180px; overflow-y:auto; box-shadow: 0 1px 3px rgba(0,0,0,0.05);"
-            title_style = "font-size:17px; font-weight:800; color:#111827; margin-bottom:12px; padding-bottom:10px; border-bottom:1px solid #f3f4f6;"
-            text_style = "font-size:15px; line-height:1.7; color:#4b5563; word-break:keep-all;"
-            
             row1_col1, row1_col2 = st.columns(2)
-            with row1_col1:
-                st.markdown(f"<div style='{card_style}'><div style='{title_style}'>시장의 이면</div><div style='{text_style}'>{part1}</div></div>", unsafe_allow_html=True)
-            with row1_col2:
-                st.markdown(f"<div style='{card_style}'><div style='{title_style}'>자금의 이동 경로</div><div style='{text_style}'>{part2}</div></div>", unsafe_allow_html=True)
+            with row1_col1: ai_card("시장의 이면", part1)
+            with row1_col2: ai_card("자금의 이동 경로", part2)
                 
-            st.markdown("<div style='margin-top:15px;'></div>", unsafe_allow_html=True)
+            spacer("ml-gap-15")
             
             row2_col1, row2_col2 = st.columns(2)
-            with row2_col1:
-                st.markdown(f"<div style='{card_style}'><div style='{title_style}'>리스크와 기회</div><div style='{text_style}'>{part3}</div></div>", unsafe_allow_html=True)
-            with row2_col2:
-                # 💡 행동 지침 박스도 동일하게 180px 고정 + 스크롤 추가
-                st.markdown(f"<div style='background-color:#f8fafc; border:1px solid #cbd5e1; border-radius:12px; padding:22px; height:180px; overflow-y:auto; box-shadow: 0 1px 3px rgba(0,0,0,0.05);'><div style='font-size:17px; font-weight:800; color:#0f172a; margin-bottom:12px; padding-bottom:10px; border-bottom:1px solid #e2e8f0;'>행동 지침</div><div style='font-size:15px; line-height:1.7; color:#334155; word-break:keep-all; font-weight:600;'>{part4}</div></div>", unsafe_allow_html=True)
+            with row2_col1: ai_card("리스크와 기회", part3)
+            with row2_col2: ai_card("행동 지침", part4, action=True)
 
-    st.markdown("<hr>", unsafe_allow_html=True)
+    html("<hr>")
     
 # -----------------------------------------------------------------------------
 # 6. 메인 페이지 로직 (데이터 즉시 노출)
 # -----------------------------------------------------------------------------
+if st.session_state.get("_viewed_menu") != menu:
+    track("page_view", menu)
+    st.session_state._viewed_menu = menu
+
 if menu == "주가 지수":
     st.title("글로벌 시장 지수")
     
     from datetime import datetime
+    m1, m2 = st.columns(2)
+    with m1: live_mode = st.toggle("실시간 모드 (장중 시세 자동 갱신)", key="live_mode", help=f"{LIVE_POLL_SEC}초마다 최신가만 받아와 카드와 차트 끝을 갱신합니다. (10년치 히스토리는 다시 받지 않습니다)")
+    with m2: compare_mode = st.toggle("지수 비교 모드 (시작일 = 100)", key="compare_mode", help="선택한 지수를 기간 시작일 값 100 으로 맞춰 한 차트에 겹쳐 그립니다.")
     current_time = datetime.now().strftime("%Y년 %m월 %d일 %H:%M 기준")
     st.caption(f"⏱️ 실시간 데이터 업데이트: **{current_time}**")
     
     with st.spinner("데이터 로딩 중..."):
-        dow_v, dow_c, dow_p, dow_d = get_yahoo_data("^DJI")
-        sp_v, sp_c, sp_p, sp_d = get_yahoo_data("^GSPC")
-        nas_v, nas_c, nas_p, nas_d = get_yahoo_data("^IXIC")
-        kospi_v, kospi_c, kospi_p, kospi_d = get_yahoo_data("^KS11")
-        kosdaq_v, kosdaq_c, kosdaq_p, kosdaq_d = get_yahoo_data("^KQ11")
+        idx_data = {
+            "^DJI": get_yahoo_data("^DJI"),
+            "^GSPC": get_yahoo_data("^GSPC"),
+            "^IXIC": get_yahoo_data("^IXIC"),
+            "^KS11": get_yahoo_data("^KS11"),
+            "^KQ11": get_yahoo_data("^KQ11"),
+        }
 
-    st.markdown("<div class='section-header'>미국 3대 지수 (US Market)</div>", unsafe_allow_html=True)
-    c1, c2, c3 = st.columns(3)
-    # 💡 4개 버튼을 ["1개월", "3개월", "1년", "3년"]으로 통일했습니다.
-    with c1: draw_chart_unit("다우존스", dow_v, dow_c, dow_p, dow_d, "#10b981", ["1개월", "3개월", "1년", "3년"], 0, "dow", "#10b981", "#ef4444", "", False)
-    with c2: draw_chart_unit("S&P 500", sp_v, sp_c, sp_p, sp_d, "#10b981", ["1개월", "3개월", "1년", "3년"], 0, "sp500", "#10b981", "#ef4444", "", False)
-    with c3: draw_chart_unit("나스닥 100", nas_v, nas_c, nas_p, nas_d, "#10b981", ["1개월", "3개월", "1년", "3년"], 0, "nasdaq", "#10b981", "#ef4444", "", False)
-    
-    st.markdown("<div class='section-header'>국내 증시 (KR Market)</div>", unsafe_allow_html=True)
-    c4, c5 = st.columns(2)
-    # 💡 4개 버튼을 ["1개월", "3개월", "1년", "3년"]으로 통일했습니다.
-    with c4: draw_chart_unit("코스피", kospi_v, kospi_c, kospi_p, kospi_d, "#ef4444", ["1개월", "3개월", "1년", "3년"], 0, "kospi", "#ef4444", "#3b82f6", "", True)
-    with c5: draw_chart_unit("코스닥", kosdaq_v, kosdaq_c, kosdaq_p, kosdaq_d, "#ef4444", ["1개월", "3개월", "1년", "3년"], 0, "kosdaq", "#ef4444", "#3b82f6", "", True)
+    live_board = None
+    if live_mode:
+        live_board = get_live_board(st.secrets.get("live_feed", "yahoo"))
+
+    # 💡 실시간 모드에서는 이 조각(fragment)만 주기적으로 다시 그려집니다. (페이지 전체 재실행 X)
+    # 차트 카드 CSS 는 조각 바깥(페이지)에 두어야 조각만 다시 그릴 때 사라지지 않습니다.
+    use_css("chart_unit", "metric")
+    @st.fragment(run_every=LIVE_POLL_SEC if live_mode else None)
+    def draw_index_cards(idx_data, live_board):
+        # 💡 조각이 다시 그려질 때마다 '아직 보는 중'이라고 알려야 폴러가 idle_timeout 으로 멈추지 않습니다.
+        if live_board: live_board.watch({t: r[0] for t, r in idx_data.items()})
+        def q(t): return apply_live_quote(live_board, t, idx_data[t])
+        def live(t): return live_board.intraday(t) if live_board else None
+        # 💡 4개 버튼을 ["1개월", "3개월", "1년", "3년"]으로 통일했습니다. (실시간 모드면 '당일' 추가)
+        prds = ["1개월", "3개월", "1년", "3년"] + (["당일"] if live_board else [])
+        dow_v, dow_c, dow_p, dow_d = q("^DJI")
+        sp_v, sp_c, sp_p, sp_d = q("^GSPC")
+        nas_v, nas_c, nas_p, nas_d = q("^IXIC")
+        kospi_v, kospi_c, kospi_p, kospi_d = q("^KS11")
+        kosdaq_v, kosdaq_c, kosdaq_p, kosdaq_d = q("^KQ11")
+
+        section_header("미국 3대 지수 (US Market)")
+        c1, c2, c3 = st.columns(3)
+        with c1: draw_chart_unit("다우존스", dow_v, dow_c, dow_p, dow_d, "#10b981", prds, 0, "dow", "#10b981", "#ef4444", "", False, live("^DJI"))
+        with c2: draw_chart_unit("S&P 500", sp_v, sp_c, sp_p, sp_d, "#10b981", prds, 0, "sp500", "#10b981", "#ef4444", "", False, live("^GSPC"))
+        with c3: draw_chart_unit("나스닥 100", nas_v, nas_c, nas_p, nas_d, "#10b981", prds, 0, "nasdaq", "#10b981", "#ef4444", "", False, live("^IXIC"))
+        
+        section_header("국내 증시 (KR Market)")
+        c4, c5 = st.columns(2)
+        with c4: draw_chart_unit("코스피", kospi_v, kospi_c, kospi_p, kospi_d, "#ef4444", prds, 0, "kospi", "#ef4444", "#3b82f6", "", True, live("^KS11"))
+        with c5: draw_chart_unit("코스닥", kosdaq_v, kosdaq_c, kosdaq_p, kosdaq_d, "#ef4444", prds, 0, "kosdaq", "#ef4444", "#3b82f6", "", True, live("^KQ11"))
+
+    if not compare_mode:
+        draw_index_cards(idx_data, live_board)
+    else:
+        # 📈 지수 비교: 히스토리는 위에서 받은 캐시를 그대로 쓰고, 선택/기간을 바꿔도 (선택, 기간)별 메모에서 꺼내기만 합니다.
+        section_header("지수 비교 (기간 시작 = 100)")
+        v1, v2 = st.columns([3, 1])
+        with v1: selection = st.multiselect("비교할 지수", list(COMPARE_SERIES), default=["S&P 500", "나스닥 100", "코스피"], key="compare_sel", label_visibility="collapsed")
+        with v2: usd = st.checkbox("코스피/코스닥 달러 환산", key="compare_usd", help="원/달러 환율로 나눠 달러 투자자 기준 수익률로 비교합니다.")
+        period = st.radio("기간", list(PERIOD_DAYS), index=3, key="compare_period", horizontal=True, label_visibility="collapsed")
+        if not selection:
+            st.info("비교할 지수를 하나 이상 골라 주세요.")
+        else:
+            comp = get_index_comparison(tuple(selection), period, usd, compare_epochs())
+            if comp.empty:
+                st.error("데이터 없음")
+            else:
+                x_format = '%m/%d' if PERIOD_DAYS[period] <= 180 else '%y.%m'
+                chart = alt.Chart(comp).mark_line(strokeWidth=2).encode(
+                    x=alt.X('Date:T', axis=alt.Axis(format=x_format, title=None, grid=False, tickCount=6)),
+                    y=alt.Y('Value:Q', scale=alt.Scale(zero=False), axis=alt.Axis(title=None)),
+                    color=alt.Color('Series:N', title=None, legend=alt.Legend(orient='top')),
+                    tooltip=[alt.Tooltip('Date:T', title='날짜', format='%Y-%m-%d'), alt.Tooltip('Series:N', title='지수'), alt.Tooltip('Value:Q', title='지수(시작=100)', format=',.1f')]
+                ).properties(height=420).interactive()
+                rule = alt.Chart(pd.DataFrame({'y': [100]})).mark_rule(strokeDash=[4, 4], color='#9ca3af').encode(y='y:Q')
+                st.altair_chart(chart + rule, use_container_width=True)
+                last = comp.groupby('Series', sort=False)['Value'].last().sort_values(ascending=False)
+                cols = st.columns(len(last))
+                for col, (name, val) in zip(cols, last.items()):
+                    with col: st.metric(name, f"{val:,.1f}", f"{val - 100:+.1f}%")
+                if usd and any(name in COMPARE_USD for name in selection):
+                    st.caption("💡 달러 환산 지수 = 원화 지수 ÷ 원/달러 환율. 환율이 오르면(원화 약세) 달러 기준 수익률은 그만큼 낮아집니다.")
 
 elif menu == "투자 지표":
     st.title("투자 지표 (Economic Indicators)")
@@ -707,38 +696,70 @@ elif menu == "투자 지표":
 
 elif menu == "시장 심리":
     st.title("시장 심리 (Market Sentiment)")
-    st.markdown('<div class="info-box"><strong>VIX와 RSI</strong>를 통해 시장의 공포와 과열 정도를 파악합니다.</div>', unsafe_allow_html=True)
+    html('<div class="info-box"><strong>VIX와 RSI</strong>를 통해 시장의 공포와 과열 정도를 파악합니다.</div>')
     with st.spinner("데이터 분석 중..."):
         vix_curr, _, _, _ = get_yahoo_data("^VIX")
-        _, _, _, sp_data = get_yahoo_data("^GSPC", "6mo")
-        _, _, _, ks_data = get_yahoo_data("^KS11", "6mo")
-        rsi_sp = calculate_rsi(sp_data); rsi_ks = calculate_rsi(ks_data)
+        rsi_sp = get_derived_value("S&P 500 RSI"); rsi_ks = get_derived_value("코스피 RSI")
     g1, g2, g3 = st.columns(3)
     with g1: draw_gauge_chart("공포 지수 (VIX)", vix_curr, 0, 50, [20, 30])
     with g2: draw_gauge_chart("RSI (S&P 500)", rsi_sp, 0, 100, [30, 70])
     with g3: draw_gauge_chart("RSI (코스피)", rsi_ks, 0, 100, [30, 70])
     
     # 🚦 3. 시장 심리 하단 신호등 3개 가로 배치
-    st.markdown("<br>", unsafe_allow_html=True) 
+    html("<br>") 
     t1, t2, t3 = st.columns(3)
     with t1: draw_traffic_light_card("VIX 신호등", get_traffic_light_status("VIX", vix_curr))
     with t2: draw_traffic_light_card("S&P 500 신호등", get_traffic_light_status("RSI", rsi_sp))
     with t3: draw_traffic_light_card("코스피 신호등", get_traffic_light_status("종합", vix_curr, rsi_sp))
+
+    # 🌡️ 섹터 심리 히트맵: 섹터 ETF 전체의 RSI / 이평선 괴리를 묶음 거래소의 장 꼬리표당 한 번에 계산해 둔 표에서 꺼내 그립니다.
+    section_header("섹터 심리 히트맵")
+    group = st.radio("섹터 묶음", list(BREADTH_GROUPS), format_func=lambda g: BREADTH_GROUPS[g][0], horizontal=True, label_visibility="collapsed", key="breadth_group")
+    with st.spinner("섹터별 RSI / 이평선 괴리 계산 중..."):
+        breadth = get_sector_breadth(group)
+    if breadth.empty:
+        st.info("섹터 데이터를 불러오지 못했습니다. 잠시 후 다시 시도해 주세요.")
+    else:
+        summary = breadth_summary(breadth)
+        last = summary.iloc[-1]
+        b1, b2, b3 = st.columns(3)
+        with b1: st.metric("50일선 위 섹터", f"{last['MA50 위 비율']:.0f}%", f"{last['MA50 위 비율'] - summary['MA50 위 비율'].iloc[0]:+.0f}%p ({len(summary)}일)")
+        with b2: st.metric("200일선 위 섹터", f"{last['MA200 위 비율']:.0f}%", f"{last['MA200 위 비율'] - summary['MA200 위 비율'].iloc[0]:+.0f}%p ({len(summary)}일)")
+        with b3: st.metric("평균 RSI", f"{last['평균 RSI']:.1f}", f"{last['평균 RSI'] - summary['평균 RSI'].iloc[0]:+.1f} ({len(summary)}일)")
+
+        latest = breadth[breadth['Date'] == breadth['Date'].max()].set_index('Sector').sort_values('RSI', ascending=False)
+        metrics = latest[['RSI', 'MA50', 'MA200']]
+        # 색은 지표마다 '중립'을 가운데로: RSI 는 50, 괴리율은 0 기준 (과열 = 빨강, 침체 = 파랑)
+        z = pd.concat([(metrics['RSI'] - 50) / 20, metrics['MA50'].clip(-10, 10) / 10, metrics['MA200'].clip(-20, 20) / 20], axis=1).to_numpy()
+        text = pd.concat([metrics['RSI'].map("{:.0f}".format), metrics['MA50'].map(lambda v: f"{v:+.1f}%" if pd.notna(v) else "-"), metrics['MA200'].map(lambda v: f"{v:+.1f}%" if pd.notna(v) else "-")], axis=1).to_numpy()
+        h1, h2 = st.columns([1, 1.6])
+        with h1:
+            fig = go.Figure(go.Heatmap(z=z, x=["RSI(14)", "50일선 괴리", "200일선 괴리"], y=metrics.index, text=text, texttemplate="%{text}",
+                                       colorscale=[[0, '#2563eb'], [0.5, '#f3f4f6'], [1, '#dc2626']], zmin=-1, zmax=1, showscale=False, hoverinfo="skip"))
+            fig.update_layout(height=60 + 34 * len(metrics), margin=dict(t=30, l=0, r=0, b=0), xaxis=dict(side="top"), yaxis=dict(autorange="reversed"), paper_bgcolor="rgba(0,0,0,0)")
+            st.plotly_chart(fig, use_container_width=True)
+        with h2:
+            trend = breadth.pivot_table(index='Sector', columns='Date', values='RSI').reindex(metrics.index)
+            fig = go.Figure(go.Heatmap(z=trend.to_numpy(), x=[d.strftime("%m/%d") for d in trend.columns], y=trend.index,
+                                       colorscale=[[0, '#2563eb'], [0.3, '#93c5fd'], [0.5, '#f3f4f6'], [0.7, '#fca5a5'], [1, '#dc2626']], zmin=10, zmax=90,
+                                       colorbar=dict(title="RSI", thickness=10), hovertemplate="%{y} %{x}<br>RSI %{z:.1f}<extra></extra>"))
+            fig.update_layout(height=60 + 34 * len(metrics), margin=dict(t=30, l=0, r=0, b=0), yaxis=dict(autorange="reversed"), paper_bgcolor="rgba(0,0,0,0)")
+            st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"💡 왼쪽은 최근 거래일 기준, 오른쪽은 최근 {len(summary)}거래일 RSI 추이입니다. RSI 70 이상은 과열, 30 이하는 침체 구간으로 봅니다.")
     
-    st.markdown("<div class='section-header'>AI 심리 분석</div>", unsafe_allow_html=True)
+    section_header("AI 심리 분석")
     if st.session_state.logged_in:
         is_analyzed_sentiment = "ai_res_sentiment" in st.session_state
         btn_text_sentiment = "✅ 분석 완료" if is_analyzed_sentiment else "현재 시장 심리 분석"
         
-        if st.button(btn_text_sentiment, type="primary", disabled=is_analyzed_sentiment, use_container_width=True):
-            if st.session_state.remaining_calls > 0:
-                with st.spinner("AI 펀드매니저가 데이터를 분석 중입니다."):
-                    t_text, content = analyze_market_ai("현재 시장 심리", f"VIX: {vix_curr}, S&P RSI: {rsi_sp}, 코스피 RSI: {rsi_ks}")
-                    st.session_state.remaining_calls -= 1
-                    deduct_user_call()
-                    st.session_state["ai_res_sentiment"] = (t_text, content) 
+        is_running_sentiment = "ai_res_sentiment_job" in st.session_state
+        if st.button(btn_text_sentiment, type="primary", disabled=is_analyzed_sentiment or is_running_sentiment, use_container_width=True):
+            if not api_key: st.error("설정 탭에서 API Key를 입력해주세요.")
+            elif available_calls() > 0:
+                request_ai_analysis("ai_res_sentiment", "현재 시장 심리", f"VIX: {vix_curr}, S&P RSI: {rsi_sp}, 코스피 RSI: {rsi_ks}")
                 st.rerun()
             else: st.error("⚠️ 현재 유료 멤버십 결제 시스템을 준비 중입니다. (오픈 예정)")
+        poll_ai_job("ai_res_sentiment", store_ai_result("ai_res_sentiment"))
         
         if is_analyzed_sentiment:
             t_text, content = st.session_state["ai_res_sentiment"]
@@ -753,7 +774,7 @@ elif menu == "시장 심리":
             while formatted_content.startswith('<br>'):
                 formatted_content = formatted_content[4:]
                 
-            st.markdown(f"<div class='ai-box'><div class='ai-title'>👔 {t_text}</div><div class='ai-text'>{formatted_content}</div></div>", unsafe_allow_html=True)
+            ai_box(t_text, formatted_content)
     else:
         # 멤버십 안내 지우고 로그인 버튼만 유지
         st.link_button("AI 투자 전략 보기", get_google_login_url(), type="primary", use_container_width=True)
@@ -782,30 +803,15 @@ elif menu == "시장 지도":
         cache_key = target_time.strftime("%Y년 %m월 %d일 %H:%M")
 
     st.caption(f"⏱️ 미국장 최종 마감 데이터 동결 기준: **{cache_key} (KST)**")
+    freeze_key = get_freeze_key() # 엔진/스냅샷과 같은 형식의 금고 꼬리표
     
-    # 💡 4. 데이터를 묶어두는 마법의 금고 함수
-    @st.cache_data(ttl=86400, show_spinner=False)
-    def get_frozen_market_map(key):
-        sectors = {'XLK': '기술', 'XLV': '헬스케어', 'XLF': '금융', 'XLY': '임의소비재', 'XLP': '필수소비재', 'XLE': '에너지', 'XLI': '산업재', 'XLU': '유틸리티', 'XLRE': '부동산', 'XLB': '소재', 'XLC': '통신'}
-        res = []
-        for t, n in sectors.items():
-            try:
-                # 안전하게 5일 치를 가져와서 가장 마지막 거래일 2개를 비교 (휴장일/주말 방어)
-                d = yf.Ticker(t).history(period="5d") 
-                if len(d) >= 2:
-                    c = (d['Close'].iloc[-1] - d['Close'].iloc[-2]) / d['Close'].iloc[-2] * 100
-                    res.append({'Sector': n, 'Change': c})
-            except:
-                pass
-        return res
-
     with st.spinner("섹터별 마감 데이터를 분석 중입니다... (최초 1회 수집 후 하루 종일 0.1초 렌더링!)"):
-        rows = get_frozen_market_map(cache_key)
+        rows = get_frozen_market_map(freeze_key)
         
     if rows:
         df_sector = pd.DataFrame(rows)
         
-        st.markdown(f'<div class="info-box" style="margin-bottom:15px; font-weight:bold; color:#1e3a8a;">막대그래프로 보는 섹터별 등락 순위</div>', unsafe_allow_html=True)
+        html('<div class="info-box ml-info-strong">막대그래프로 보는 섹터별 등락 순위</div>')
         
         df_sector['Color'] = df_sector['Change'].apply(lambda x: '#22c55e' if x > 0 else '#ef4444') 
         
@@ -821,10 +827,33 @@ elif menu == "시장 지도":
         
         st.altair_chart(bar_chart, use_container_width=True)
         
-        st.markdown("<br>", unsafe_allow_html=True)
+        html("<br>")
+        
+        html('<div class="info-box ml-info-strong">한눈에 보는 시장 지도 </div>')
         
-        st.markdown(f'<div class="info-box" style="margin-bottom:15px; font-weight:bold; color:#1e3a8a;">한눈에 보는 시장 지도 </div>', unsafe_allow_html=True)
+        with st.spinner("S&P 500 전 종목 데이터를 집계 중입니다..."):
+            nodes = get_frozen_constituent_map(freeze_key)
+        
+    if rows and not nodes.empty:
+        max_change = max(nodes.loc[nodes['parent'] != '', 'change'].abs().quantile(0.95), 0.5)
+        fig = go.Figure(go.Treemap(
+            ids=nodes['id'], labels=nodes['label'], parents=nodes['parent'], values=nodes['value'],
+            branchvalues="remainder", maxdepth=3,
+            text=nodes['text'], customdata=nodes[['name', 'cap']].to_numpy(),
+            marker=dict(colors=nodes['change'], colorscale=[[0, '#dc2626'], [0.5, '#4b5563'], [1, '#16a34a']], cmin=-max_change, cmax=max_change, line=dict(width=1, color='#ffffff')),
+            textfont=dict(color="white"),
+            texttemplate="<b>%{label}</b><br>%{text}",
+            hovertemplate="<b>%{customdata[0]}</b><br>등락률: %{text}<br>시가총액: $%{customdata[1]:,.0f}<extra></extra>",
+            tiling=dict(pad=2),
+            root_color="rgba(0,0,0,0)"
+        ))
+        fig.update_layout(margin=dict(t=0, l=0, r=0, b=0), paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", height=700)
+        st.plotly_chart(fig, use_container_width=True)
         
+        html("<div class='ml-legend'>💡 <b>블록의 크기</b>는 종목의 <b>시가총액</b>을, 색은 <b>등락률</b>을 의미합니다. 섹터/산업 블록의 색은 시가총액 가중 평균 등락률입니다. (블록을 누르면 확대)</div>")
+        
+    elif rows:
+        # 💡 전 종목 수집에 실패하면 기존 섹터 ETF 지도로 대신 보여줍니다.
         df_sector['Absolute_Change'] = df_sector['Change'].abs() 
         df_sector['Label'] = df_sector['Change'].apply(lambda x: f"+{x:.2f}%" if x > 0 else f"{x:.2f}%")
         
@@ -862,37 +891,206 @@ elif menu == "시장 지도":
         
         st.plotly_chart(fig, use_container_width=True)
         
-        st.markdown("<div style='font-size:14.5px; color:#6b7280; text-align:center; margin-top:5px; margin-bottom:20px; word-break:keep-all;'>💡 <b>블록의 크기</b>는 해당 섹터의 <b>변동성(등락폭의 절대값)</b>을 의미하며, 크기가 클수록 시장에서 자금 이동이 활발했던 섹터입니다.</div>", unsafe_allow_html=True)
+        html("<div class='ml-legend'>💡 <b>블록의 크기</b>는 해당 섹터의 <b>변동성(등락폭의 절대값)</b>을 의미하며, 크기가 클수록 시장에서 자금 이동이 활발했던 섹터입니다.</div>")
+        
+    else:
+        st.error("데이터를 수집하지 못했습니다. 잠시 후 다시 시도해 주세요.")
+
+elif menu == "상관관계 분석":
+    st.title("상관관계 분석 (Cross-Asset)")
+    html('<div class="info-box">10년치 지수·금리·환율·VIX 데이터로 <strong>자산 간 롤링 상관계수, 베타, 변동성 국면</strong>을 계산합니다. 새 거래일이 생기면 그 하루치만 더해서 갱신합니다.</div>')
+    
+    with st.spinner("수익률 데이터를 정리 중입니다..."):
+        kernel = refresh_rolling_kernel()
+    
+    windows = {"3개월 (60일)": 60, "6개월 (120일)": 120, "1년 (250일)": 250}
+    w_label = st.radio("롤링 기간", list(windows.keys()), index=0, horizontal=True)
+    w = windows[w_label]
+    
+    if kernel.stats(w) is None:
+        st.error("데이터를 수집하지 못했습니다. 잠시 후 다시 시도해 주세요.")
+    else:
+        col_heat, col_line = st.columns([2, 3])
+        with col_heat:
+            section_header(f"현재 상관관계 행렬 ({w_label})")
+            mat = kernel.corr_matrix(w).reset_index().melt(id_vars='index', var_name='B', value_name='Corr').rename(columns={'index': 'A'})
+            base = alt.Chart(mat).encode(x=alt.X('A:N', title=None, sort=kernel.columns), y=alt.Y('B:N', title=None, sort=kernel.columns))
+            heat = base.mark_rect().encode(color=alt.Color('Corr:Q', scale=alt.Scale(domain=[-1, 0, 1], range=['#3b82f6', '#f3f4f6', '#ef4444']), legend=None), tooltip=['A', 'B', alt.Tooltip('Corr:Q', format='.2f', title='상관계수')])
+            text = base.mark_text(fontSize=12, fontWeight='bold').encode(text=alt.Text('Corr:Q', format='.2f'))
+            st.altair_chart((heat + text).properties(height=380), use_container_width=True)
+        
+        with col_line:
+            section_header("롤링 상관계수 추이")
+            pair_labels = [f"{a} vs {b}" for a, b in ANALYTICS_PAIRS]
+            picked = st.multiselect("비교 쌍", pair_labels, default=pair_labels[:2], label_visibility="collapsed")
+            if picked:
+                lines = pd.concat({lbl: kernel.corr(w, *ANALYTICS_PAIRS[pair_labels.index(lbl)]) for lbl in picked}, axis=1)
+                lines = lines.resample('W').last().rename_axis('Date').reset_index().melt(id_vars='Date', var_name='쌍', value_name='Corr')
+                chart = alt.Chart(lines).mark_line(strokeWidth=2).encode(
+                    x=alt.X('Date:T', title=None, axis=alt.Axis(format='%y.%m', grid=False)),
+                    y=alt.Y('Corr:Q', title=None, scale=alt.Scale(domain=[-1, 1])),
+                    color=alt.Color('쌍:N', legend=alt.Legend(title=None, orient='top')),
+                    tooltip=['쌍', alt.Tooltip('Date:T', title='날짜', format='%Y-%m-%d'), alt.Tooltip('Corr:Q', title='상관계수', format='.2f')]
+                ).properties(height=320).interactive()
+                st.altair_chart(chart, use_container_width=True)
+        
+        section_header("S&P 500 대비 베타")
+        b_cols = st.columns(3)
+        for col, name in zip(b_cols, ["코스피", "코스닥", "원/달러 환율"]):
+            beta = kernel.beta(w, name, "S&P 500")
+            prev = beta.iloc[-21] if len(beta) > 21 else beta.iloc[0] # 약 1개월 전 대비
+            with col:
+                with st.container(border=True):
+                    styled_metric(f"{name} 베타", beta.iloc[-1], beta.iloc[-1] - prev, (beta.iloc[-1] - prev) / abs(prev) * 100 if prev else 0)
+                    beta_df = beta.rename('Value').rename_axis('Date').reset_index()
+                    create_chart(filter_data_by_period(beta_df, "3년"), "#6366f1", period="3년", height=120)
+        
+        section_header("S&P 500 변동성 국면 (20일 실현 변동성)")
+        vol = kernel.vol(20, "S&P 500")
+        regime = classify_vol_regime(vol)
+        r1, r2 = st.columns([1, 3])
+        with r1:
+            st.metric("현재 국면", regime.iloc[-1], f"연율 {vol.iloc[-1]:.1f}%", delta_color="off")
+            st.caption(" / ".join(f"{name} < {th}%" for th, name in VOL_REGIMES) + " / 그 이상 위기")
+        with r2:
+            segs = signal_segments(regime)
+            strip = alt.Chart(segs).mark_rect().encode(
+                x=alt.X('Start:T', title=None, axis=alt.Axis(format='%y.%m', grid=False)), x2='End:T',
+                color=alt.Color('State:N', scale=alt.Scale(domain=VOL_REGIME_ORDER, range=["#22c55e", "#94a3b8", "#f59e0b", "#ef4444"]), legend=alt.Legend(title=None, orient='top')),
+                tooltip=[alt.Tooltip('State', title='국면'), alt.Tooltip('Start:T', title='시작', format='%Y-%m-%d'), alt.Tooltip('End:T', title='종료', format='%Y-%m-%d')]
+            ).properties(height=80)
+            st.altair_chart(strip, use_container_width=True)
+
+elif menu == "신호등 백테스트":
+    st.title("신호등 백테스트 (Signal Backtest)")
+    html('<div class="info-box">신호등 규칙(VIX, RSI, 금리/환율, 물가, 고용)을 <strong>과거 10년치 데이터 전체</strong>에 그대로 적용해, 각 신호가 켜진 뒤 지수가 실제로 어떻게 움직였는지 보여줍니다.</div>')
+    
+    epoch = get_freeze_key()
+    with st.spinner("과거 신호를 계산 중입니다... (하루 1회 계산 후 재사용)"):
+        bt = run_signal_backtest(epoch)
+    
+    if bt:
+        c1, c2 = st.columns([2, 1])
+        with c1: rule = st.selectbox("신호등 규칙", list(bt.keys()))
+        with c2: target = st.radio("대상 지수", list(BACKTEST_TARGETS.keys()), horizontal=True)
+        res = bt[rule]
+        
+        col_main, col_light = st.columns([3, 1])
+        with col_light:
+            draw_traffic_light_card(f"현재 {rule}", res['current'] or "안정")
+        with col_main:
+            stats = res['stats'].get(target)
+            if stats is not None and not stats.empty:
+                section_header(f"신호 이후 {target} 선행 수익률")
+                st.dataframe(stats.style.format("{:.2f}", subset=[c for c in stats.columns if c != '일수']), use_container_width=True)
+            else:
+                st.error("대상 지수 데이터가 없습니다.")
         
+        segments = res['segments']
+        if not segments.empty:
+            section_header("신호 타임라인")
+            create_chart(get_yahoo_data(BACKTEST_TARGETS[target])[3], "#111827", period="전체", height=220)
+            strip = alt.Chart(segments).mark_rect().encode(
+                x=alt.X('Start:T', title=None, axis=alt.Axis(format='%y.%m', grid=False)),
+                x2='End:T',
+                color=alt.Color('State:N', scale=alt.Scale(domain=STATE_ORDER, range=["#ef4444", "#f59e0b", "#22c55e"]), legend=alt.Legend(title=None, orient='top')),
+                tooltip=['State', alt.Tooltip('Start:T', title='시작', format='%Y-%m-%d'), alt.Tooltip('End:T', title='종료', format='%Y-%m-%d')]
+            ).properties(height=60)
+            st.altair_chart(strip, use_container_width=True)
+        st.caption("💡 월간 지표(CPI, 고용, 실업률)는 실제 발표 시점(다음 달 중순)부터 반영해 미래 정보를 쓰지 않도록 했습니다. 과거 성과가 미래 수익을 보장하지 않습니다.")
     else:
         st.error("데이터를 수집하지 못했습니다. 잠시 후 다시 시도해 주세요.")
 
 elif menu == "주요 일정":
     st.title("주요 일정 (Key Schedule)")
-    fomc = [date(2026, 1, 28), date(2026, 3, 18), date(2026, 4, 29), date(2026, 6, 17), date(2026, 7, 29), date(2026, 9, 16), date(2026, 10, 28), date(2026, 12, 9)]
+    cal = get_market_calendar()
     today = date.today()
-    next_f = next((d for d in fomc if d >= today), None)
+    next_f = cal.next("FOMC", today)
     if next_f:
-        st.markdown(f'<div class="d-day-container"><div class="d-day-title">Next FOMC Meeting</div><div class="d-day-count">D-{(next_f-today).days}</div><div class="d-day-date">{next_f.strftime("%Y년 %m월 %d일")}</div></div>', unsafe_allow_html=True)
+        next_f = next_f[0][0]
+        html(f'<div class="d-day-container"><div class="d-day-title">Next FOMC Meeting</div><div class="d-day-count">D-{(next_f-today).days}</div><div class="d-day-date">{next_f.strftime("%Y년 %m월 %d일")}</div></div>')
+    else:
+        st.info("다음 FOMC 일정이 아직 등록되지 않았습니다. (data/market_calendar.json)")
+    
+    section_header("주요 경제지표 발표 (미국)")
+    e_cols = st.columns(2)
+    for col, kind in zip(e_cols, ["CPI", "NFP"]):
+        nxt = cal.next(kind, today)
+        with col:
+            with st.container(border=True):
+                if nxt: st.write(f"**{nxt[0][1]}** (D-{(nxt[0][0]-today).days})\n\n{nxt[0][0]}")
+                else: st.write(f"**{kind}**\n\n일정 미등록")
     
-    st.markdown("<div class='section-header'>네 마녀의 날 (Quadruple Witching Day)</div>", unsafe_allow_html=True)
-    witching = [date(2026, 3, 20), date(2026, 6, 19), date(2026, 9, 18), date(2026, 12, 18)]
+    section_header("네 마녀의 날 (Quadruple Witching Day)")
+    witching = cal.next("US_WITCHING", today, n=4)
     w_cols = st.columns(4)
-    for i, d in enumerate(witching):
+    for i, (d, n) in enumerate(witching):
         with w_cols[i]:
-            with st.container(border=True): st.write(f"**{d.month}월 만기일**\n\n{d}")
+            with st.container(border=True): st.write(f"**{d.year}년 {n}**\n\n{d}")
             
-    st.markdown("<div class='section-header'>주요 휴장일 (미국 증시)</div>", unsafe_allow_html=True)
-    holidays = {date(2026, 4, 3): "성금요일", date(2026, 5, 25): "메모리얼 데이", date(2026, 6, 19): "준틴스", date(2026, 7, 3): "독립기념일", date(2026, 9, 7): "노동절", date(2026, 11, 26): "추수감사절", date(2026, 12, 25): "크리스마스"}
+    section_header("주요 휴장일 (미국 증시)")
     h_cols = st.columns(3)
-    upcoming = {d: n for d, n in holidays.items() if d >= today}
-    for i, (d, n) in enumerate(list(upcoming.items())[:3]):
+    for i, (d, n) in enumerate(cal.next("NYSE_HOLIDAY", today, n=3)):
         with h_cols[i]:
             with st.container(border=True): st.write(f"**{n}**\n\n{d}")
+    
+    section_header("주요 휴장일 (국내 증시)")
+    k_cols = st.columns(3)
+    for i, (d, n) in enumerate(cal.next("KRX_HOLIDAY", today, n=3)):
+        with k_cols[i]:
+            with st.container(border=True): st.write(f"**{n}**\n\n{d}")
                 
+elif menu == "⭐ 관심 종목":
+    st.title("관심 종목 (Watchlist)")
+    html('<div class="info-box">야후 파이낸스 티커(예: <strong>AAPL</strong>, <strong>005930.KS</strong>, <strong>BTC-USD</strong>)를 추가해 나만의 차트 보드를 만드세요.</div>')
+    if not st.session_state.logged_in:
+        st.warning("관심 종목은 로그인 후 저장할 수 있습니다.")
+    else:
+        limit = WATCHLIST_LIMITS.get(st.session_state.get('plan', 'Free'), WATCHLIST_LIMITS["Free"])
+        watchlist = st.session_state.get('watchlist', [])
+        with st.form("watchlist_add", clear_on_submit=True):
+            c1, c2 = st.columns([4, 1])
+            with c1: new_symbols = st.text_input("티커 추가", placeholder="여러 개는 쉼표로 구분 (예: AAPL, MSFT)", label_visibility="collapsed")
+            with c2: add_clicked = st.form_submit_button("추가", use_container_width=True)
+        if add_clicked and new_symbols:
+            merged = normalize_symbols(watchlist + normalize_symbols(new_symbols))
+            if len(merged) > limit: st.warning(f"관심 종목은 최대 {limit}개까지 저장됩니다. (Pro: {WATCHLIST_LIMITS['Pro']}개)")
+            try:
+                save_user_watchlist(merged[:limit])
+                st.rerun()
+            except Exception:
+                st.error("관심 종목 저장에 실패했습니다. 잠시 후 다시 시도해 주세요.")
+
+        if watchlist:
+            kept = st.multiselect("관심 종목 (X 를 눌러 삭제)", watchlist, default=watchlist)
+            if kept != watchlist:
+                try:
+                    save_user_watchlist(kept)
+                    st.rerun()
+                except Exception:
+                    st.error("관심 종목 저장에 실패했습니다. 잠시 후 다시 시도해 주세요.")
+
+            # 💡 세션마다 따로 받지 않고, 서버의 관심 종목 허브가 모든 세션의 티커를 한 번에 묶어서 받습니다.
+            if "_watch_sid" not in st.session_state: st.session_state._watch_sid = uuid.uuid4().hex
+            with st.spinner("관심 종목 시세 불러오는 중..."):
+                wl_data = get_watchlist_hub().get(st.session_state._watch_sid, watchlist)
+            use_css("chart_unit", "metric")
+            prds = ["1개월", "3개월", "1년", "3년"]
+            cols = st.columns(2)
+            for i, t in enumerate(watchlist):
+                v, c, p, d = wl_data[t]
+                with cols[i % 2]:
+                    if v is None:
+                        with st.container(border=True): st.caption(f"**{t}**: 시세를 찾을 수 없습니다. (티커 표기를 확인해 주세요)")
+                    else:
+                        draw_chart_unit(t, v, c, p, d, "#10b981", prds, 0, f"wl_{t}", "#10b981", "#ef4444", "", True)
+        else:
+            st.caption(f"아직 관심 종목이 없습니다. 위 입력창에 티커를 넣어 추가하세요. (최대 {limit}개)")
+
 elif menu == "🔒 VIP 포트폴리오" or menu == "VIP 포트폴리오":
     # 💡 모든 이모지/아이콘 제거 & 프리미엄 타이틀 톤 앤 매너 적용
-    st.markdown("<h1 style='font-size:32px; font-weight:900; color:#0f172a; margin-bottom:5px; padding-bottom:15px; border-bottom:1px solid #e2e8f0;'>VIP 시크릿 매크로 리포트</h1>", unsafe_allow_html=True)
+    use_css("vip")
+    html("<h1 class='ml-vip-title'>VIP 시크릿 매크로 리포트</h1>")
     
     from datetime import datetime, timedelta, timezone
     import re
@@ -907,128 +1105,41 @@ elif menu == "🔒 VIP 포트폴리오" or menu == "VIP 포트폴리오":
     else:
         cache_key = target_time.strftime("%Y-%m-%d %H:%M")
         
-    @st.cache_data(ttl=86400, show_spinner=False)
-    def get_daily_vip_report(key, api_key_val):
-        client = openai.OpenAI(api_key=api_key_val)
-        
-        rate_val, _, _, _ = get_interest_rate_hybrid()
-        exch_val, _, _, _ = get_yahoo_data("KRW=X", "10y")
-        vix_val, _, _, _ = get_yahoo_data("^VIX")
-        _, _, _, sp_data = get_yahoo_data("^GSPC", "6mo")
-        rsi_val = calculate_rsi(sp_data)
-        
-        rate_str = f"{rate_val:.2f}%" if rate_val else "데이터 없음"
-        exch_str = f"{exch_val:,.2f}원" if exch_val else "데이터 없음"
-        vix_str = f"{vix_val:.2f}" if vix_val else "데이터 없음"
-        rsi_str = f"{rsi_val:.2f}" if rsi_val else "데이터 없음"
-        
-        live_data_str = f"미국 10년물 금리: {rate_str}, 원/달러 환율: {exch_str}, VIX: {vix_str}, S&P500 RSI: {rsi_str}"
-        
-        # 💡 프롬프트 수정: 4번 유망 섹터에 '투자 관점' 3줄 포맷 지시 추가
-        vip_prompt = f"""당신은 월스트리트 수석 펀드매니저입니다.
-현재 수집된 실시간 시장 데이터({live_data_str})를 기반으로 투자 판단을 위한 '데일리 모닝 브리핑'을 작성하세요.
-
-[제약 조건]
-- 공시, 증시 심리, 개별 특정 종목(티커) 언급 절대 금지.
-- 기호(▲, ▼, ->, ↳ 등) 및 이모지 절대 사용 금지. (단, 투자 관점 줄의 '→' 기호는 허용)
-- 문체: "~로 판단됩니다", "~가능성이 존재합니다", "~압력이 확대되고 있습니다" 등 리서치 톤 유지.
-
-[1. 데이터 추출 (첫 줄)]
-아래 형식으로 현재 시장 상태를 한 줄로 출력하세요. 파이썬 파싱을 위해 대괄호 []와 파이프 | 기호를 반드시 지키세요.
-형식: [시장상태]|[핵심요인]|[미국국면]|[한국국면]|[권장현금비중]
-예시: [경계]|[금리 상승, 환율 상승, 변동성 확대]|[경기 둔화기]|[회복 지연기]|[40% 이상 확보]
-
-[2. 본문 구성] (위 줄 바로 다음부터 아래 목차 대괄호 []를 정확히 출력하세요)
-
-[핵심 매크로 지표 요약]
-숫자보다 해석을 앞세워 아래 구조로 작성하세요. 상승/위험 관련 해석은 <span style="color:#dc2626; font-weight:bold;">, 하락/안전은 <span style="color:#16a34a; font-weight:bold;">, 중립은 <span style="color:#6b7280; font-weight:bold;"> 태그로 감싸세요.
-금리: <span style="color:#dc2626; font-weight:bold;">상승 압력 유지</span> ({rate_str})
-환율: <span style="color:#dc2626; font-weight:bold;">달러 강세 지속</span> ({exch_str})
-VIX: <span style="color:#6b7280; font-weight:bold;">변동성 확대 경계</span> ({vix_str})
-RSI: <span style="color:#16a34a; font-weight:bold;">과매도 근접</span> ({rsi_str})
-종합 판단: 현재 시장은 단기 변동성 확대 가능성이 높은 구간으로 판단됩니다.
-
-[1. 글로벌 거시경제 및 국면 분석]
-미국 국면과 한국 국면 판정 이유를 거시적 근거를 들어 3~4줄 문단으로 설명하세요.
-
-[2. 리스크 방어 및 현금 비중 전략]
-현금 비중 확대 근거를 아래와 같이 구조화하여 번호 매기기로 출력하고, 그 아래에 설명 문단을 추가하세요.
-현금 비중 확대 근거
-1. 금리 상승 지속
-2. 환율 변동성 확대
-3. 지정학 리스크 증가
-(이하 설명 문단...)
-
-[3. 지표 기반 투자 전략]
-실제 데이터 흐름과 연결된 구체적이고 짧은 실행형 전략(예: 비중 축소 권고, 비중 확대 검토 등 행동 지시형 문장)을 불릿(•) 3개로 제시하세요. 특수문자 화살표는 쓰지 마세요.
-예시:
-• 고금리 환경 지속 국면, 성장주 비중 축소 권고
-• 변동성 확대 구간 대비 현금 비중 유지 및 단기 대응 전략 병행
-
-[4. 유망 섹터 및 근거]
-특정 섹터(수출주, 방산 등)를 미리 고정해서 반복 추천하지 마세요. 반드시 당일 분석한 '매크로 조건(금리, 환율, 변동성 등)'을 우선적으로 해석한 뒤, '한국 주식시장' 기준으로 그 매크로 환경에서 상대적으로 설명력이 높거나 수혜/방어가 가능한 섹터 3가지를 매일 유동적으로 도출하세요. 
-각 항목은 아래와 같이 총 3줄로 정확히 줄바꿈하여 출력하세요.
-첫째 줄: '섹터명'을 <b>태그로 감싸서 출력
-둘째 줄: 왜 이 환경에서 이 섹터를 봐야 하는지 설명하는 관찰형 1문장
-셋째 줄: '→ 투자 관점: '으로 시작하는 행동 지시형 1문장
-예시:
-<b>고배당 및 방어주</b>
-금리 상승 압력이 지속되는 구간에서는 안정적인 현금흐름과 배당 매력이 부각될 가능성이 존재합니다.
-→ 투자 관점: 포트폴리오 내 비중 확대 고려
-<b>조선 및 피팅 업종</b>
-원화 약세 국면이 맞물려 환차익 수혜 및 실적 방어 기대감이 커질 수 있습니다.
-→ 투자 관점: 환율 상승 구간에서 방어적 대안으로 유효
-"""
-        resp = client.chat.completions.create(
-            model="gpt-4o", 
-            messages=[{"role": "user", "content": vip_prompt}],
-            temperature=0.1 
-        )
-        return resp.choices[0].message.content.strip()
-
     # 💡 본문 폭 제한 래퍼(Wrapper) 적용 시작
-    st.markdown("<div style='max-width:850px; margin:0 auto;'>", unsafe_allow_html=True)
+    html("<div class='ml-vip-wrap'>")
 
     if st.session_state.get('plan', 'Free') == 'Pro':
-        st.markdown(f"<div style='font-size:14px; font-weight:700; color:#64748b; margin-top:10px; margin-bottom:5px; text-transform:uppercase; letter-spacing:1px;'>Update: {cache_key}</div>", unsafe_allow_html=True)
-        st.markdown("<div style='font-size:15px; color:#334155; margin-bottom:25px; line-height:1.5;'>VIP 멤버십 인증이 완료되었습니다. 최신 매크로 지표를 기반으로 생성된 오늘의 데일리 브리핑을 확인하세요.</div>", unsafe_allow_html=True)
+        html(f"<div class='ml-vip-update'>Update: {cache_key}</div>")
+        html("<div class='ml-vip-intro'>VIP 멤버십 인증이 완료되었습니다. 최신 매크로 지표를 기반으로 생성된 오늘의 데일리 브리핑을 확인하세요.</div>")
         
         is_vip_analyzed = "vip_report" in st.session_state
         btn_text_vip = "오늘의 VIP 모닝 브리핑 로딩 완료" if is_vip_analyzed else "오늘의 VIP 시크릿 리포트 보기"
         
-        st.markdown("<div style='background-color:#f8fafc; border:1px solid #e2e8f0; border-radius:8px; padding:15px; margin-bottom:30px; box-shadow: inset 0 1px 2px rgba(0,0,0,0.02); display:flex; justify-content:center;'>", unsafe_allow_html=True)
-        if st.button(btn_text_vip, type="primary", disabled=is_vip_analyzed, use_container_width=True):
-            with st.spinner("데이터 분석 및 대시보드 렌더링 중..."):
-                if not api_key:
-                    st.error("설정 탭에서 API Key를 입력해주세요.")
-                else:
-                    try:
-                        raw_content = get_daily_vip_report(cache_key, api_key)
-                        
-                        lines = raw_content.split('\n')
-                        first_line = lines[0]
-                        
-                        if '|' in first_line and '[' in first_line:
-                            parsed = re.findall(r'\[(.*?)\]', first_line)
-                            if len(parsed) >= 5:
-                                st.session_state["dash_status"] = parsed[0]
-                                st.session_state["dash_factor"] = parsed[1]
-                                st.session_state["dash_us"] = parsed[2]
-                                st.session_state["dash_kr"] = parsed[3]
-                                st.session_state["dash_cash"] = parsed[4]
-                                st.session_state["vip_report"] = '\n'.join(lines[1:]).strip()
-                            else:
-                                st.session_state["vip_report"] = raw_content
-                        else:
-                            st.session_state["vip_report"] = raw_content
-                            
-                        st.session_state["auto_scroll"] = True
-                        st.rerun() 
-                    except Exception as e:
-                        st.error(f"오류 발생: {str(e)}")
-        st.markdown("</div>", unsafe_allow_html=True)
+        html("<div class='ml-vip-action-bar'>")
+        def store_vip_report(raw_content):
+            parsed, body = split_vip_report(raw_content)
+            if parsed:
+                st.session_state["dash_status"] = parsed[0]
+                st.session_state["dash_factor"] = parsed[1]
+                st.session_state["dash_us"] = parsed[2]
+                st.session_state["dash_kr"] = parsed[3]
+                st.session_state["dash_cash"] = parsed[4]
+            st.session_state["vip_report"] = body
+                
+            st.session_state["auto_scroll"] = True
+
+        is_vip_running = "vip_report_job" in st.session_state
+        if st.button(btn_text_vip, type="primary", disabled=is_vip_analyzed or is_vip_running, use_container_width=True):
+            if not api_key:
+                st.error("설정 탭에서 API Key를 입력해주세요.")
+            else:
+                # 💡 리포트는 6:40 꼬리표당 1번만 만들어지고(공유 캐시), 생성 중에는 작업 큐에서 기다립니다.
+                submit_ai_job("vip_report", vip_report_job, cache_key, api_key)
+                st.rerun()
+        poll_ai_job("vip_report", store_vip_report, "데이터 분석 및 대시보드 렌더링 중...")
+        html("</div>")
         
-        st.markdown("<div id='report_anchor'></div>", unsafe_allow_html=True)
+        html("<div id='report_anchor'></div>")
         if st.session_state.get("auto_scroll"):
             st.components.v1.html("""<script>const anchor = window.parent.document.getElementById('report_anchor'); if(anchor){anchor.scrollIntoView({behavior: 'smooth'});}</script>""", height=0)
             st.session_state["auto_scroll"] = False
@@ -1044,15 +1155,7 @@ RSI: <span style="color:#16a34a; font-weight:bold;">과매도 근접</span> ({rs
             
             # 💡 1번: 보고서 본문을 먼저 파싱하여 시장 상태 강도(초기/중간/강) 점수를 수식 계산
             report_content = st.session_state["vip_report"]
-            sections = re.split(r'\[(핵심 매크로 지표 요약|[1-4]\.\s*[^\]]+)\]', report_content)
-            c_dict = {}
-            if len(sections) >= 3:
-                for i in range(1, len(sections), 2):
-                    title = sections[i].strip()
-                    body = sections[i+1].strip()
-                    c_dict[title] = body
-            else:
-                c_dict['본문'] = report_content
+            c_dict = vip_report_sections(report_content)
                 
             intensity_score = 0
             if "금리 상승" in dash_factor or "고금리" in dash_factor: intensity_score += 1
@@ -1079,54 +1182,32 @@ RSI: <span style="color:#16a34a; font-weight:bold;">과매도 근접</span> ({rs
             dash_status_display = f"{dash_status} ({dash_intensity})"
             
             # 💡 2번: 상단 시장 요약 구조(항목: 내용) 통일 및 1번 강도 렌더링
-            st.markdown(f"""
-            <div style='background-color:#ffffff; border:1px solid #e2e8f0; border-radius:8px; padding:20px 25px; margin-bottom:35px; box-shadow: 0 1px 3px rgba(0,0,0,0.05);'>
-                <div style='font-size:16px; font-weight:800; color:#0f172a; margin-bottom:12px; border-bottom:1px solid #f1f5f9; padding-bottom:8px;'>오늘 시장 상태</div>
-                <div style='display:flex; flex-direction:column; gap:8px; margin-bottom:18px;'>
-                    <div style='display:flex; align-items:baseline;'><span style='font-size:14px; color:#64748b; font-weight:600; width:65px; flex-shrink:0;'>상태</span> <span style='font-size:15px; font-weight:800; color:{status_color};'>{dash_status_display}</span></div>
-                    <div style='display:flex; align-items:baseline;'><span style='font-size:14px; color:#64748b; font-weight:600; width:65px; flex-shrink:0;'>핵심 요인</span> <span style='font-size:14px; color:#334155; font-weight:600; line-height:1.5;'>{dash_factor}</span></div>
-                </div>
-                <div style='background-color:#f8fafc; border:1px solid #f1f5f9; border-radius:6px; padding:15px; display:flex; flex-direction:column; gap:8px;'>
-                    <div style='font-size:13px; color:#334155; font-weight:800; margin-bottom:2px; text-transform:uppercase;'>현재 시장 요약</div>
-                    <div style='font-size:14px; color:#334155;'><span style='font-weight:600; color:#64748b; width:45px; display:inline-block;'>경기:</span> 미국 {dash_us} / 한국 {dash_kr}</div>
-                    <div style='font-size:14px; color:#334155;'><span style='font-weight:600; color:#64748b; width:45px; display:inline-block;'>리스크:</span> {dash_factor}</div>
-                    <div style='font-size:14px; color:#334155;'><span style='font-weight:600; color:#64748b; width:45px; display:inline-block;'>전략:</span> <span style='font-weight:700;'>현금 {dash_cash}</span></div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            vip_status(dash_status_display, status_color, dash_factor, dash_us, dash_kr, dash_factor, dash_cash)
             
-            st.markdown("<div style='font-size:20px; font-weight:900; color:#0f172a; margin-top:10px; margin-bottom:20px; border-bottom:2px solid #334155; padding-bottom:8px; letter-spacing:-0.5px;'>데일리 매크로 심층 리포트</div>", unsafe_allow_html=True)
-            
-            def render_common_card(title, content):
-                return f"""
-                <div style='background-color:#ffffff; border:1px solid #e2e8f0; border-radius:8px; padding:18px 22px; margin-bottom:20px; box-shadow: 0 1px 3px rgba(0,0,0,0.02);'>
-                    <div style='font-size:16px; font-weight:800; color:#0f172a; margin-bottom:10px; border-bottom:1px solid #f1f5f9; padding-bottom:8px;'>{title}</div>
-                    <div style='font-size:14.5px; line-height:1.7; color:#334155; word-break:keep-all;'>{content}</div>
-                </div>
-                """
+            html("<div class='ml-vip-heading'>데일리 매크로 심층 리포트</div>")
             
             if key_0: 
                 body_0_formatted = c_dict[key_0].replace('\n', '<br>')
-                st.markdown(f"<div style='background-color:#f8fafc; border:1px solid #cbd5e1; border-radius:8px; padding:18px 22px; margin-bottom:20px;'><div style='font-size:16px; font-weight:800; color:#0f172a; margin-bottom:10px;'>{key_0}</div><div style='font-size:14.5px; line-height:1.7; color:#334155; word-break:keep-all;'>{body_0_formatted}</div></div>", unsafe_allow_html=True)
+                report_card(key_0, body_0_formatted, lead=True)
             
             key_1 = next((k for k in c_dict if '1.' in k), None)
             if key_1:
                 body_1 = c_dict[key_1].replace('\n', '<br>')
-                st.markdown(render_common_card(key_1, body_1), unsafe_allow_html=True)
+                report_card(key_1, body_1)
             
             key_2 = next((k for k in c_dict if '2.' in k), None)
             if key_2: 
                 body_2 = c_dict[key_2].replace('\n', '<br>')
-                body_2 = body_2.replace("현금 비중 확대 근거", "<div style='font-weight:800; color:#0f172a; margin-bottom:4px; font-size:14.5px;'>현금 비중 확대 근거</div>").replace("<br><br>", "<div style='height:8px;'></div>")
-                st.markdown(render_common_card(key_2, body_2), unsafe_allow_html=True)
+                body_2 = body_2.replace("현금 비중 확대 근거", "<div class='ml-vip-em'>현금 비중 확대 근거</div>").replace("<br><br>", "<div class='ml-vip-gap'></div>")
+                report_card(key_2, body_2)
             
             key_3 = next((k for k in c_dict if '3.' in k), None)
             if key_3: 
                 body_3 = c_dict[key_3].replace('\n', '<br>')
-                body_3 = body_3.replace("•", "</div><div style='margin-bottom:6px; padding-left:12px; text-indent:-12px;'><span style='color:#0f172a; font-weight:900; margin-right:4px;'>•</span><span style='color:#1e293b; font-weight:600;'>")
+                body_3 = body_3.replace("•", "</div><div class='ml-vip-bullet'><span class='ml-vip-dot'>•</span><span class='ml-vip-point'>")
                 if body_3.startswith("</div>"): body_3 = body_3[6:] + "</span></div>"
                 body_3 = body_3.replace("<br></div>", "</div>").replace("</div><br>", "</div>")
-                st.markdown(render_common_card(key_3, body_3), unsafe_allow_html=True)
+                report_card(key_3, body_3)
             
             # 💡 3번: 4번 섹션 파싱 구조 대수술 - '투자 관점' 3단 블록 처리 추가
             key_4 = next((k for k in c_dict if '4.' in k), None)
@@ -1142,82 +1223,36 @@ RSI: <span style="color:#16a34a; font-weight:bold;">과매도 근접</span> ({rs
                         if safe_body_4 != "":
                             safe_body_4 += "</div>" # 이전 블록 닫기
                         clean_sector = line.replace("<b>", "").replace("</b>", "").strip()
-                        safe_body_4 += f"<div style='margin-bottom:16px;'><div style='font-weight:800; color:#0f172a; font-size:15px; margin-bottom:4px;'>{clean_sector}</div>"
+                        safe_body_4 += f"<div class='ml-vip-sector'><div class='ml-vip-sector-title'>{clean_sector}</div>"
                     elif line.startswith("→") or "투자 관점" in line:
                         # 💡 행동 중심 문장(투자 관점) 특별 스타일 지정
-                        safe_body_4 += f"<div style='color:#0f172a; font-size:14.5px; font-weight:700; margin-top:6px;'>{line}</div>"
+                        safe_body_4 += f"<div class='ml-vip-view'>{line}</div>"
                     else:
-                        safe_body_4 += f"<div style='color:#475569; font-size:14px; line-height:1.6;'>{line}</div>"
+                        safe_body_4 += f"<div class='ml-vip-note'>{line}</div>"
                 
                 if safe_body_4 != "":
                     safe_body_4 += "</div>" # 마지막 블록 닫기
-                    st.markdown(render_common_card(key_4, safe_body_4), unsafe_allow_html=True)
+                    report_card(key_4, safe_body_4)
                 else:
-                    st.markdown(render_common_card(key_4, c_dict[key_4].replace('\n', '<br>')), unsafe_allow_html=True)
+                    report_card(key_4, c_dict[key_4].replace('\n', '<br>'))
             
             if '본문' in c_dict:
-                st.markdown(f"<div style='font-size:14.5px; line-height:1.7; color:#334155; word-break:keep-all;'>{c_dict['본문'].replace(chr(10), '<br>')}</div>", unsafe_allow_html=True)
+                html(f"<div class='ml-vip-body'>{c_dict['본문'].replace(chr(10), '<br>')}</div>")
 
     else:
-        st.markdown(f"<div style='font-size:14px; font-weight:700; color:#64748b; margin-top:10px; margin-bottom:20px; text-transform:uppercase; letter-spacing:1px;'>Update: {cache_key}</div>", unsafe_allow_html=True)
+        html(f"<div class='ml-vip-update ml-solo'>Update: {cache_key}</div>")
         
-        st.markdown("""
-        <div style='background-color:#ffffff; border:1px solid #e2e8f0; border-radius:8px; padding:20px 25px; margin-bottom:35px; box-shadow: 0 1px 3px rgba(0,0,0,0.05); filter: blur(6px); user-select: none;'>
-            <div style='font-size:16px; font-weight:800; color:#0f172a; margin-bottom:12px; border-bottom:1px solid #f1f5f9; padding-bottom:8px;'>오늘 시장 상태</div>
-            <div style='display:flex; flex-direction:column; gap:8px; margin-bottom:18px;'>
-                <div style='display:flex; align-items:baseline;'><span style='font-size:14px; color:#64748b; font-weight:600; width:65px; flex-shrink:0;'>상태</span> <span style='font-size:15px; font-weight:800; color:#dc2626;'>경계 (중간)</span></div>
-                <div style='display:flex; align-items:baseline;'><span style='font-size:14px; color:#64748b; font-weight:600; width:65px; flex-shrink:0;'>핵심 요인</span> <span style='font-size:14px; color:#334155; font-weight:600;'>금리 상승, 환율 상승, 변동성 확대</span></div>
-            </div>
-            <div style='background-color:#f8fafc; border:1px solid #f1f5f9; border-radius:6px; padding:15px; display:flex; flex-direction:column; gap:8px;'>
-                <div style='font-size:13px; color:#334155; font-weight:800; margin-bottom:2px; text-transform:uppercase;'>현재 시장 요약</div>
-                <div style='font-size:14px; color:#334155;'><span style='font-weight:600; color:#64748b; width:45px; display:inline-block;'>경기:</span> 미국 둔화 / 한국 회복 지연</div>
-                <div style='font-size:14px; color:#334155;'><span style='font-weight:600; color:#64748b; width:45px; display:inline-block;'>리스크:</span> 금리 상승, 환율 상승</div>
-                <div style='font-size:14px; color:#334155;'><span style='font-weight:600; color:#64748b; width:45px; display:inline-block;'>전략:</span> <span style='font-weight:700;'>현금 40% 이상 확보</span></div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+        vip_status("경계 (중간)", "#dc2626", "금리 상승, 환율 상승, 변동성 확대", "둔화", "회복 지연", "금리 상승, 환율 상승", "40% 이상 확보", locked=True)
 
-        st.markdown("<div style='font-size:20px; font-weight:900; color:#0f172a; margin-top:10px; margin-bottom:20px; border-bottom:2px solid #334155; padding-bottom:8px;'>데일리 매크로 심층 리포트</div>", unsafe_allow_html=True)
-        st.markdown(f"""
-        <div style='background-color:#f8fafc; border:1px solid #e2e8f0; border-radius:8px; padding:20px; filter: blur(5px); user-select: none;'>
-            <p style='color:#0f172a; font-size:16px; font-weight:800; margin-bottom:10px; border-bottom:1px solid #f1f5f9; padding-bottom:8px;'>핵심 매크로 지표 요약</p>
-            <p style='color:#334155; font-size:14.5px; line-height:1.7;'>금리: 상승 압력 유지 (4.28%)<br>환율: 달러 강세 지속 (1,491원)</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown("""
-        <div style='background-color:#ffffff; border:1px solid #cbd5e1; border-radius:8px; padding:30px; text-align:center; margin-top:-140px; position:relative; z-index:10; box-shadow: 0 4px 6px -1px rgba(0,0,0,0.1);'>
-            <h3 style='color:#0f172a; margin-top:0; font-size:18px;'>Pro 멤버십 전용 프리미엄 리포트</h3>
-            <p style='color:#475569; font-size:14px; line-height:1.6;'>실시간 거시 경제 데이터 기반의 탑다운 전략, 리스크 방어 논리, 그리고 한국 시장 맞춤형 유망 섹터를 매일 아침 확인하세요.</p>
-            <p style='color:#94a3b8; font-size:13px; margin-top:20px;'>왼쪽 사이드바에서 멤버십을 업그레이드할 수 있습니다.</p>
-        </div>
-        """, unsafe_allow_html=True)
+        html("<div class='ml-vip-heading'>데일리 매크로 심층 리포트</div>")
+        vip_locked()
         
     # 💡 본문 폭 제한 래퍼 종료
-    st.markdown("</div>", unsafe_allow_html=True)
+    html("</div>")
 
         
 # -----------------------------------------------------------------------------
 # 7. 공통 푸터 (투자 면책 조항)
 # -----------------------------------------------------------------------------
-st.markdown("""
-<div class="footer-disclaimer">
-    <strong>[면책 조항]</strong> 본 웹사이트에서 제공하는 데이터 및 AI 분석 정보는 투자 참고용이며 최종 판단과 책임은 투자자 본인에게 있습니다.
-</div>
-""", unsafe_allow_html=True)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+html('<div class="footer-disclaimer"><strong>[면책 조항]</strong> 본 웹사이트에서 제공하는 데이터 및 AI 분석 정보는 투자 참고용이며 최종 판단과 책임은 투자자 본인에게 있습니다.</div>')
+end_page(menu)
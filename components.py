@@ -0,0 +1,320 @@
+# -----------------------------------------------------------------------------
+# Market Logic 화면 컴포넌트 (공통 CSS는 실행당 1번, 카드는 미리 압축해 둔 HTML 템플릿으로)
+# -----------------------------------------------------------------------------
+# 💡 Streamlit 은 재실행마다 화면의 모든 markdown 을 웹소켓으로 다시 보냅니다.
+# 그래서 카드마다 인라인 style 을 길게 붙이거나 차트마다 <style> 을 다시 넣으면 그만큼 매번 전송량이 늘어납니다.
+# 여기서는 CSS 를 이름 붙은 묶음(sheet)으로 등록해 실행당 1번만 보내고, 카드는 class 이름만 쓰는 짧은 템플릿으로 그립니다.
+import re
+import time
+from functools import lru_cache
+import streamlit as st
+
+def compile_css(src):
+    # 주석/줄바꿈/불필요한 공백 제거 (모듈 로드 때 1번만)
+    src = re.sub(r"/\*.*?\*/", "", src, flags=re.S)
+    src = re.sub(r"\s+", " ", src)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", src).replace(";}", "}").strip()
+
+def compile_html(src):
+    # 태그 사이 공백/들여쓰기 제거 -> 템플릿 자체의 전송량을 줄입니다.
+    return re.sub(r">\s+<", "><", re.sub(r"\s+", " ", src)).strip()
+
+CSS_SHEETS = {
+    # 모든 페이지 공통 (폰트, 섹션 제목, D-Day, AI 박스, 안내 박스, 푸터, 여백)
+    "base": compile_css("""
+    @import url('https://cdn.jsdelivr.net/gh/orioncactus/pretendard/dist/web/static/pretendard.css');
+    html, body, .stApp { font-family: 'Pretendard', sans-serif !important; background-color: #f5f7f9; }
+    .section-header { font-size: 20px; font-weight: 700; color: #111827; margin-top: 30px; margin-bottom: 15px; border-left: 4px solid #111827; padding-left: 10px; }
+    div[data-testid="stVerticalBlockBorderWrapper"] { background-color: #ffffff; border: 1px solid #e5e7eb; border-radius: 12px; box-shadow: 0 1px 3px rgba(0,0,0,0.05); padding: 20px; margin-bottom: 15px; }
+    div.d-day-container { background-color: #1e293b; color: white; padding: 30px; border-radius: 16px; text-align: center; margin-bottom: 20px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
+    .d-day-title { font-size: 16px; color: #94a3b8; margin-bottom: 10px; letter-spacing: 1px; text-transform: uppercase; }
+    .d-day-count { font-size: 56px; font-weight: 800; color: #ffffff; line-height: 1.1; margin: 10px 0; }
+    .d-day-date { font-size: 18px; color: #cbd5e1; margin-top: 10px; }
+    .ai-box { background-color: #f0fdf4; border: 1px solid #bbf7d0; border-radius: 8px; padding: 20px; height: 100%; }
+    .ai-title { font-weight: 700; font-size: 16px; margin-bottom: 10px; color: #166534; border-bottom: 1px solid #bbf7d0; padding-bottom: 5px; }
+    .ai-text { font-size: 14px; line-height: 1.7; color: #14532d; word-break: keep-all; }
+    .info-box { background-color: #eff6ff; border: 1px solid #bfdbfe; border-radius: 8px; padding: 15px; color: #1e3a8a; font-size: 14px; line-height: 1.6; margin-bottom: 20px; }
+    .warning-box { background-color: #fefce8; border: 1px solid #fde047; border-radius: 8px; padding: 15px; color: #854d0e; font-size: 14px; line-height: 1.6; margin-bottom: 20px; }
+    .footer-disclaimer { text-align: center; color: #9ca3af; font-size: 13px; padding: 20px 0; margin-top: 40px; border-top: 1px solid #e5e7eb; line-height: 1.6; }
+    .ml-gap-10 { height: 10px; } .ml-gap-15 { margin-top: 15px; } .ml-gap-40 { margin-top: 40px; }
+    .info-box.ml-info-strong { margin-bottom: 15px; font-weight: bold; color: #1e3a8a; }
+    .ml-legend { font-size: 14.5px; color: #6b7280; text-align: center; margin-top: 5px; margin-bottom: 20px; word-break: keep-all; }
+    """),
+    # 사이드바 Pro 멤버십 안내
+    "sidebar": compile_css("""
+    .ml-pro-box { background-color: #fffbeb; border: 1px solid #fde68a; border-radius: 10px; padding: 15px; margin-bottom: 15px; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
+    .ml-pro-title { font-size: 15px; font-weight: 800; color: #b45309; margin-bottom: 8px; }
+    .ml-pro-text { font-size: 13px; color: #92400e; line-height: 1.5; word-break: keep-all; }
+    """),
+    # 게이지 차트 위 출처 줄 (차트 오른쪽 위에 겹쳐 그림)
+    "gauge": compile_css("""
+    .ml-gauge-meta { position: relative; width: 100%; height: 0; z-index: 99; pointer-events: none; }
+    .ml-gauge-meta div { position: absolute; top: -5px; right: 0; text-align: right; font-size: 11px; color: #9ca3af; white-space: nowrap; }
+    """),
+    # 차트 카드 (기간 버튼 줄바꿈 허용 + 우측 정렬, 출처 줄)
+    "chart_unit": compile_css("""
+    div[data-testid="stVerticalBlockBorderWrapper"] { padding: 20px 25px !important; }
+    div[role="radiogroup"] { flex-wrap: wrap !important; gap: 5px 8px !important; justify-content: flex-end !important; padding-right: 8px !important; }
+    div[role="radiogroup"] label { white-space: nowrap !important; margin-right: 5px !important; }
+    div[role="radiogroup"] p { font-size: 13px !important; }
+    .ml-chart-meta { text-align: right; font-size: 11px; color: #9ca3af; margin-top: 15px; margin-bottom: 10px; white-space: nowrap; }
+    """),
+    # 숫자 카드 (현재값 + 등락 배지)
+    "metric": compile_css("""
+    .ml-metric { display: flex; flex-direction: column; }
+    .ml-metric-label { font-size: 13px; font-weight: 600; color: #6b7280; margin-bottom: 4px; }
+    .ml-metric-value { font-size: 26px; font-weight: 800; color: #111827; white-space: nowrap; }
+    .ml-metric-unit { font-size: 16px; color: #9ca3af; margin-left: 2px; }
+    .ml-metric-delta { margin-top: 6px; }
+    .ml-badge { font-size: 12px; font-weight: 700; padding: 3px 6px; border-radius: 4px; display: inline-block; }
+    .ml-risk { margin-top: 6px; display: flex; flex-wrap: wrap; gap: 4px; }
+    .ml-risk span { font-size: 11px; font-weight: 600; color: #475569; background-color: #f1f5f9; padding: 2px 6px; border-radius: 4px; white-space: nowrap; }
+    .ml-risk span.ml-hot { color: #b45309; background-color: #fef3c7; }
+    """),
+    # 3구 신호등
+    "traffic_light": compile_css("""
+    .ml-tl { border-radius: 12px; padding: 12px; margin-bottom: 15px; display: flex; flex-direction: column; align-items: center; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
+    .ml-tl-title { font-size: 13px; color: #4b5563; margin-bottom: 10px; font-weight: 700; }
+    .ml-tl-lamps { display: flex; gap: 8px; margin-bottom: 8px; background-color: #374151; padding: 6px 14px; border-radius: 30px; border: 2px solid #1f2937; }
+    .ml-lamp { width: 18px; height: 18px; border-radius: 50%; opacity: 0.2; }
+    .ml-lamp-r { background-color: #ef4444; } .ml-lamp-y { background-color: #f59e0b; } .ml-lamp-g { background-color: #22c55e; }
+    .ml-lamp-r.ml-on { opacity: 1; box-shadow: 0 0 10px #ef4444; }
+    .ml-lamp-y.ml-on { opacity: 1; box-shadow: 0 0 10px #f59e0b; }
+    .ml-lamp-g.ml-on { opacity: 1; box-shadow: 0 0 10px #22c55e; }
+    .ml-tl-status { font-size: 14px; font-weight: 800; }
+    .ml-tl-danger { background-color: #fef2f2; border: 1px solid #fca5a5; } .ml-tl-danger .ml-tl-status { color: #dc2626; }
+    .ml-tl-caution { background-color: #fffbeb; border: 1px solid #fcd34d; } .ml-tl-caution .ml-tl-status { color: #d97706; }
+    .ml-tl-safe { background-color: #f0fdf4; border: 1px solid #86efac; } .ml-tl-safe .ml-tl-status { color: #16a34a; }
+    """),
+    # AI 분석 결과 (핵심 요약 + 2x2 카드) / VIP 리포트 카드
+    "ai_cards": compile_css("""
+    .ml-ai-summary { background-color: #eff6ff; padding: 20px 25px; border-radius: 12px; border-left: 5px solid #3b82f6; margin-top: 10px; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
+    .ml-ai-summary-title { font-size: 17px; color: #1d4ed8; font-weight: 800; margin-bottom: 10px; }
+    .ml-ai-summary-text { font-size: 16px; font-weight: 700; color: #1e3a8a; line-height: 1.6; word-break: keep-all; }
+    .ml-card { background-color: #ffffff; border: 1px solid #e5e7eb; border-radius: 12px; padding: 22px; height: 180px; overflow-y: auto; box-shadow: 0 1px 3px rgba(0,0,0,0.05); }
+    .ml-card-title { font-size: 17px; font-weight: 800; color: #111827; margin-bottom: 12px; padding-bottom: 10px; border-bottom: 1px solid #f3f4f6; }
+    .ml-card-text { font-size: 15px; line-height: 1.7; color: #4b5563; word-break: keep-all; }
+    .ml-card.ml-card-action { background-color: #f8fafc; border-color: #cbd5e1; }
+    .ml-card-action .ml-card-title { color: #0f172a; border-bottom-color: #e2e8f0; }
+    .ml-card-action .ml-card-text { color: #334155; font-weight: 600; }
+    .ml-report-card { background-color: #ffffff; border: 1px solid #e2e8f0; border-radius: 8px; padding: 18px 22px; margin-bottom: 20px; box-shadow: 0 1px 3px rgba(0,0,0,0.02); }
+    .ml-report-title { font-size: 16px; font-weight: 800; color: #0f172a; margin-bottom: 10px; border-bottom: 1px solid #f1f5f9; padding-bottom: 8px; }
+    .ml-report-text { font-size: 14.5px; line-height: 1.7; color: #334155; word-break: keep-all; }
+    .ml-report-card.ml-report-lead { background-color: #f8fafc; border-color: #cbd5e1; box-shadow: none; }
+    .ml-report-lead .ml-report-title { border-bottom: none; padding-bottom: 0; }
+    """),
+    # VIP 리포트 페이지 (제목, 시장 상태 카드, 본문 안 강조, 잠금 미리보기)
+    "vip": compile_css("""
+    .ml-vip-title { font-size: 32px; font-weight: 900; color: #0f172a; margin-bottom: 5px; padding-bottom: 15px; border-bottom: 1px solid #e2e8f0; }
+    .ml-vip-wrap { max-width: 850px; margin: 0 auto; }
+    .ml-vip-update { font-size: 14px; font-weight: 700; color: #64748b; margin-top: 10px; margin-bottom: 5px; text-transform: uppercase; letter-spacing: 1px; }
+    .ml-vip-update.ml-solo { margin-bottom: 20px; }
+    .ml-vip-intro { font-size: 15px; color: #334155; margin-bottom: 25px; line-height: 1.5; }
+    .ml-vip-action-bar { background-color: #f8fafc; border: 1px solid #e2e8f0; border-radius: 8px; padding: 15px; margin-bottom: 30px; box-shadow: inset 0 1px 2px rgba(0,0,0,0.02); display: flex; justify-content: center; }
+    .ml-vip-status { background-color: #ffffff; border: 1px solid #e2e8f0; border-radius: 8px; padding: 20px 25px; margin-bottom: 35px; box-shadow: 0 1px 3px rgba(0,0,0,0.05); }
+    .ml-vip-status-title { font-size: 16px; font-weight: 800; color: #0f172a; margin-bottom: 12px; border-bottom: 1px solid #f1f5f9; padding-bottom: 8px; }
+    .ml-vip-rows { display: flex; flex-direction: column; gap: 8px; margin-bottom: 18px; }
+    .ml-vip-row { display: flex; align-items: baseline; }
+    .ml-vip-key { font-size: 14px; color: #64748b; font-weight: 600; width: 65px; flex-shrink: 0; }
+    .ml-vip-state { font-size: 15px; font-weight: 800; }
+    .ml-vip-factor { font-size: 14px; color: #334155; font-weight: 600; line-height: 1.5; }
+    .ml-vip-summary { background-color: #f8fafc; border: 1px solid #f1f5f9; border-radius: 6px; padding: 15px; display: flex; flex-direction: column; gap: 8px; }
+    .ml-vip-summary-title { font-size: 13px; color: #334155; font-weight: 800; margin-bottom: 2px; text-transform: uppercase; }
+    .ml-vip-line { font-size: 14px; color: #334155; }
+    .ml-vip-line span { font-weight: 600; color: #64748b; width: 45px; display: inline-block; }
+    .ml-vip-line b { font-weight: 700; }
+    .ml-vip-heading { font-size: 20px; font-weight: 900; color: #0f172a; margin-top: 10px; margin-bottom: 20px; border-bottom: 2px solid #334155; padding-bottom: 8px; letter-spacing: -0.5px; }
+    .ml-vip-body { font-size: 14.5px; line-height: 1.7; color: #334155; word-break: keep-all; }
+    .ml-vip-em { font-weight: 800; color: #0f172a; margin-bottom: 4px; font-size: 14.5px; }
+    .ml-vip-gap { height: 8px; }
+    .ml-vip-bullet { margin-bottom: 6px; padding-left: 12px; text-indent: -12px; }
+    .ml-vip-dot { color: #0f172a; font-weight: 900; margin-right: 4px; }
+    .ml-vip-point { color: #1e293b; font-weight: 600; }
+    .ml-vip-sector { margin-bottom: 16px; }
+    .ml-vip-sector-title { font-weight: 800; color: #0f172a; font-size: 15px; margin-bottom: 4px; }
+    .ml-vip-view { color: #0f172a; font-size: 14.5px; font-weight: 700; margin-top: 6px; }
+    .ml-vip-note { color: #475569; font-size: 14px; line-height: 1.6; }
+    .ml-locked { filter: blur(6px); user-select: none; }
+    .ml-vip-teaser { background-color: #f8fafc; border: 1px solid #e2e8f0; border-radius: 8px; padding: 20px; filter: blur(5px); user-select: none; }
+    .ml-vip-teaser-title { color: #0f172a; font-size: 16px; font-weight: 800; margin-bottom: 10px; border-bottom: 1px solid #f1f5f9; padding-bottom: 8px; }
+    .ml-vip-teaser-text { color: #334155; font-size: 14.5px; line-height: 1.7; }
+    .ml-vip-lock { background-color: #ffffff; border: 1px solid #cbd5e1; border-radius: 8px; padding: 30px; text-align: center; margin-top: -140px; position: relative; z-index: 10; box-shadow: 0 4px 6px -1px rgba(0,0,0,0.1); }
+    .ml-vip-lock h3 { color: #0f172a; margin-top: 0; font-size: 18px; }
+    .ml-vip-lock p { color: #475569; font-size: 14px; line-height: 1.6; }
+    .ml-vip-lock p.ml-vip-lock-hint { color: #94a3b8; font-size: 13px; margin-top: 20px; }
+    """),
+}
+
+TEMPLATES = {
+    "section_header": "<div class='section-header'>{title}</div>",
+    "metric": compile_html("""
+    <div class="ml-metric">
+        <div class="ml-metric-label">{label}</div>
+        <div class="ml-metric-value">{value:,.2f}<span class="ml-metric-unit">{unit}</span></div>
+        <div class="ml-metric-delta"><span class="ml-badge" style="color:{color};background-color:{bg}">{arrow} {sign}{change:,.2f} ({sign}{pct:.2f}%)</span></div>
+        {risk}
+    </div>
+    """),
+    "traffic_light": compile_html("""
+    <div class="ml-tl ml-tl-{state}">
+        <div class="ml-tl-title">{title}</div>
+        <div class="ml-tl-lamps"><div class="ml-lamp ml-lamp-r{on_r}"></div><div class="ml-lamp ml-lamp-y{on_y}"></div><div class="ml-lamp ml-lamp-g{on_g}"></div></div>
+        <div class="ml-tl-status">{status}</div>
+    </div>
+    """),
+    "risk": "<div class='ml-risk'>{items}</div>",
+    "chart_meta": "<div class='ml-chart-meta'>출처: {source} &nbsp;|&nbsp; 기준일: {day} &nbsp;|&nbsp; 단위: {unit}</div>",
+    "ai_summary": compile_html("""
+    <div class="ml-ai-summary">
+        <div class="ml-ai-summary-title">펀드매니저 핵심 요약</div>
+        <div class="ml-ai-summary-text">{summary}</div>
+    </div>
+    """),
+    "ai_card": "<div class='ml-card{variant}'><div class='ml-card-title'>{title}</div><div class='ml-card-text'>{body}</div></div>",
+    "report_card": "<div class='ml-report-card{variant}'><div class='ml-report-title'>{title}</div><div class='ml-report-text'>{body}</div></div>",
+    "ai_box": "<div class='ai-box'><div class='ai-title'>👔 {title}</div><div class='ai-text'>{body}</div></div>",
+    "gauge_meta": "<div class='ml-gauge-meta'><div>출처: {source} &nbsp;|&nbsp; 기준일: {day} &nbsp;|&nbsp; 단위: {unit}</div></div>",
+    "pro_box": compile_html("""
+    <div class="ml-pro-box">
+        <div class="ml-pro-title">👑 Pro 멤버십 업그레이드</div>
+        <div class="ml-pro-text">무제한 AI 펀드매니저 분석과<br>VIP 시크릿 탭을 열어보세요! (월 9,900원)</div>
+    </div>
+    """),
+    "vip_status": compile_html("""
+    <div class="ml-vip-status{variant}">
+        <div class="ml-vip-status-title">오늘 시장 상태</div>
+        <div class="ml-vip-rows">
+            <div class="ml-vip-row"><span class="ml-vip-key">상태</span> <span class="ml-vip-state" style="color:{color}">{status}</span></div>
+            <div class="ml-vip-row"><span class="ml-vip-key">핵심 요인</span> <span class="ml-vip-factor">{factor}</span></div>
+        </div>
+        <div class="ml-vip-summary">
+            <div class="ml-vip-summary-title">현재 시장 요약</div>
+            <div class="ml-vip-line"><span>경기:</span> 미국 {us} / 한국 {kr}</div>
+            <div class="ml-vip-line"><span>리스크:</span> {risk}</div>
+            <div class="ml-vip-line"><span>전략:</span> <b>현금 {cash}</b></div>
+        </div>
+    </div>
+    """),
+    "vip_locked": compile_html("""
+    <div class="ml-vip-teaser">
+        <p class="ml-vip-teaser-title">핵심 매크로 지표 요약</p>
+        <p class="ml-vip-teaser-text">금리: 상승 압력 유지 (4.28%)<br>환율: 달러 강세 지속 (1,491원)</p>
+    </div>
+    <div class="ml-vip-lock">
+        <h3>Pro 멤버십 전용 프리미엄 리포트</h3>
+        <p>실시간 거시 경제 데이터 기반의 탑다운 전략, 리스크 방어 논리, 그리고 한국 시장 맞춤형 유망 섹터를 매일 아침 확인하세요.</p>
+        <p class="ml-vip-lock-hint">왼쪽 사이드바에서 멤버십을 업그레이드할 수 있습니다.</p>
+    </div>
+    """),
+}
+
+TRAFFIC_STATES = {"위험": ("danger", "r"), "경계": ("caution", "y"), "안정": ("safe", "g")}
+
+# -----------------------------------------------------------------------------
+# 전송량 계측: 실행(rerun)마다 이 모듈을 거쳐 나간 HTML/CSS 바이트를 페이지별로 기록합니다.
+# -----------------------------------------------------------------------------
+def begin_page():
+    # 스크립트 맨 위에서 1번: 이번 실행의 CSS 등록 목록과 바이트 계수기를 비우고 공통 CSS 를 보냅니다.
+    st.session_state["_css_sent"] = set()
+    st.session_state["_payload_bytes"] = 0
+    use_css("base")
+
+def html(markup):
+    st.session_state["_payload_bytes"] = st.session_state.get("_payload_bytes", 0) + len(markup.encode("utf-8"))
+    st.markdown(markup, unsafe_allow_html=True)
+
+def use_css(*names):
+    # 💡 같은 실행 안에서는 묶음마다 1번만 보냅니다. (차트 카드 10개여도 <style> 은 1개)
+    sent = st.session_state.setdefault("_css_sent", set())
+    todo = [n for n in names if n not in sent]
+    if not todo: return
+    sent.update(todo)
+    html("<style>" + "".join(CSS_SHEETS[n] for n in todo) + "</style>")
+
+def end_page(page):
+    # 스크립트 맨 끝에서 1번: 페이지별 최근/평균 전송량 기록
+    log = st.session_state.setdefault("_payload_log", {})
+    nbytes = st.session_state.get("_payload_bytes", 0)
+    row = log.get(page) or {"runs": 0, "total": 0}
+    row["runs"] += 1
+    row["total"] += nbytes
+    row["last"] = nbytes
+    row["at"] = time.time()
+    log[page] = row
+
+def payload_stats():
+    log = st.session_state.get("_payload_log", {})
+    return [{"page": p, "last_bytes": r["last"], "avg_bytes": round(r["total"] / r["runs"]), "runs": r["runs"]} for p, r in log.items()]
+
+# -----------------------------------------------------------------------------
+# 카드 렌더러
+# -----------------------------------------------------------------------------
+def section_header(title):
+    html(TEMPLATES["section_header"].format(title=title))
+
+def spacer(cls="ml-gap-10"):
+    html(f"<div class='{cls}'></div>")
+
+def risk_badges_html(stats):
+    # 위험 통계 배지 (변동성 / 고점 대비 / 52주 위치 / z-score). |z|>=2 또는 52주 양 끝 10% 구간은 강조
+    if not stats: return ""
+    unit = "%" if stats['kind'] == "price" else "%p"
+    items = []
+    if stats['vol'] is not None: items.append(("", f"변동성 {stats['vol']:.1f}{unit}"))
+    items.append(("", f"고점 대비 {stats['drawdown']:+.1f}{unit}"))
+    items.append((" class='ml-hot'" if not 10 <= stats['range_pos'] <= 90 else "", f"52주 {stats['range_pos']:.0f}%"))
+    items.append((" class='ml-hot'" if abs(stats['zscore']) >= 2 else "", f"z {stats['zscore']:+.2f}"))
+    return TEMPLATES["risk"].format(items="".join(f"<span{cls}>{text}</span>" for cls, text in items))
+
+def metric_card(label, value, change, pct_change, unit="", up_color="#ef4444", down_color="#3b82f6", stats=None):
+    if change > 0: color, bg, arrow, sign = up_color, f"{up_color}15", "▲", "+"
+    elif change < 0: color, bg, arrow, sign = down_color, f"{down_color}15", "▼", ""
+    else: color, bg, arrow, sign = "#6b7280", "#f3f4f6", "-", ""
+    use_css("metric")
+    html(TEMPLATES["metric"].format(label=label, value=value, unit=unit, color=color, bg=bg, arrow=arrow, sign=sign, change=change, pct=pct_change, risk=risk_badges_html(stats)))
+
+@lru_cache(maxsize=256)
+def traffic_light_html(title, status):
+    # 제목 x 상태 조합은 몇 개 안 되므로 만들어 둔 문자열을 그대로 재사용합니다.
+    state, lamp = TRAFFIC_STATES.get(status, TRAFFIC_STATES["안정"])
+    on = {k: " ml-on" if k == lamp else "" for k in "ryg"}
+    return TEMPLATES["traffic_light"].format(state=state, title=title, status=status, on_r=on["r"], on_y=on["y"], on_g=on["g"])
+
+def traffic_light(title, status):
+    use_css("traffic_light")
+    html(traffic_light_html(title, status))
+
+def chart_meta(source, day, unit):
+    html(TEMPLATES["chart_meta"].format(source=source, day=day, unit=unit))
+
+def ai_summary(summary):
+    use_css("ai_cards")
+    html(TEMPLATES["ai_summary"].format(summary=summary))
+
+def ai_card(title, body, action=False):
+    use_css("ai_cards")
+    html(TEMPLATES["ai_card"].format(title=title, body=body, variant=" ml-card-action" if action else ""))
+
+def report_card(title, body, lead=False):
+    use_css("ai_cards")
+    html(TEMPLATES["report_card"].format(title=title, body=body, variant=" ml-report-lead" if lead else ""))
+
+def ai_box(title, body):
+    html(TEMPLATES["ai_box"].format(title=title, body=body))
+
+def gauge_meta(source, day, unit):
+    use_css("gauge")
+    html(TEMPLATES["gauge_meta"].format(source=source, day=day, unit=unit))
+
+def pro_box():
+    use_css("sidebar")
+    html(TEMPLATES["pro_box"])
+
+def vip_status(status, color, factor, us, kr, risk, cash, locked=False):
+    # 시장 상태 카드. locked=True 는 멤버십 안내용 흐린 미리보기 (예시 값)
+    use_css("vip")
+    html(TEMPLATES["vip_status"].format(status=status, color=color, factor=factor, us=us, kr=kr, risk=risk, cash=cash, variant=" ml-locked" if locked else ""))
+
+def vip_locked():
+    use_css("vip")
+    html(TEMPLATES["vip_locked"])
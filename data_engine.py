@@ -0,0 +1,2091 @@
+# -----------------------------------------------------------------------------
+# Market Logic 데이터 엔진
+# 화면(app.py)과 분리해 두어서 Streamlit 없이도 그대로 돌아갑니다. (snapshot.py 헤드리스 빌드)
+# -----------------------------------------------------------------------------
+import streamlit as st
+import pandas as pd
+import numpy as np
+import openai
+import yfinance as yf
+from io import StringIO
+import time
+from datetime import datetime, date, timedelta, timezone
+from zoneinfo import ZoneInfo
+import concurrent.futures
+import os
+import json
+import re
+import bisect
+import threading
+import random
+from collections import deque, OrderedDict
+from shared_cache import open_backend, shared_cached, make_key
+from ai_jobs import AIJobQueue
+from alerts import AlertStore, AlertEngine, open_sink
+from mailer import PreparedMail, open_mailer, fan_out
+from events import EventLog, daily_counts, latency_summary
+from quality import validate_series, describe_issues, LastGood
+from http_pool import HttpClient
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def get_secret(name, default=None):
+    # Streamlit 금고(secrets.toml) 우선, 없으면 환경변수(대문자 이름) - CLI에서도 같은 키를 쓰기 위함
+    try:
+        if name in st.secrets: return st.secrets[name]
+    except Exception:
+        pass
+    return os.environ.get(name.upper(), default)
+
+def admin_emails():
+    # 관리자 이메일 허용 목록: secrets 의 admin_emails (목록 또는 "a@b.com, c@d.com") / 환경변수 ADMIN_EMAILS
+    emails = get_secret("admin_emails", "")
+    if isinstance(emails, str): emails = emails.split(",")
+    return {str(e).strip().lower() for e in emails if str(e).strip()}
+
+def is_admin(email):
+    return bool(email) and email.strip().lower() in admin_emails()
+
+# 💡 공유 캐시: st.cache_data 는 프로세스(복제본)마다 따로라서, 그 아래에 복제본끼리 함께 쓰는 저장소를 한 겹 더 둡니다.
+# 주소는 secrets 의 shared_cache_url (또는 환경변수 SHARED_CACHE_URL). 형식은 shared_cache.py 참고.
+SHARED_CACHE_DEFAULT = "sqlite://" + os.path.join(BASE_DIR, ".cache", "shared_cache.db")
+
+@st.cache_resource(show_spinner=False)
+def get_shared_cache():
+    return open_backend(get_secret("shared_cache_url", SHARED_CACHE_DEFAULT))
+
+# 💡 외부 HTTP 호출(구글 로그인, FRED, 위키백과)은 프로세스당 연결 풀 1개로 (http_pool.py). 호출마다 사용 기록(3-17)에도 남깁니다.
+@st.cache_resource(show_spinner=False)
+def get_http():
+    return HttpClient(observe=lambda *a: log_http(*a))
+
+def shared(namespace, ttl, **kwargs):
+    # 원천 호출(캐시를 전부 놓친 경우)마다 지연 시간을 사용 기록(3-17)에 남깁니다. (3-17 은 아래에 있어서 호출 때 찾습니다)
+    return shared_cached(get_shared_cache, namespace, ttl, observe=lambda *a: log_upstream(*a), **kwargs)
+
+def fetched(res):
+    return res is not None and res[0] is not None and passed(res[3])
+
+def non_empty(obj):
+    return obj is not None and len(obj) > 0
+
+# 💡 실패는 epoch/동결 꼬리표 캐시에 넣지 않습니다. 캐시 함수 안에서 FetchFailed 를 던지면 st.cache_data 와 공유 캐시 모두
+# 저장하지 않고, 바깥 함수가 without_failures 로 잡아서 빈 값을 돌려줍니다. (다음 실행이 다시 시도)
+# 대신 원천이 죽어 있는 동안 실행마다 두드리지 않도록, 같은 호출은 FAILURE_RETRY_SEC 동안 바로 빈 값을 돌려줍니다.
+FAILURE_RETRY_SEC = 60
+
+class FetchFailed(Exception):
+    pass
+
+@st.cache_resource(show_spinner=False)
+def get_recent_failures():
+    return {} # (함수 이름, 인자) -> 마지막 실패 시각
+
+def without_failures(fn, *args, default=None):
+    failures, now, k = get_recent_failures(), time.time(), (fn.__name__, args)
+    if now - failures.get(k, 0) < FAILURE_RETRY_SEC: return default
+    try:
+        return fn(*args)
+    except Exception:
+        for old in [o for o, t in list(failures.items()) if now - t >= FAILURE_RETRY_SEC]: failures.pop(old, None)
+        failures[k] = now
+        return default
+
+def passed(df):
+    # 품질 검사(3-18)에서 격리된 데이터(직전 정상본으로 대신 내보낸 것)는 어떤 캐시에도 올리지 않습니다.
+    return df is None or not getattr(df, "attrs", {}).get('quality', {}).get('quarantined')
+
+# -----------------------------------------------------------------------------
+# 3-0. 시장 달력 엔진 (휴장일/만기일은 규칙으로 계산, FOMC/CPI/고용 발표일은 파일에서)
+# -----------------------------------------------------------------------------
+CALENDAR_FILE = os.path.join(BASE_DIR, "data", "market_calendar.json")
+
+def nth_weekday(year, month, weekday, n):
+    # 해당 월의 n번째 요일 (weekday: 월=0 ... 일=6, n=-1 이면 마지막)
+    if n > 0:
+        d = date(year, month, 1)
+        return d + timedelta(days=(weekday - d.weekday()) % 7 + 7 * (n - 1))
+    d = date(year + (month == 12), month % 12 + 1, 1) - timedelta(days=1)
+    return d - timedelta(days=(d.weekday() - weekday) % 7)
+
+def easter(year):
+    # 부활절 (그레고리력 익명 알고리즘) -> 성금요일 계산용
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def us_observed(d):
+    # 토요일 -> 금요일, 일요일 -> 월요일로 대체 휴장
+    if d.weekday() == 5: return d - timedelta(days=1)
+    if d.weekday() == 6: return d + timedelta(days=1)
+    return d
+
+def nyse_holidays(year):
+    h = {}
+    if date(year, 1, 1).weekday() != 5: h[us_observed(date(year, 1, 1))] = "신정" # 토요일 신정은 전년도로 당기지 않음
+    h[nth_weekday(year, 1, 0, 3)] = "마틴 루터 킹 데이"
+    h[nth_weekday(year, 2, 0, 3)] = "대통령의 날"
+    h[easter(year) - timedelta(days=2)] = "성금요일"
+    h[nth_weekday(year, 5, 0, -1)] = "메모리얼 데이"
+    h[us_observed(date(year, 6, 19))] = "준틴스"
+    h[us_observed(date(year, 7, 4))] = "독립기념일"
+    h[nth_weekday(year, 9, 0, 1)] = "노동절"
+    h[nth_weekday(year, 11, 3, 4)] = "추수감사절"
+    h[us_observed(date(year, 12, 25))] = "크리스마스"
+    return h
+
+KRX_FIXED = {(1, 1): "신정", (3, 1): "삼일절", (5, 1): "노동절", (5, 5): "어린이날", (6, 6): "현충일", (8, 15): "광복절", (10, 3): "개천절", (10, 9): "한글날", (12, 25): "크리스마스"}
+# 대체공휴일 대상: 토/일과 겹치면 대체 (설날/추석은 일요일과 겹칠 때만)
+KRX_SUBSTITUTE = {"삼일절", "어린이날", "부처님오신날", "광복절", "개천절", "한글날", "크리스마스"}
+
+def krx_holidays(year, lunar, extra):
+    entries = [(date(year, m, d), name) for (m, d), name in KRX_FIXED.items()]
+    info = lunar.get(str(year), {})
+    if 'buddha' in info: entries.append((date.fromisoformat(info['buddha']), "부처님오신날"))
+    for key, name in (("seollal", "설날"), ("chuseok", "추석")):
+        if key in info:
+            center = date.fromisoformat(info[key])
+            entries += [(center + timedelta(days=off), name if off == 0 else f"{name} 연휴") for off in (-1, 0, 1)]
+    h = {}
+    for d, name in entries: h.setdefault(d, name)
+    subs = {}
+    for d in sorted(h):
+        # 같은 날 휴일이 겹치거나(겹친 만큼 하루) 주말과 겹치면 다음 평일에 대체공휴일 1일
+        names = [n.replace(" 연휴", "") for dd, n in entries if dd == d]
+        needs = len(names) > 1 or any((n in ("설날", "추석") and d.weekday() == 6) or (n in KRX_SUBSTITUTE and d.weekday() >= 5) for n in names)
+        if needs:
+            s = d + timedelta(days=1)
+            while s.weekday() >= 5 or s in h or s in subs: s += timedelta(days=1)
+            subs[s] = f"{names[-1]} 대체공휴일"
+    h.update(subs)
+    last = date(year, 12, 31) # 연말 휴장일 = 그해 마지막 평일
+    while last.weekday() >= 5: last -= timedelta(days=1)
+    h.setdefault(last, "연말 휴장일")
+    h.update({d: n for d, n in extra.items() if d.year == year})
+    return h
+
+def witching_days(year, holidays, weekday, n):
+    # 분기 만기일: 3/6/9/12월 n번째 요일, 휴장일이면 직전 영업일
+    res = {}
+    for m in (3, 6, 9, 12):
+        d = nth_weekday(year, m, weekday, n)
+        while d.weekday() >= 5 or d in holidays: d -= timedelta(days=1)
+        res[d] = f"{m}월 만기일"
+    return res
+
+class MarketCalendar:
+    """종류별 일정을 정렬된 날짜 배열로 들고 있어서 '다음 일정'을 이진 탐색(O(log n))으로 찾는 달력"""
+    def __init__(self, events):
+        self._names = events
+        self._dates = {kind: sorted(v) for kind, v in events.items()}
+
+    def next(self, kind, after=None, n=1):
+        dates = self._dates.get(kind, [])
+        i = bisect.bisect_left(dates, after or date.today())
+        return [(d, self._names[kind][d]) for d in dates[i:i + n]]
+
+    def last(self, kind, before=None):
+        dates = self._dates.get(kind, [])
+        i = bisect.bisect_right(dates, before or date.today())
+        return (dates[i - 1], self._names[kind][dates[i - 1]]) if i else None
+
+    def in_month(self, kind, year, month):
+        dates = self._dates.get(kind, [])
+        lo = bisect.bisect_left(dates, date(year, month, 1))
+        hi = bisect.bisect_left(dates, date(year + (month == 12), month % 12 + 1, 1))
+        return dates[lo:hi]
+
+    def is_holiday(self, kind, d):
+        return d in self._names.get(kind, {})
+
+def build_market_calendar(years):
+    try:
+        with open(CALENDAR_FILE, encoding="utf-8") as f: raw = json.load(f)
+    except Exception:
+        raw = {}
+    to_dates = lambda m: {date.fromisoformat(k): v for k, v in m.items()}
+    extra = to_dates(raw.get("KRX_EXTRA", {}))
+    events = {"NYSE_HOLIDAY": {}, "KRX_HOLIDAY": {}, "US_WITCHING": {}, "KR_WITCHING": {}}
+    for y in years:
+        nyse = nyse_holidays(y)
+        krx = krx_holidays(y, raw.get("KRX_LUNAR", {}), extra)
+        events["NYSE_HOLIDAY"].update(nyse)
+        events["KRX_HOLIDAY"].update(krx)
+        events["US_WITCHING"].update(witching_days(y, nyse, 4, 3)) # 셋째 금요일
+        events["KR_WITCHING"].update(witching_days(y, krx, 3, 2))  # 둘째 목요일
+    for kind in ("FOMC", "CPI", "NFP"): events[kind] = to_dates(raw.get(kind, {}))
+    return MarketCalendar(events)
+
+@st.cache_resource(show_spinner=False)
+def load_market_calendar(base_year):
+    return build_market_calendar(range(base_year - 1, base_year + 3))
+
+def get_market_calendar():
+    # 해가 바뀌면 새 키로 다시 만들어집니다.
+    return load_market_calendar(date.today().year)
+
+# 💡 데이터 시점(epoch) 서비스: "새 데이터가 생길 수 있는 순간"에만 바뀌는 꼬리표를 만들어
+# 캐시 키로 씁니다. 장중에는 5분 단위, 장이 닫히면 다음 개장까지 같은 꼬리표 -> 주말/한국 밤에는 재수집 0회.
+# 거래소별 정규장 시간 (현지 시각) + 장 마감 후 종가 확정까지 더 지켜보는 시간(buffer_min)
+EXCHANGES = {
+    "US": {"tz": "America/New_York", "open": (9, 30), "close": (16, 0), "buffer_min": 30, "holidays": "NYSE_HOLIDAY"},
+    "KRX": {"tz": "Asia/Seoul", "open": (9, 0), "close": (15, 30), "buffer_min": 30, "holidays": "KRX_HOLIDAY"},
+    "FX": {"tz": "UTC", "open": (0, 0), "close": (23, 59), "buffer_min": 0, "holidays": None},
+    # 코인(BTC-USD 등)은 주말에도 거래되므로 매일 하루 종일 5분 꼬리표
+    "CRYPTO": {"tz": "UTC", "open": (0, 0), "close": (23, 59), "buffer_min": 0, "holidays": None, "weekends": True},
+}
+LIVE_EPOCH_MIN = 5
+
+# FRED 시리즈별 발표 규칙 (미국 동부 시각). event: 달력 파일의 실제 발표일 (그 달 일정이 없으면 아래 규칙으로 추정)
+# window: 발표가 나올 수 있는 날짜 범위, first_friday: 매월 첫 금요일
+FRED_RELEASES = {
+    "CPIAUCSL": {"rule": "window", "days": (10, 15), "time": (8, 30), "event": "CPI"},
+    "CPILFESL": {"rule": "window", "days": (10, 15), "time": (8, 30), "event": "CPI"},
+    "PAYEMS": {"rule": "first_friday", "time": (8, 30), "event": "NFP"},
+    "UNRATE": {"rule": "first_friday", "time": (8, 30), "event": "NFP"},
+    "DGS10": {"rule": "daily", "time": (16, 30)},
+}
+
+def ticker_exchange(ticker):
+    if ticker in ("^KS11", "^KQ11") or ticker.endswith((".KS", ".KQ")): return "KRX"
+    if ticker.endswith(("=X", "=F")): return "FX" # 환율/선물은 평일 24시간
+    if ticker.count("-") == 1 and len(ticker.split("-")[1]) == 3: return "CRYPTO" # 야후 코인 티커 (BTC-USD, ETH-KRW)
+    return "US"
+
+def is_session_day(exchange, d):
+    spec = EXCHANGES[exchange]
+    kind = spec['holidays']
+    return (d.weekday() < 5 or spec.get('weekends', False)) and not (kind and get_market_calendar().is_holiday(kind, d))
+
+def market_epoch(ticker, now=None):
+    ex = ticker_exchange(ticker)
+    spec = EXCHANGES[ex]
+    local = (now or datetime.now(timezone.utc)).astimezone(ZoneInfo(spec['tz']))
+    today = local.date()
+    open_t = local.replace(hour=spec['open'][0], minute=spec['open'][1], second=0, microsecond=0)
+    close_t = local.replace(hour=spec['close'][0], minute=spec['close'][1], second=0, microsecond=0) + timedelta(minutes=spec['buffer_min'])
+    if is_session_day(ex, today) and open_t <= local <= close_t:
+        bucket = local.replace(minute=local.minute - local.minute % LIVE_EPOCH_MIN, second=0, microsecond=0)
+        return f"{ex}|live|{bucket:%Y-%m-%d %H:%M}"
+    # 장 밖에서는 '마지막으로 끝난 세션 날짜'가 바뀔 때만 꼬리표가 바뀝니다.
+    last = today if (is_session_day(ex, today) and local > close_t) else today - timedelta(days=1)
+    while not is_session_day(ex, last): last -= timedelta(days=1)
+    return f"{ex}|closed|{last}"
+
+def release_days(rule, year, month):
+    if 'event' in rule:
+        listed = get_market_calendar().in_month(rule['event'], year, month)
+        if listed: return listed
+    first = date(year, month, 1)
+    nxt = date(year + (month == 12), month % 12 + 1, 1)
+    days = [first + timedelta(days=i) for i in range((nxt - first).days)]
+    if rule['rule'] == "first_friday": return [d for d in days if d.weekday() == 4][:1]
+    if rule['rule'] == "window": return [d for d in days if rule['days'][0] <= d.day <= rule['days'][1] and is_session_day("US", d)]
+    return [d for d in days if is_session_day("US", d)]
+
+def fred_epoch(series_id, now=None):
+    # 가장 최근에 '지나간' 발표 시각이 곧 데이터 시점입니다. (발표일이 아니면 다음 발표까지 그대로)
+    rule = FRED_RELEASES.get(series_id, FRED_RELEASES["DGS10"])
+    et = ZoneInfo("America/New_York")
+    now_et = (now or datetime.now(timezone.utc)).astimezone(et)
+    y, m = now_et.year, now_et.month
+    months = [(y - (m == 1), (m - 2) % 12 + 1), (y, m)]
+    released = [d for ym in months for d in release_days(rule, *ym)
+                if datetime(d.year, d.month, d.day, *rule['time'], tzinfo=et) <= now_et]
+    return f"FRED|{series_id}|{max(released) if released else f'{y}-{m:02d}'}"
+
+def get_yahoo_data(ticker, period="10y"):
+    # 💡 실패는 epoch 캐시에 넣지 않습니다. (금요일 밤 한 번의 실패가 주말 내내 빈 차트로 남지 않게, 3-0 without_failures)
+    # 실패/격리면 직전 정상본(있으면)으로 대신 보여 줍니다. (3-18)
+    res = without_failures(fetch_yahoo_data, ticker, period, market_epoch(ticker), default=(None, None, None, None))
+    return res if res[0] is not None else summarize_series(quality_fallback(f"yahoo:{ticker}", period))
+
+def get_fred_data(series_id, calculation_type='raw'):
+    epoch = fred_epoch(series_id)
+    res = without_failures(fetch_fred_data, series_id, calculation_type, epoch, default=(None, None, None, None))
+    # 실패/격리면 캐시 없이 다시 요약 (원천 자리에 직전 정상본이 들어가 있을 수 있음, 3-18)
+    return res if res[0] is not None else fred_summary(series_id, calculation_type, epoch)
+
+# 💡 TTL은 안전장치일 뿐, 실제 갱신은 epoch 꼬리표가 바뀔 때 일어납니다.
+@st.cache_data(ttl=86400 * 3, max_entries=512, show_spinner=False)
+@shared("yahoo", ttl=86400 * 3, accept=fetched)
+def fetch_yahoo_data(ticker, period, epoch):
+    # 💡 같은 epoch로 만들어 둔 스냅샷이 있으면 야후에 가지 않고 디스크에서 바로 꺼냅니다.
+    snap = read_snapshot_series(f"yahoo:{ticker}", epoch, period)
+    if snap is not None: return summarize_series(snap)
+    try:
+        data = yf.Ticker(ticker).history(period=period) 
+        substitute = {}
+        if len(data) < 2 and ticker == "^DJI":
+            data = yf.Ticker("DIA").history(period=period)
+            substitute = {"substitute": "DIA"}
+        if len(data) > 1:
+            chart_df = data[['Close']].reset_index()
+            chart_df.columns = ['Date', 'Value']
+            chart_df['Date'] = chart_df['Date'].dt.tz_localize(None)
+            # 💡 캐시에 넣기 전에 품질 검사 (격리되면 Quarantined -> 캐시에 안 남고 get_yahoo_data 가 직전 정상본을 씀)
+            res = summarize_series(quality_gate(f"yahoo:{ticker}", chart_df, variant=period, **substitute))
+            if res[0] is not None: return res
+    except FetchFailed: raise
+    except Exception: pass
+    raise FetchFailed(f"yahoo:{ticker}")
+
+# 💡 원천(raw)은 fetch_fred_raw 가 받아서 캐시/공유하고, yoy/diff 는 파생 시리즈 그래프(3-13)가 계산합니다.
+# 화면용 요약(현재값, 변화, 변화율, 데이터)은 발표 epoch 당 1번만 만들어 둡니다.
+@st.cache_data(ttl=86400 * 40, max_entries=256, show_spinner=False)
+def fetch_fred_data(series_id, calculation_type, epoch):
+    res = fred_summary(series_id, calculation_type, epoch)
+    # 실패나 격리(직전 정상본으로 대신 낸 값)는 epoch 캐시에 넣지 않음
+    if res[0] is None or not passed(res[3]): raise FetchFailed(f"fred:{series_id}:{calculation_type}")
+    return res
+
+def fred_summary(series_id, calculation_type, epoch):
+    snap = read_snapshot_series(f"fred:{series_id}:{calculation_type}", epoch)
+    if snap is not None: return summarize_series(snap)
+    s = get_series(fred_node(series_id, calculation_type))
+    frame = series_frame(s)
+    frame.attrs['quality'] = get_quality(f"fred:{series_id}") # 파생 값도 원천의 품질 꼬리표를 그대로 달고 다닙니다
+    return summarize_series(frame)
+
+FRED_URL = "https://api.stlouisfed.org/fred/series/observations"
+
+def get_fred_raw(series_id):
+    # 원천(raw) FRED 시리즈. 실패는 다음 발표일까지 캐시되지 않게 without_failures 로 감쌉니다.
+    df = without_failures(fetch_fred_raw, series_id, fred_epoch(series_id))
+    return df if df is not None else quality_fallback(f"fred:{series_id}")
+
+@st.cache_data(ttl=86400 * 40, max_entries=256, show_spinner=False)
+@shared("fred_raw", ttl=86400 * 40, accept=lambda df: non_empty(df) and passed(df))
+def fetch_fred_raw(series_id, epoch):
+    snap = read_snapshot_series(f"fred:{series_id}:raw", epoch)
+    if snap is not None: return snap
+    # 금고에서 키를 꺼낼 수 없는 상황이면 실패로 처리 (캐시하지 않고, 화면에는 빈 값)
+    api_key = get_secret("FRED_API_KEY")
+    if not api_key:
+        raise FetchFailed("FRED_API_KEY 없음")
+
+    # 💡 재시도(지터 포함)와 제한 시간은 공용 HTTP 클라이언트가 맡습니다. (연결도 이전 호출 것을 재사용)
+    try:
+        r = get_http().get(FRED_URL, params={"series_id": series_id, "api_key": api_key, "file_type": "json"}, endpoint="fred/observations")
+        if r.status_code != 200: raise FetchFailed(f"fred:{series_id}: HTTP {r.status_code}")
+        observations = r.json().get('observations', [])
+        if not observations: raise FetchFailed(f"fred:{series_id}: 관측치 없음")
+
+        df = pd.DataFrame(observations)
+        df = df.rename(columns={'date': 'Date', 'value': 'Value'})
+        df['Date'] = pd.to_datetime(df['Date'])
+        df = df.set_index('Date').sort_index()
+
+        # 💡 핵심 수정 파트: FRED API의 미세한 찌꺼기를 완벽히 걸러내고 순수 숫자만 추출!
+        # 1. 값이 '.' 이거나 빈칸인 것을 진짜 NaN(결측치)으로 바꿉니다.
+        df['Value'] = df['Value'].replace('.', pd.NA)
+        df = df.dropna(subset=['Value']) # 빈칸 날리기
+        # 2. 안전하게 숫자로 변환합니다.
+        df['Value'] = pd.to_numeric(df['Value'], errors='coerce')
+        df = df.dropna(subset=['Value']) # 변환 실패한 찌꺼기 한 번 더 날리기
+
+        if df.empty: raise FetchFailed(f"fred:{series_id}: 숫자 없음") # 남은 데이터가 없으면 실패 (캐시 안 함)
+        return quality_gate(f"fred:{series_id}", df[['Value']].reset_index())
+    except FetchFailed:
+        raise
+    except Exception as e:
+        raise FetchFailed(f"fred:{series_id}: {e}")
+
+# 💡 금리는 야후(^TNX) 우선, 실패하면 FRED(DGS10). 두 함수 모두 각자의 epoch로 캐시됩니다.
+def get_interest_rate_hybrid():
+    res = get_yahoo_data("^TNX")
+    if res[0] is not None: return res
+    return get_fred_data("DGS10", "raw")
+
+def rsi_series(data, window=14):
+    # 💡 전체 기간 RSI를 한 번에 계산 (calculate_rsi 와 백테스트가 같이 씁니다)
+    return rsi_values(data['Value'], window)
+
+def rsi_values(s, window=14):
+    # 단순 이동평균 RSI: 마지막 값은 최근 window+1 개 관측치로만 정해집니다. (파생 그래프가 꼬리만 다시 계산하는 근거)
+    delta = s.diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=window).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=window).mean()
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+def calculate_rsi(data, window=14):
+    if data is None or len(data) < window: return None
+    return rsi_series(data, window).iloc[-1]
+
+def get_freeze_key(fmt="%Y-%m-%d %H:%M"):
+    # 💡 매일 아침 6:40 KST 동결 꼬리표 (6:40 전이면 어제 6:40, 지났으면 오늘 6:40)
+    kst = timezone(timedelta(hours=9))
+    now_kst = datetime.now(kst)
+    target_time = now_kst.replace(hour=6, minute=40, second=0, microsecond=0)
+    if now_kst < target_time: target_time -= timedelta(days=1)
+    return target_time.strftime(fmt)
+
+def to_series(df):
+    # (Date, Value) 데이터프레임 -> 날짜 인덱스 Series
+    if df is None or df.empty: return pd.Series(dtype=float)
+    s = df.set_index('Date')['Value'].astype(float)
+    return s[~s.index.duplicated(keep='last')].sort_index()
+
+def asof_align(s, index, tolerance=None):
+    # 각 날짜 시점에 '그때까지 알려진 마지막 값'을 붙입니다. (as-of join, 이진 탐색 1번으로 끝)
+    # tolerance 보다 오래된 값은 '끊긴 데이터'로 보고 비워 둡니다.
+    s = s.dropna()
+    if s.empty: return pd.Series(np.nan, index=index)
+    pos = s.index.searchsorted(index, side='right') - 1
+    safe = np.clip(pos, 0, None)
+    out = pd.Series(s.values[safe], index=index)
+    stale = pos < 0
+    if tolerance is not None: stale |= np.asarray(index - s.index[safe] > tolerance)
+    return out.where(~stale)
+
+# -----------------------------------------------------------------------------
+# 3-1. 실시간(장중) 시세판
+# -----------------------------------------------------------------------------
+# 💡 10년치 일봉은 그대로 두고, 백그라운드 폴러 1개가 화면에 떠 있는 티커들의 최신가만 계속 받아옵니다.
+# 시세 공급원(feed)은 함수 하나로 갈아끼울 수 있습니다: feed(refs) -> {티커: (현재가, 전일 종가, 시각(UTC))}
+LIVE_POLL_SEC = 15
+
+def yahoo_quote_feed(refs):
+    tickers = list(refs)
+    raw = yf.download(tickers, period="2d", interval="1m", group_by="ticker", progress=False, threads=True)
+    quotes = {}
+    if raw is None or raw.empty: return quotes
+    for t in tickers:
+        try:
+            if isinstance(raw.columns, pd.MultiIndex):
+                if t not in raw.columns.get_level_values(0): continue
+                s = raw[t]['Close'].dropna()
+            else:
+                s = raw['Close'].dropna()
+            if s.empty: continue
+            stamps = s.index.tz_convert("UTC").tz_localize(None) if s.index.tz is not None else s.index
+            days = stamps.normalize()
+            prev = s[days < days[-1]]
+            # 전일 분봉이 없으면(연휴 직후 등) 일봉 기준 종가로 대신합니다.
+            prev_close = float(prev.iloc[-1]) if len(prev) else float(refs[t])
+            quotes[t] = (float(s.iloc[-1]), prev_close, stamps[-1])
+        except Exception:
+            continue
+    return quotes
+
+def simulated_quote_feed(vol=0.0008, seed=None):
+    # 💡 로컬/테스트용 가짜 시세: 일봉 마지막 종가에서 출발하는 랜덤워크
+    rng = random.Random(seed)
+    state = {}
+    def feed(refs):
+        now = pd.Timestamp.now(tz="UTC").tz_localize(None)
+        quotes = {}
+        for t, ref in refs.items():
+            price = state.get(t, ref) * (1 + rng.gauss(0, vol))
+            state[t] = price
+            quotes[t] = (price, ref, now)
+        return quotes
+    return feed
+
+LIVE_FEEDS = {"yahoo": lambda: yahoo_quote_feed, "simulated": simulated_quote_feed}
+
+class LiveQuoteBoard:
+    """모든 세션이 함께 쓰는 장중 시세판 (폴러 스레드 1개 + 티커별 분봉 버퍼)"""
+    def __init__(self, feed, interval=LIVE_POLL_SEC, max_points=1500, idle_timeout=300):
+        self.feed = feed
+        self.interval = interval
+        self.max_points = max_points
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._refs = {}
+        self._quotes = {}
+        self._ticks = {}
+        self._last_seen = 0.0
+        self._thread = None
+
+    def watch(self, refs):
+        # 화면이 열릴 때마다 호출: 감시 티커 등록 + (멈춰 있으면) 폴러 재가동
+        with self._lock:
+            for t, ref in refs.items():
+                if ref is not None: self._refs.setdefault(t, float(ref))
+            self._last_seen = time.time()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def poll_once(self):
+        with self._lock: refs = dict(self._refs)
+        if not refs: return
+        try: quotes = self.feed(refs)
+        except Exception: return
+        with self._lock:
+            for t, (price, prev_close, ts) in quotes.items():
+                self._quotes[t] = (price, prev_close, ts)
+                ticks = self._ticks.setdefault(t, deque(maxlen=self.max_points))
+                # 같은 분봉이 다시 오면 덮어쓰고, 새 분봉이면 뒤에 이어 붙입니다. (히스토리 재수집 없음)
+                if ticks and ticks[-1][0] == ts: ticks[-1] = (ts, price)
+                else: ticks.append((ts, price))
+
+    def _run(self):
+        # 아무도 안 보고 있으면(idle_timeout) 스스로 멈춰서 야후를 괴롭히지 않습니다.
+        while time.time() - self._last_seen < self.idle_timeout:
+            self.poll_once()
+            time.sleep(self.interval)
+
+    def quote(self, ticker):
+        with self._lock: return self._quotes.get(ticker)
+
+    def intraday(self, ticker):
+        with self._lock: ticks = list(self._ticks.get(ticker, []))
+        if not ticks: return None
+        df = pd.DataFrame(ticks, columns=['Date', 'Value'])
+        df['Date'] = df['Date'] + timedelta(hours=9) # 화면에는 한국 시간으로 표시
+        return df
+
+@st.cache_resource(show_spinner=False)
+def get_live_board(feed_name="yahoo"):
+    return LiveQuoteBoard(LIVE_FEEDS.get(feed_name, LIVE_FEEDS["yahoo"])())
+
+def apply_live_quote(board, ticker, res):
+    # 캐시된 일봉 결과(curr, change, pct, df)에 최신 장중 시세를 덮어씌웁니다.
+    quote = board.quote(ticker) if board else None
+    if quote is None or res[3] is None: return res
+    price, prev_close, ts = quote
+    change = price - prev_close
+    pct_change = (change / prev_close) * 100 if prev_close else 0
+    df = res[3]
+    day = pd.Timestamp(ts).normalize()
+    if df['Date'].iloc[-1].normalize() == day:
+        df = df.copy()
+        df.iloc[-1, df.columns.get_loc('Value')] = price
+    else:
+        df = pd.concat([df, pd.DataFrame({'Date': [day], 'Value': [price]})], ignore_index=True)
+    return price, change, pct_change, df
+
+# -----------------------------------------------------------------------------
+# 3-2. S&P 500 전 종목 수집 (배치 다운로드)
+# -----------------------------------------------------------------------------
+SP500_URL = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+BATCH_CHUNK = 100
+GICS_SECTOR_KR = {
+    "Information Technology": "기술", "Health Care": "헬스케어", "Financials": "금융",
+    "Consumer Discretionary": "임의소비재", "Consumer Staples": "필수소비재", "Energy": "에너지",
+    "Industrials": "산업재", "Utilities": "유틸리티", "Real Estate": "부동산",
+    "Materials": "소재", "Communication Services": "통신"
+}
+
+def download_closes(tickers, period="5d", chunk=BATCH_CHUNK):
+    # 💡 티커 수백 개를 chunk 단위 yf.download 로 묶어 받고, (날짜 x 티커) 종가 패널 하나로 합칩니다.
+    frames = []
+    for i in range(0, len(tickers), chunk):
+        part = list(tickers[i:i + chunk])
+        try:
+            raw = yf.download(part, period=period, interval="1d", progress=False, threads=True, auto_adjust=False)
+        except Exception:
+            continue
+        if raw is None or raw.empty: continue
+        close = raw['Close']
+        if isinstance(close, pd.Series): close = close.to_frame(part[0])
+        frames.append(close)
+    if not frames: return pd.DataFrame()
+    panel = pd.concat(frames, axis=1)
+    panel = panel.loc[:, ~panel.columns.duplicated()]
+    if panel.index.tz is not None: panel.index = panel.index.tz_localize(None)
+    return panel.sort_index()
+
+# 💡 구성 종목과 발행주식수는 거의 안 바뀌므로 일주일에 한 번만 수집합니다.
+@st.cache_data(ttl=86400 * 7, show_spinner=False)
+@shared("sp500_members", ttl=86400 * 7, lease=300, accept=non_empty)
+def get_sp500_constituents():
+    html = get_http().get(SP500_URL, headers={"User-Agent": "Mozilla/5.0"}, endpoint="wikipedia/sp500").text
+    df = pd.read_html(StringIO(html))[0]
+    df = df[['Symbol', 'Security', 'GICS Sector', 'GICS Sub-Industry']].copy()
+    df.columns = ['Ticker', 'Name', 'Sector', 'Industry']
+    df['Ticker'] = df['Ticker'].str.replace('.', '-', regex=False) # BRK.B -> BRK-B (야후 표기)
+    df['Sector'] = df['Sector'].map(GICS_SECTOR_KR).fillna(df['Sector'])
+
+    def get_shares(t):
+        try: return yf.Ticker(t).fast_info['shares']
+        except: return None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as ex:
+        df['Shares'] = list(ex.map(get_shares, df['Ticker']))
+    df['Shares'] = pd.to_numeric(df['Shares'], errors='coerce')
+    return df.dropna(subset=['Shares']).reset_index(drop=True)
+
+def build_constituent_map(members, closes):
+    # 💡 등락률/시가총액을 한 번에 벡터 계산한 뒤, 섹터 → 산업 → 종목 3단 트리맵 노드로 집계합니다.
+    closes = closes.ffill()
+    if len(closes) < 2: return pd.DataFrame()
+    last, prev = closes.iloc[-1], closes.iloc[-2]
+    df = members.set_index('Ticker')
+    df['Change'] = ((last / prev - 1) * 100).reindex(df.index)
+    df['Cap'] = last.reindex(df.index) * df['Shares']
+    df = df.dropna(subset=['Change', 'Cap']).reset_index()
+    df['W'] = df['Cap'] * df['Change']
+
+    sec = df.groupby('Sector', as_index=False)[['Cap', 'W']].sum()
+    ind = df.groupby(['Sector', 'Industry'], as_index=False)[['Cap', 'W']].sum()
+    ind_id = ind['Sector'] + '/' + ind['Industry']
+    stock_parent = df['Sector'] + '/' + df['Industry']
+    # 상위 블록은 value=0 + branchvalues='remainder' 로 두어 자식 합계를 plotly가 그대로 쓰게 합니다.
+    nodes = pd.concat([
+        pd.DataFrame({'id': sec['Sector'], 'parent': '', 'label': sec['Sector'], 'name': sec['Sector'], 'value': 0.0, 'cap': sec['Cap'], 'change': sec['W'] / sec['Cap']}),
+        pd.DataFrame({'id': ind_id, 'parent': ind['Sector'], 'label': ind['Industry'], 'name': ind['Industry'], 'value': 0.0, 'cap': ind['Cap'], 'change': ind['W'] / ind['Cap']}),
+        pd.DataFrame({'id': stock_parent + '/' + df['Ticker'], 'parent': stock_parent, 'label': df['Ticker'], 'name': df['Name'], 'value': df['Cap'], 'cap': df['Cap'], 'change': df['Change']}),
+    ], ignore_index=True)
+    nodes['text'] = nodes['change'].map(lambda x: f"+{x:.2f}%" if x > 0 else f"{x:.2f}%")
+    return nodes
+
+# -----------------------------------------------------------------------------
+# 3-3. 통합 매크로 패널 (일간 시장 + 월간 지표를 한 날짜축에)
+# -----------------------------------------------------------------------------
+# 💡 컬럼명은 indicator_meta 와 같은 한글 이름을 씁니다.
+# lag: 관측일 -> 실제 발표일 (FRED 월간 지표는 '해당 월 1일'로 찍히지만 발표는 다음 달입니다)
+# stale: 마지막 값이 이 일수보다 오래되면 끊긴 것으로 보고 비워 둡니다. (forward-fill 한도)
+MACRO_PANEL_SPEC = {
+    "다우존스": {"source": "yahoo", "id": "^DJI", "stale": 7},
+    "S&P 500": {"source": "yahoo", "id": "^GSPC", "stale": 7},
+    "나스닥 100": {"source": "yahoo", "id": "^IXIC", "stale": 7},
+    "코스피": {"source": "yahoo", "id": "^KS11", "stale": 7},
+    "코스닥": {"source": "yahoo", "id": "^KQ11", "stale": 7},
+    "공포 지수 (VIX)": {"source": "yahoo", "id": "^VIX", "stale": 7},
+    "미국 10년물 금리": {"source": "rate", "stale": 7},
+    "원/달러 환율": {"source": "yahoo", "id": "KRW=X", "stale": 7},
+    "헤드라인 CPI": {"source": "fred", "id": "CPIAUCSL", "calc": "yoy", "lag": pd.DateOffset(months=1, days=14), "stale": 75},
+    "근원(Core) CPI": {"source": "fred", "id": "CPILFESL", "calc": "yoy", "lag": pd.DateOffset(months=1, days=14), "stale": 75},
+    "비농업 고용 지수": {"source": "fred", "id": "PAYEMS", "calc": "diff", "lag": pd.DateOffset(months=1, days=7), "stale": 75},
+    "실업률": {"source": "fred", "id": "UNRATE", "calc": "raw", "lag": pd.DateOffset(months=1, days=7), "stale": 75},
+}
+
+def load_panel_series(spec):
+    if spec['source'] == "yahoo": df = get_yahoo_data(spec['id'])[3]
+    elif spec['source'] == "rate": df = get_interest_rate_hybrid()[3]
+    else: df = get_fred_data(spec['id'], spec.get('calc', 'raw'))[3]
+    s = to_series(df)
+    if 'lag' in spec: s = s.set_axis(s.index + spec['lag'])
+    return s
+
+def get_macro_panel(epoch):
+    # 입력 시리즈가 하나라도 비면 하루 캐시에 남기지 않고 잠깐 뒤 다시 만듭니다. (그동안은 빈 표)
+    return without_failures(fetch_macro_panel, epoch, default=pd.DataFrame())
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def fetch_macro_panel(epoch):
+    raw = {name: load_panel_series(spec) for name, spec in MACRO_PANEL_SPEC.items()}
+    missing = [name for name, s in raw.items() if s.empty]
+    if missing: raise FetchFailed(f"macro_panel: {', '.join(missing)} 없음")
+    # 날짜축 = 미국 + 한국 거래일 합집합
+    cal = raw["S&P 500"].index.union(raw["코스피"].index)
+    panel = pd.DataFrame({name: asof_align(s, cal, pd.Timedelta(days=MACRO_PANEL_SPEC[name]['stale'])) for name, s in raw.items()}, index=cal)
+    panel["RSI (S&P 500)"] = asof_align(get_series(DERIVED_SERIES["S&P 500 RSI"]), cal, pd.Timedelta(days=7))
+    panel.index.name = 'Date'
+    return panel
+
+def panel_asof(panel, dates, cols=None):
+    # 💡 여러 날짜 x 여러 지표를 한 번에 조회 ("그 날짜에 알려져 있던 값")
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    pos = panel.index.searchsorted(dates, side='right') - 1
+    out = panel.iloc[np.clip(pos, 0, None)]
+    if cols is not None: out = out[cols]
+    out = out.set_axis(dates)
+    out.loc[pos < 0] = np.nan
+    return out
+
+def describe_panel_row(panel, when=None, cols=None):
+    # AI 프롬프트용 한 줄 요약: "S&P 500: 6,512.30, 코스피: 3,201.10, ..."
+    if panel is None or panel.empty: return ""
+    row = panel_asof(panel, [when or panel.index[-1]], cols).iloc[0]
+    return ", ".join(f"{k}: {v:,.2f}" for k, v in row.items() if pd.notna(v))
+
+# -----------------------------------------------------------------------------
+# 3-4. 신호등 백테스트 엔진
+# -----------------------------------------------------------------------------
+BACKTEST_HORIZONS = {"1개월": 21, "3개월": 63, "6개월": 126} # 거래일 기준
+# 규칙 이름: (신호등 topic, 입력1, 입력2)
+BACKTEST_RULES = {
+    "VIX": ("VIX", "공포 지수 (VIX)", None),
+    "RSI (S&P 500)": ("RSI", "RSI (S&P 500)", None),
+    "종합 (VIX + RSI)": ("종합", "공포 지수 (VIX)", "RSI (S&P 500)"),
+    "금융 시장 (금리 & 환율)": ("금융 시장", "미국 10년물 금리", "원/달러 환율"),
+    "물가 지표 (CPI)": ("물가 지표", "헤드라인 CPI", "근원(Core) CPI"),
+    "고용 지표 (실업률)": ("고용 지표", "비농업 고용 지수", "실업률"),
+}
+# 신호등 주제가 실제로 읽는 입력 (1 = 입력1, 2 = 입력2). 없으면 규칙에 적힌 입력 전부
+SIGNAL_INPUTS = {"고용 지표": (2,)}
+BACKTEST_TARGETS = {"S&P 500": "^GSPC", "코스피": "^KS11"}
+STATE_ORDER = ["위험", "경계", "안정"]
+
+def backtest_signal(states, price, horizons=BACKTEST_HORIZONS):
+    # 💡 상태별 선행 수익률 통계: 모든 날짜를 한 번에 shift 해서 groupby 로 집계 (파이썬 루프 없음)
+    cols = list(horizons)
+    fwd = pd.DataFrame({name: (price.shift(-h) / price - 1) * 100 for name, h in horizons.items()}, index=price.index)
+    fwd['State'] = states.reindex(price.index)
+    fwd = fwd.dropna(subset=['State'])
+    up = fwd[cols].gt(0).astype(float).where(fwd[cols].notna())
+    up['State'] = fwd['State']
+
+    mean = fwd.groupby('State')[cols].mean()
+    mean.loc['전체'] = fwd[cols].mean()
+    win = up.groupby('State')[cols].mean() * 100
+    win.loc['전체'] = up[cols].mean() * 100
+    days = fwd.groupby('State').size()
+    days.loc['전체'] = len(fwd)
+
+    order = [s for s in STATE_ORDER + ['전체'] if s in mean.index]
+    stats = pd.concat([mean.add_suffix(" 평균(%)"), win.add_suffix(" 상승확률(%)")], axis=1)
+    stats = stats[[f"{h} {m}" for h in cols for m in ["평균(%)", "상승확률(%)"]]]
+    stats['일수'] = days
+    return stats.loc[order]
+
+def signal_segments(states):
+    # 연속된 같은 상태를 구간 하나로 압축 (타임라인 그리기용)
+    s = states.dropna()
+    if s.empty: return pd.DataFrame(columns=['State', 'Start', 'End'])
+    run = (s != s.shift()).cumsum()
+    seg = pd.DataFrame({'State': s.values, 'Date': s.index}, index=s.index).groupby(run.values).agg(
+        State=('State', 'first'), Start=('Date', 'first'), End=('Date', 'last'))
+    seg['End'] = seg['Start'].shift(-1).fillna(seg['End'])
+    return seg.reset_index(drop=True)
+
+def run_signal_backtest(epoch):
+    # 입력 수집이 실패하면 빈 결과를 하루 내내 캐시하지 않고 잠깐 뒤 다시 돌립니다.
+    return without_failures(fetch_signal_backtest, epoch, default={})
+
+# 💡 하루 한 번(6:40 동결 꼬리표 = 데이터 시점) 전체 규칙을 한꺼번에 돌려서 저장해 둡니다.
+@st.cache_data(ttl=86400, show_spinner=False)
+def fetch_signal_backtest(epoch):
+    prices = {name: to_series(get_yahoo_data(t)[3]) for name, t in BACKTEST_TARGETS.items()}
+    base = prices["S&P 500"]
+    panel = get_macro_panel(epoch)
+    if base.empty or panel.empty: raise FetchFailed("signal_backtest: 입력 없음")
+    # 💡 S&P 거래일마다 '그날 알려져 있던' 지표값을 패널에서 한 번에 조회 (발표 지연 반영 완료)
+    inputs = panel_asof(panel, base.index)
+
+    results = {}
+    for rule, (topic, k1, k2) in BACKTEST_RULES.items():
+        v1 = inputs[k1]
+        v2 = inputs[k2] if k2 else None
+        # 규칙이 읽는 입력이 모두 있는 날만 평가 (없는 입력이 '안정'으로 채점되지 않게)
+        reads = [v for i, v in ((1, v1), (2, v2)) if v is not None and i in SIGNAL_INPUTS.get(topic, (1, 2))]
+        valid = pd.concat(reads, axis=1).notna().all(axis=1)
+        states = pd.Series(traffic_light_series(topic, v1, v2), index=base.index).where(valid)
+        results[rule] = {
+            'segments': signal_segments(states),
+            'stats': {name: backtest_signal(asof_align(states, p.index) if name != "S&P 500" else states, p) for name, p in prices.items() if not p.empty},
+            'current': states.dropna().iloc[-1] if states.notna().any() else None,
+        }
+    return results
+
+# -----------------------------------------------------------------------------
+# 3-5. 자산 간 상관관계 & 변동성 국면 (증분 롤링 커널)
+# -----------------------------------------------------------------------------
+ANALYTICS_ASSETS = {"S&P 500": "^GSPC", "코스피": "^KS11", "코스닥": "^KQ11", "미국 10년물 금리": "^TNX", "원/달러 환율": "KRW=X", "VIX": "^VIX"}
+ANALYTICS_PAIRS = [("코스피", "원/달러 환율"), ("S&P 500", "미국 10년물 금리"), ("코스피", "S&P 500"), ("S&P 500", "VIX"), ("코스닥", "코스피")]
+# 연율화 실현 변동성(%) 구간 -> 국면
+VOL_REGIMES = [(12, "저변동"), (20, "보통"), (30, "고변동")]
+VOL_REGIME_ORDER = ["저변동", "보통", "고변동", "위기"]
+
+def asset_epochs():
+    return tuple(market_epoch(t) for t in ANALYTICS_ASSETS.values())
+
+@st.cache_data(ttl=86400 * 3, max_entries=4, show_spinner=False)
+def load_asset_returns(epochs):
+    # epochs: asset_epochs() (캐시 꼬리표 역할만). 6개 자산 중 하나라도 새 종가가 생길 때만 다시 정렬/계산합니다.
+    closes = pd.concat({name: to_series(get_yahoo_data(t)[3]) for name, t in ANALYTICS_ASSETS.items()}, axis=1).dropna()
+    # 금리는 수준 변화(%p), 나머지는 로그 수익률
+    rets = np.log(closes).diff()
+    rets["미국 10년물 금리"] = closes["미국 10년물 금리"].diff()
+    rets = rets.dropna()
+    if rets.empty: raise FetchFailed("asset_returns: 공통 날짜 없음")
+    return rets
+
+class RollingMoments:
+    """수익률 패널의 누적합(1차 + 교차 2차 모멘트)을 들고 있다가, 새 봉만 뒤에 이어 붙이는 롤링 커널.
+    어떤 창(window) 길이의 평균/공분산이든 누적합 차이 한 번으로 나옵니다."""
+    def __init__(self, columns):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.index = pd.DatetimeIndex([])
+        self.S = np.zeros((1, k))       # 0행 = 0 (prefix sum)
+        self.SS = np.zeros((1, k, k))
+        self.version = 0
+        self.source_sig = None
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def extend(self, returns):
+        sig = (len(returns), returns.index[-1], tuple(returns[self.columns].iloc[-1].to_numpy(dtype=float))) if len(returns) else None
+        with self._lock:
+            if sig is None or sig == self.source_sig: return 0 # 원천이 그대로면 아무것도 안 함 (RiskKernel 과 같은 방식)
+            self.source_sig = sig
+            if len(self.index):
+                new = returns[returns.index >= self.index[-1]]
+                if new.empty: return 0
+                # 💡 마지막 봉은 장중에 계속 바뀌므로 한 칸 되돌린 뒤 다시 이어 붙입니다.
+                if new.index[0] == self.index[-1]:
+                    self.index, self.S, self.SS = self.index[:-1], self.S[:-1], self.SS[:-1]
+            else:
+                new = returns
+            if new.empty: return 0
+            X = new[self.columns].to_numpy(dtype=float)
+            S_new = self.S[-1] + np.cumsum(X, axis=0)
+            SS_new = self.SS[-1] + np.cumsum(X[:, :, None] * X[:, None, :], axis=0)
+            self.S = np.vstack([self.S, S_new])
+            self.SS = np.concatenate([self.SS, SS_new])
+            self.index = self.index.append(new.index)
+            self.version += 1
+            self._memo = {}
+            return len(new)
+
+    def stats(self, w):
+        # 모든 시점의 w일 평균/공분산을 한 번에: (날짜, 평균[n,k], 공분산[n,k,k])
+        with self._lock:
+            if w in self._memo: return self._memo[w]
+            if len(self.index) < w: return None
+            mean = (self.S[w:] - self.S[:-w]) / w
+            cov = ((self.SS[w:] - self.SS[:-w]) / w - mean[:, :, None] * mean[:, None, :]) * w / (w - 1)
+            self._memo[w] = (self.index[w - 1:], mean, cov)
+            return self._memo[w]
+
+    def corr(self, w, a, b):
+        idx, _, cov = self.stats(w)
+        i, j = self.columns.index(a), self.columns.index(b)
+        return pd.Series(cov[:, i, j] / np.sqrt(cov[:, i, i] * cov[:, j, j]), index=idx)
+
+    def beta(self, w, a, on):
+        idx, _, cov = self.stats(w)
+        i, j = self.columns.index(a), self.columns.index(on)
+        return pd.Series(cov[:, i, j] / cov[:, j, j], index=idx)
+
+    def vol(self, w, a):
+        idx, _, cov = self.stats(w)
+        i = self.columns.index(a)
+        return pd.Series(np.sqrt(np.clip(cov[:, i, i], 0, None) * 252) * 100, index=idx)
+
+    def corr_matrix(self, w):
+        _, _, cov = self.stats(w)
+        d = np.sqrt(np.diag(cov[-1]))
+        return pd.DataFrame(cov[-1] / np.outer(d, d), index=self.columns, columns=self.columns)
+
+@st.cache_resource(show_spinner=False)
+def get_rolling_kernel():
+    return RollingMoments(list(ANALYTICS_ASSETS))
+
+def refresh_rolling_kernel():
+    # 캐시된 히스토리에서 새로 생긴 봉만 커널에 반영 (10년치 재계산 없음)
+    kernel = get_rolling_kernel()
+    rets = without_failures(load_asset_returns, asset_epochs(), default=pd.DataFrame())
+    if not rets.empty: kernel.extend(rets)
+    return kernel
+
+def classify_vol_regime(vol):
+    conds = [vol < th for th, _ in VOL_REGIMES]
+    return pd.Series(np.select(conds, [name for _, name in VOL_REGIMES], default="위기"), index=vol.index).where(vol.notna())
+
+# -----------------------------------------------------------------------------
+# 3-6. 신호등 규칙
+# -----------------------------------------------------------------------------
+# 🚦 1. 신호등 로직 추가
+# 💡 규칙은 배열 단위로 한 번에 평가합니다. (오늘 값 1개든 10년치 Series든 같은 함수)
+def traffic_light_series(topic, val1, val2=None):
+    v1 = np.asarray(val1 if val1 is not None else np.nan, dtype=float)
+    v2 = np.asarray(val2 if val2 is not None else np.nan, dtype=float)
+    if topic == "금융 시장":
+        danger, warn = (v1 >= 4.5) | (v2 >= 1400), (v1 >= 4.0) | (v2 >= 1350)
+    elif topic == "물가 지표":
+        danger, warn = (v1 >= 4.0) | (v2 >= 4.0), (v1 >= 3.0) | (v2 >= 3.0)
+    elif topic == "고용 지표":
+        danger, warn = v2 >= 5.0, v2 >= 4.0
+    elif topic == "VIX":
+        danger, warn = v1 >= 30, v1 >= 20
+    elif topic == "RSI":
+        danger, warn = (v1 >= 70) | (v1 <= 30), (v1 >= 60) | (v1 <= 40)
+    elif topic == "종합":
+        danger, warn = (v1 >= 30) | (v2 >= 70) | (v2 <= 30), (v1 >= 20) | (v2 >= 60) | (v2 <= 40)
+    else:
+        danger = warn = np.zeros(np.broadcast(v1, v2).shape, dtype=bool)
+    return np.select([danger, warn], ["위험", "경계"], default="안정")
+
+def get_traffic_light_status(topic, val1, val2=None):
+    try: return str(traffic_light_series(topic, val1, val2).item())
+    except: pass
+    return "안정"
+
+# -----------------------------------------------------------------------------
+# 3-7. 시장 지도 동결 금고 (매일 6:40 KST 꼬리표)
+# -----------------------------------------------------------------------------
+SECTOR_ETFS = {'XLK': '기술', 'XLV': '헬스케어', 'XLF': '금융', 'XLY': '임의소비재', 'XLP': '필수소비재', 'XLE': '에너지', 'XLI': '산업재', 'XLU': '유틸리티', 'XLRE': '부동산', 'XLB': '소재', 'XLC': '통신'}
+
+@st.cache_data(ttl=86400, show_spinner=False)
+@shared("market_map", ttl=86400, accept=non_empty)
+def get_frozen_market_map(key):
+    snap = read_snapshot_object("market_map", key)
+    if snap is not None: return snap
+    res = []
+    for t, n in SECTOR_ETFS.items():
+        try:
+            # 안전하게 5일 치를 가져와서 가장 마지막 거래일 2개를 비교 (휴장일/주말 방어)
+            d = yf.Ticker(t).history(period="5d") 
+            if len(d) >= 2:
+                c = (d['Close'].iloc[-1] - d['Close'].iloc[-2]) / d['Close'].iloc[-2] * 100
+                res.append({'Sector': n, 'Change': c})
+        except:
+            pass
+    return res
+
+# 💡 S&P 500 전 종목 지도도 같은 6:40 꼬리표로 동결합니다. (가격은 100개씩 배치 수집)
+def get_frozen_constituent_map(key):
+    # 위키백과/야후가 잠깐 실패해도 하루 종일 빈 지도로 굳지 않게, 실패는 캐시하지 않습니다.
+    return without_failures(fetch_constituent_map, key, default=pd.DataFrame())
+
+@st.cache_data(ttl=86400, show_spinner=False)
+@shared("constituent_map", ttl=86400, lease=300, accept=non_empty)
+def fetch_constituent_map(key):
+    snap = read_snapshot_object("constituent_map", key)
+    if snap is not None: return snap
+    members = get_sp500_constituents()
+    closes = download_closes(members['Ticker'].tolist(), period="5d")
+    nodes = build_constituent_map(members, closes)
+    if nodes.empty: raise FetchFailed("constituent_map: 종가 없음")
+    return nodes
+
+# -----------------------------------------------------------------------------
+# 3-8. VIP 데일리 리포트 (6:40 KST 꼬리표당 1회 생성)
+# -----------------------------------------------------------------------------
+# 💡 API 키는 캐시 키에서 뺍니다. -> 어느 복제본, 어느 키로 불러도 같은 6:40 꼬리표면 같은 리포트 1개
+@st.cache_data(ttl=86400, show_spinner=False)
+@shared("vip_report", ttl=86400, lease=300, key=lambda key, api_key_val: (key,), accept=bool)
+def get_daily_vip_report(key, api_key_val):
+    # 💡 스냅샷에 오늘자(같은 6:40 꼬리표) 리포트가 있으면 OpenAI를 다시 부르지 않습니다.
+    snap = read_snapshot_object("vip_report", key)
+    if snap is not None: return snap
+    client = openai.OpenAI(api_key=api_key_val, timeout=AI_TIMEOUT_SEC, max_retries=0)
+    
+    rate_val, _, _, _ = get_interest_rate_hybrid()
+    exch_val, _, _, _ = get_yahoo_data("KRW=X", "10y")
+    vix_val, _, _, _ = get_yahoo_data("^VIX")
+    rsi_val = get_derived_value("S&P 500 RSI")
+    
+    rate_str = f"{rate_val:.2f}%" if rate_val else "데이터 없음"
+    exch_str = f"{exch_val:,.2f}원" if exch_val else "데이터 없음"
+    vix_str = f"{vix_val:.2f}" if vix_val else "데이터 없음"
+    rsi_str = f"{rsi_val:.2f}" if rsi_val else "데이터 없음"
+    
+    live_data_str = f"미국 10년물 금리: {rate_str}, 원/달러 환율: {exch_str}, VIX: {vix_str}, S&P500 RSI: {rsi_str}"
+    # 💡 통합 패널에서 지수/물가/고용까지 같은 날짜 기준으로 한 번에 붙여 줍니다. (월간 지표는 발표 시점 기준)
+    panel_str = describe_panel_row(get_macro_panel(key))
+    if panel_str: live_data_str += f" / 매크로 패널: {panel_str}"
+    risk_str = describe_risk(["S&P 500", "코스피", "미국 10년물 금리", "원/달러 환율"])
+    if risk_str: live_data_str += f" / 위험 통계: {risk_str}"
+    quality_str = describe_quality(["S&P 500", "코스피", "미국 10년물 금리", "원/달러 환율"])
+    if quality_str: live_data_str += f" / 데이터 품질 주의: {quality_str}"
+    
+    # 💡 프롬프트 수정: 4번 유망 섹터에 '투자 관점' 3줄 포맷 지시 추가
+    vip_prompt = f"""당신은 월스트리트 수석 펀드매니저입니다.
+현재 수집된 실시간 시장 데이터({live_data_str})를 기반으로 투자 판단을 위한 '데일리 모닝 브리핑'을 작성하세요.
+
+[제약 조건]
+- 공시, 증시 심리, 개별 특정 종목(티커) 언급 절대 금지.
+- 기호(▲, ▼, ->, ↳ 등) 및 이모지 절대 사용 금지. (단, 투자 관점 줄의 '→' 기호는 허용)
+- 문체: "~로 판단됩니다", "~가능성이 존재합니다", "~압력이 확대되고 있습니다" 등 리서치 톤 유지.
+
+[1. 데이터 추출 (첫 줄)]
+아래 형식으로 현재 시장 상태를 한 줄로 출력하세요. 파이썬 파싱을 위해 대괄호 []와 파이프 | 기호를 반드시 지키세요.
+형식: [시장상태]|[핵심요인]|[미국국면]|[한국국면]|[권장현금비중]
+예시: [경계]|[금리 상승, 환율 상승, 변동성 확대]|[경기 둔화기]|[회복 지연기]|[40% 이상 확보]
+
+[2. 본문 구성] (위 줄 바로 다음부터 아래 목차 대괄호 []를 정확히 출력하세요)
+
+[핵심 매크로 지표 요약]
+숫자보다 해석을 앞세워 아래 구조로 작성하세요. 상승/위험 관련 해석은 <span style="color:#dc2626; font-weight:bold;">, 하락/안전은 <span style="color:#16a34a; font-weight:bold;">, 중립은 <span style="color:#6b7280; font-weight:bold;"> 태그로 감싸세요.
+금리: <span style="color:#dc2626; font-weight:bold;">상승 압력 유지</span> ({rate_str})
+환율: <span style="color:#dc2626; font-weight:bold;">달러 강세 지속</span> ({exch_str})
+VIX: <span style="color:#6b7280; font-weight:bold;">변동성 확대 경계</span> ({vix_str})
+RSI: <span style="color:#16a34a; font-weight:bold;">과매도 근접</span> ({rsi_str})
+종합 판단: 현재 시장은 단기 변동성 확대 가능성이 높은 구간으로 판단됩니다.
+
+[1. 글로벌 거시경제 및 국면 분석]
+미국 국면과 한국 국면 판정 이유를 거시적 근거를 들어 3~4줄 문단으로 설명하세요.
+
+[2. 리스크 방어 및 현금 비중 전략]
+현금 비중 확대 근거를 아래와 같이 구조화하여 번호 매기기로 출력하고, 그 아래에 설명 문단을 추가하세요.
+현금 비중 확대 근거
+1. 금리 상승 지속
+2. 환율 변동성 확대
+3. 지정학 리스크 증가
+(이하 설명 문단...)
+
+[3. 지표 기반 투자 전략]
+실제 데이터 흐름과 연결된 구체적이고 짧은 실행형 전략(예: 비중 축소 권고, 비중 확대 검토 등 행동 지시형 문장)을 불릿(•) 3개로 제시하세요. 특수문자 화살표는 쓰지 마세요.
+예시:
+• 고금리 환경 지속 국면, 성장주 비중 축소 권고
+• 변동성 확대 구간 대비 현금 비중 유지 및 단기 대응 전략 병행
+
+[4. 유망 섹터 및 근거]
+특정 섹터(수출주, 방산 등)를 미리 고정해서 반복 추천하지 마세요. 반드시 당일 분석한 '매크로 조건(금리, 환율, 변동성 등)'을 우선적으로 해석한 뒤, '한국 주식시장' 기준으로 그 매크로 환경에서 상대적으로 설명력이 높거나 수혜/방어가 가능한 섹터 3가지를 매일 유동적으로 도출하세요. 
+각 항목은 아래와 같이 총 3줄로 정확히 줄바꿈하여 출력하세요.
+첫째 줄: '섹터명'을 <b>태그로 감싸서 출력
+둘째 줄: 왜 이 환경에서 이 섹터를 봐야 하는지 설명하는 관찰형 1문장
+셋째 줄: '→ 투자 관점: '으로 시작하는 행동 지시형 1문장
+예시:
+<b>고배당 및 방어주</b>
+금리 상승 압력이 지속되는 구간에서는 안정적인 현금흐름과 배당 매력이 부각될 가능성이 존재합니다.
+→ 투자 관점: 포트폴리오 내 비중 확대 고려
+<b>조선 및 피팅 업종</b>
+원화 약세 국면이 맞물려 환차익 수혜 및 실적 방어 기대감이 커질 수 있습니다.
+→ 투자 관점: 환율 상승 구간에서 방어적 대안으로 유효
+"""
+    resp = client.chat.completions.create(
+        model=AI_MODEL, 
+        messages=[{"role": "user", "content": vip_prompt}],
+        temperature=0.1 
+    )
+    return resp.choices[0].message.content.strip()
+
+def split_vip_report(raw):
+    # 첫 줄 "[시장상태]|[핵심요인]|[미국국면]|[한국국면]|[권장현금비중]" -> (필드 5개, 나머지 본문). 형식이 다르면 (None, 원문)
+    lines = raw.split('\n')
+    if '|' in lines[0] and '[' in lines[0]:
+        fields = re.findall(r'\[(.*?)\]', lines[0])
+        if len(fields) >= 5: return fields[:5], '\n'.join(lines[1:]).strip()
+    return None, raw
+
+def vip_report_sections(body):
+    # 본문 -> {목차 제목: 내용} ([핵심 매크로 지표 요약], [1. ...] ~ [4. ...])
+    parts = re.split(r'\[(핵심 매크로 지표 요약|[1-4]\.\s*[^\]]+)\]', body)
+    if len(parts) < 3: return {'본문': body}
+    return {parts[i].strip(): parts[i + 1].strip() for i in range(1, len(parts), 2)}
+
+# -----------------------------------------------------------------------------
+# 3-9. 스냅샷 번들 읽기 (snapshot.py 가 만든 Parquet + JSON 번들)
+# -----------------------------------------------------------------------------
+# 번들 구조: snapshots/<생성시각>/meta.json + series/*.parquet + objects/*  /  snapshots/LATEST = 최신 번들 이름
+SNAPSHOT_DIR = os.environ.get("MARKET_LOGIC_SNAPSHOT_DIR", os.path.join(BASE_DIR, "snapshots"))
+SNAPSHOT_SCHEMA = 1
+SNAPSHOT_READS = os.environ.get("MARKET_LOGIC_SNAPSHOT_READS", "1") != "0" # snapshot.py 는 끄고 실행
+SNAPSHOT_YAHOO = ["^DJI", "^GSPC", "^IXIC", "^KS11", "^KQ11", "^VIX", "^TNX", "KRW=X"]
+SNAPSHOT_FRED = [("CPIAUCSL", "yoy"), ("CPILFESL", "yoy"), ("PAYEMS", "diff"), ("UNRATE", "raw"), ("DGS10", "raw")]
+PERIOD_OFFSETS = {"10y": pd.DateOffset(years=10), "6mo": pd.DateOffset(months=6), "1y": pd.DateOffset(years=1)}
+
+def summarize_series(df):
+    # (Date, Value) 데이터 -> get_yahoo_data / get_fred_data 와 같은 (현재값, 변화, 변화율, 데이터) 형태
+    if df is None or len(df) < 2: return None, None, None, None
+    curr = float(df['Value'].iloc[-1])
+    prev = float(df['Value'].iloc[-2])
+    change = curr - prev
+    pct_change = (change / prev) * 100 if prev != 0 else 0
+    return curr, change, pct_change, df
+
+@st.cache_resource(show_spinner=False)
+def open_snapshot(name):
+    # 💡 번들 하나를 프로세스당 한 번만 엽니다. Parquet은 memory_map 으로 읽어 디스크 페이지를 그대로 씁니다.
+    root = os.path.join(SNAPSHOT_DIR, name)
+    try:
+        with open(os.path.join(root, "meta.json"), encoding="utf-8") as f: meta = json.load(f)
+        if meta.get("schema") != SNAPSHOT_SCHEMA: return None
+        frames = {k: pd.read_parquet(os.path.join(root, v['file']), engine="pyarrow", memory_map=True) for k, v in meta['series'].items()}
+        objects = {}
+        for k, v in meta['objects'].items():
+            path = os.path.join(root, v['file'])
+            if v['file'].endswith(".parquet"): objects[k] = pd.read_parquet(path, engine="pyarrow", memory_map=True)
+            else:
+                with open(path, encoding="utf-8") as f: objects[k] = json.load(f) if v['file'].endswith(".json") else f.read()
+        return {"meta": meta, "frames": frames, "objects": objects}
+    except Exception:
+        return None
+
+def load_snapshot():
+    if not SNAPSHOT_READS: return None
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, "LATEST"), encoding="utf-8") as f: name = f.read().strip()
+    except OSError:
+        return None
+    return open_snapshot(name) if name else None
+
+def read_snapshot_series(key, epoch, period=None):
+    # 스냅샷의 epoch 가 지금 epoch 와 같을 때만 사용 (그 사이 새 데이터가 생겼을 수 있으면 무시)
+    snap = load_snapshot()
+    entry = snap['meta']['series'].get(key) if snap else None
+    if entry is None or entry['epoch'] != epoch: return None
+    df = snap['frames'][key]
+    if period and period != entry.get('period'):
+        if period not in PERIOD_OFFSETS: return None
+        df = df[df['Date'] >= df['Date'].max() - PERIOD_OFFSETS[period]].reset_index(drop=True)
+    return df.copy()
+
+def read_snapshot_object(name, freeze_key):
+    snap = load_snapshot()
+    entry = snap['meta']['objects'].get(name) if snap else None
+    if entry is None or entry.get('freeze_key') != freeze_key: return None
+    obj = snap['objects'][name]
+    return obj.copy() if isinstance(obj, (pd.DataFrame, list)) else obj
+
+# -----------------------------------------------------------------------------
+# 3-10. AI 섹션 분석 + 작업 큐
+# -----------------------------------------------------------------------------
+AI_MODEL = "gpt-4o"
+AI_TIMEOUT_SEC = 90 # 대기 + 생성 합계 제한 시간
+
+def build_analysis_prompt(topic, data_summary):
+    # 💡 주제별 위험 통계(3-12)를 같은 출처에서 붙입니다. -> 미리 생성한 분석과 즉석 분석의 입력이 같아집니다.
+    risk = describe_risk(TOPIC_RISK_SERIES.get(topic, []))
+    if risk: data_summary = f"{data_summary} / 위험 통계: {risk}"
+    quality = describe_quality(TOPIC_RISK_SERIES.get(topic, []))
+    if quality: data_summary = f"{data_summary} / 데이터 품질 주의: {quality}"
+    return f"""당신은 전설적인 투자자 '버나드 바루크'의 철학(세계경제지표의 비밀)을 계승한 탑클래스 펀드매니저입니다.
+주제: {topic}
+데이터: {data_summary}
+
+[중요 지침]
+1. 이모지(아이콘)와 볼드체(**)를 절대 사용하지 마세요. 오직 텍스트만 사용하세요.
+2. 각 항목은 정확히 2문장으로만 아주 간결하고 냉철하게 작성하세요.
+3. 아래의 대괄호 '[목차명]'을 반드시 그대로 출력하세요.
+4. 모든 문장은 VIP 고객에게 브리핑하듯 정중한 존댓말(~입니다, ~습니다)로 작성하세요.
+
+[핵심 요약]
+현재 데이터를 바탕으로 시장의 전체적인 국면과 포지션 방향을 2문장으로 요약하세요.
+
+[시장의 이면]
+이 지표가 숨기고 있는 대중의 심리와 경제의 진짜 상황을 바루크의 관점에서 2문장으로 꿰뚫어보세요.
+
+[자금의 이동 경로]
+현재 지표의 결과로 인해 스마트머니(거대 자본)가 주식, 금리, 환율 중 어디로 어떻게 이동하고 있는지 2문장으로 추적하세요.
+
+[리스크와 기회]
+현재 국면에서 가장 취약한 섹터(리스크)와 자금이 몰릴 유망 자산(기회)을 2문장으로 명확히 구분하여 제시하세요.
+
+[행동 지침]
+향후 1~3개월 시나리오에 대비해 투자자가 지금 당장 실행해야 할 구체적인 행동을 2문장으로 지시하세요.
+"""
+
+def run_market_analysis(api_key_val, topic, data_summary, timeout=AI_TIMEOUT_SEC):
+    # 작업 큐의 작업자 스레드에서 실행됩니다. 실패는 예외로 올려서 '실패' 상태가 되게 합니다. (횟수 차감 없음)
+    client = openai.OpenAI(api_key=api_key_val, timeout=timeout, max_retries=0)
+    resp = client.chat.completions.create(model=AI_MODEL, messages=[{"role": "user", "content": build_analysis_prompt(topic, data_summary)}])
+    return "AI 펀드매니저 리포트", resp.choices[0].message.content
+
+def vip_report_job(key, api_key_val, timeout=None):
+    # 리포트 자체의 제한 시간은 get_daily_vip_report 의 클라이언트(AI_TIMEOUT_SEC)가 지킵니다. (캐시 키를 흔들지 않도록)
+    return get_daily_vip_report(key, api_key_val)
+
+# 💡 프로세스당 작업자 스레드 묶음 1개. 작업자 수 = 동시에 나갈 수 있는 gpt-4o 요청 수
+@st.cache_resource(show_spinner=False)
+def get_ai_queue():
+    return AIJobQueue(workers=int(get_secret("ai_workers", 4)), max_pending=int(get_secret("ai_queue_size", 32)), timeout=AI_TIMEOUT_SEC)
+
+# -----------------------------------------------------------------------------
+# 3-11. AI 섹션 분석 일괄 사전 생성 (6:40 동결 직후 4개 주제를 한 번에)
+# -----------------------------------------------------------------------------
+# 💡 4개 주제는 모두 시장 전체 데이터라 누가 눌러도 입력이 같습니다. -> 동결 직후 한 번 만들어 공유 캐시에 넣고,
+# 버튼은 (6:40 꼬리표, 주제)로 꺼내 보기만 합니다. 없으면(생성 전/실패) 기존처럼 작업 큐로 바로 생성합니다.
+AI_SECTION_TOPICS = ["금융 시장", "물가 지표", "고용 지표", "현재 시장 심리"]
+AI_SECTION_TTL = 86400
+AI_BATCH_POLL_SEC = 30
+
+def topic_data_summaries():
+    # 화면(투자 지표 / 시장 심리)에서 쓰는 것과 같은 형식의 데이터 요약
+    rate_val = get_interest_rate_hybrid()[0]
+    exch_val = get_yahoo_data("KRW=X", "10y")[0]
+    cpi_val = get_fred_data("CPIAUCSL", "yoy")[0]
+    core_val = get_fred_data("CPILFESL", "yoy")[0]
+    job_val = get_fred_data("PAYEMS", "diff")[0]
+    unemp_val = get_fred_data("UNRATE", "raw")[0]
+    vix_curr = get_yahoo_data("^VIX")[0]
+    rsi_sp = get_derived_value("S&P 500 RSI")
+    rsi_ks = get_derived_value("코스피 RSI")
+    return {
+        "금융 시장": f"금리: {rate_val}%, 환율: {exch_val}원",
+        "물가 지표": f"헤드라인CPI: {cpi_val}%, 근원CPI: {core_val}%",
+        "고용 지표": f"비농업: {job_val}k, 실업률: {unemp_val}%",
+        "현재 시장 심리": f"VIX: {vix_curr}, S&P RSI: {rsi_sp}, 코스피 RSI: {rsi_ks}",
+    }
+
+def ai_section_key(freeze_key, topic):
+    return make_key("ai_section", (freeze_key, topic))
+
+def get_pregenerated_analysis(freeze_key, topic):
+    # (제목, 본문) 또는 None
+    backend = get_shared_cache()
+    if backend is None: return None
+    try:
+        found, value = backend.get(ai_section_key(freeze_key, topic))
+    except Exception:
+        return None
+    return value if found else None
+
+def store_section_results(freeze_key, results):
+    backend = get_shared_cache()
+    if backend is None: return 0
+    for topic, content in results.items():
+        backend.set(ai_section_key(freeze_key, topic), ("AI 펀드매니저 리포트", content), AI_SECTION_TTL)
+    return len(results)
+
+def local_batch(api_key_val, prompts, workers=4):
+    # 로컬 대역: Batch API 대신 같은 요청들을 작은 스레드 묶음으로 동시에 보냅니다.
+    results, errors = {}, {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futs = {pool.submit(run_market_analysis, api_key_val, topic, data): topic for topic, data in prompts.items()}
+        for fut in concurrent.futures.as_completed(futs):
+            try: results[futs[fut]] = fut.result()[1]
+            except Exception as e: errors[futs[fut]] = str(e)
+    return results, errors
+
+def submit_openai_batch(api_key_val, prompts, freeze_key):
+    # OpenAI Batch API: 요청을 JSONL 파일 1개로 올리고 batch 1개로 제출 (24시간 창, 결과는 보통 수 분 안에)
+    client = openai.OpenAI(api_key=api_key_val)
+    lines = [json.dumps({"custom_id": f"topic-{i}", "method": "POST", "url": "/v1/chat/completions",
+                         "body": {"model": AI_MODEL, "messages": [{"role": "user", "content": build_analysis_prompt(topic, data)}]}},
+                        ensure_ascii=False) for i, (topic, data) in enumerate(prompts.items())]
+    upload = client.files.create(file=("market_logic_sections.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+    batch = client.batches.create(input_file_id=upload.id, endpoint="/v1/chat/completions", completion_window="24h",
+                                  metadata={"freeze_key": freeze_key})
+    return batch.id
+
+def collect_openai_batch(api_key_val, batch_id, topics):
+    # 완료 전이면 None, 완료면 (결과, 오류)
+    client = openai.OpenAI(api_key=api_key_val)
+    batch = client.batches.retrieve(batch_id)
+    if batch.status in ("validating", "in_progress", "finalizing"): return None
+    results, errors = {}, {}
+    if batch.status != "completed" or not batch.output_file_id:
+        return results, {t: f"batch {batch.status}" for t in topics}
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        row = json.loads(line)
+        topic = topics[int(row['custom_id'].split("-")[1])]
+        body = (row.get('response') or {}).get('body') or {}
+        if row.get('error') or not body.get('choices'): errors[topic] = str(row.get('error') or body)
+        else: results[topic] = body['choices'][0]['message']['content']
+    return results, errors
+
+def pregenerate_section_analyses(api_key_val, mode="batch", wait=1800, freeze_key=None):
+    """오늘(6:40 꼬리표) 4개 주제 분석을 만들어 공유 캐시에 넣습니다. snapshot.py pregen 이 부릅니다.
+
+    mode="batch": Batch API 로 제출하고 최대 wait 초까지 기다림. 끝나지 않으면 batch id 를 공유 캐시에 남겨
+                  다음 실행이 다시 제출하지 않고 결과만 거둬 갑니다.
+    mode="local": 같은 프롬프트를 바로 동시 호출 (로컬 대역)
+    반환: {"stored": 저장한 주제 수, "pending": 아직 안 끝난 batch id 또는 None, "errors": {주제: 오류}}
+    """
+    freeze_key = freeze_key or get_freeze_key()
+    todo = [t for t in AI_SECTION_TOPICS if get_pregenerated_analysis(freeze_key, t) is None]
+    if not todo: return {"stored": 0, "pending": None, "errors": {}}
+    if mode == "local":
+        summaries = topic_data_summaries()
+        results, errors = local_batch(api_key_val, {t: summaries[t] for t in todo})
+        return {"stored": store_section_results(freeze_key, results), "pending": None, "errors": errors}
+
+    backend = get_shared_cache()
+    batch_key = make_key("ai_batch", (freeze_key,))
+    found, pending = backend.get(batch_key) if backend else (False, None)
+    if found and pending:
+        batch_id, topics = pending
+    else:
+        summaries = topic_data_summaries()
+        topics = todo
+        batch_id = submit_openai_batch(api_key_val, {t: summaries[t] for t in topics}, freeze_key)
+        if backend: backend.set(batch_key, (batch_id, topics), AI_SECTION_TTL)
+    deadline = time.time() + wait
+    while True:
+        done = collect_openai_batch(api_key_val, batch_id, topics)
+        if done is not None: break
+        if time.time() + AI_BATCH_POLL_SEC > deadline: return {"stored": 0, "pending": batch_id, "errors": {}}
+        time.sleep(AI_BATCH_POLL_SEC)
+    results, errors = done
+    if backend: backend.set(batch_key, None, 1) # 끝난 batch 표시 제거 (실패한 주제는 다음 실행 때 새 batch 로)
+    return {"stored": store_section_results(freeze_key, results), "pending": None, "errors": errors}
+
+# -----------------------------------------------------------------------------
+# 3-12. 시리즈별 위험 통계 (실현 변동성, 고점 대비 낙폭, 52주 위치, z-score)
+# -----------------------------------------------------------------------------
+# 💡 이름은 indicator_meta / 통합 패널과 같은 한글 이름. kind: price(로그 수익률, 낙폭 계산) / level(수준 변화 %p)
+# ppy: 1년 관측 수 (일간 252, 월간 12) -> z-score 창과 52주 범위 창, vol_w: 실현 변동성 창
+RISK_SERIES = {
+    "다우존스": {"src": ("yahoo", "^DJI"), "kind": "price", "ppy": 252, "vol_w": 20},
+    "S&P 500": {"src": ("yahoo", "^GSPC"), "kind": "price", "ppy": 252, "vol_w": 20},
+    "나스닥 100": {"src": ("yahoo", "^IXIC"), "kind": "price", "ppy": 252, "vol_w": 20},
+    "코스피": {"src": ("yahoo", "^KS11"), "kind": "price", "ppy": 252, "vol_w": 20},
+    "코스닥": {"src": ("yahoo", "^KQ11"), "kind": "price", "ppy": 252, "vol_w": 20},
+    "미국 10년물 금리": {"src": ("yahoo", "^TNX"), "kind": "level", "ppy": 252, "vol_w": 20},
+    "원/달러 환율": {"src": ("yahoo", "KRW=X"), "kind": "price", "ppy": 252, "vol_w": 20},
+    "헤드라인 CPI": {"src": ("fred", "CPIAUCSL", "yoy"), "kind": "level", "ppy": 12, "vol_w": 12},
+    "근원(Core) CPI": {"src": ("fred", "CPILFESL", "yoy"), "kind": "level", "ppy": 12, "vol_w": 12},
+    "실업률": {"src": ("fred", "UNRATE", "raw"), "kind": "level", "ppy": 12, "vol_w": 12},
+}
+# AI 주제별로 프롬프트에 붙일 위험 통계
+TOPIC_RISK_SERIES = {
+    "금융 시장": ["미국 10년물 금리", "원/달러 환율"],
+    "물가 지표": ["헤드라인 CPI", "근원(Core) CPI"],
+    "고용 지표": ["실업률"],
+    "현재 시장 심리": ["S&P 500", "코스피"],
+}
+
+class RiskKernel:
+    """시리즈 1개의 누적합(값, 값^2, 수익률, 수익률^2) + 누적 고점/최대 낙폭을 들고 있다가 새 관측치만 이어 붙이는 커널.
+    최신 통계는 버전(version)마다 한 번만 계산해 둡니다."""
+    def __init__(self, kind, ppy, vol_w):
+        self.kind, self.ppy, self.vol_w = kind, ppy, vol_w
+        self.dates = pd.DatetimeIndex([])
+        self.values = np.empty(0)
+        self.S = np.zeros((1, 4))       # 0행 = 0 (prefix sum) / 열: 값, 값^2, 수익률, 수익률^2
+        self.peak = np.empty(0)         # 누적 고점
+        self.worst = np.empty(0)        # 누적 최대 낙폭(%)
+        self.version = 0
+        self.source_sig = None
+        self._memo = None
+        self._lock = threading.Lock()
+
+    def returns(self, prev, vals):
+        chain = np.concatenate([[prev], vals]) if prev is not None else np.concatenate([[vals[0]], vals])
+        r = np.diff(np.log(chain)) if self.kind == "price" else np.diff(chain)
+        return np.nan_to_num(r)
+
+    def extend(self, df):
+        if df is None or df.empty: return 0
+        sig = (len(df), df['Date'].iloc[-1], float(df['Value'].iloc[-1]))
+        with self._lock:
+            if sig == self.source_sig: return 0 # 원천이 그대로면 아무것도 안 함
+            self.source_sig = sig
+            new = df[df['Date'] >= self.dates[-1]] if len(self.dates) else df
+            # 💡 마지막 관측치는 장중에 바뀌므로 한 칸 되돌린 뒤 다시 이어 붙입니다. (RollingMoments 와 같은 방식)
+            if len(self.dates) and len(new) and new['Date'].iloc[0] == self.dates[-1]:
+                self.dates, self.values = self.dates[:-1], self.values[:-1]
+                self.S, self.peak, self.worst = self.S[:-1], self.peak[:-1], self.worst[:-1]
+            if new.empty: return 0
+            vals = new['Value'].to_numpy(dtype=float)
+            r = self.returns(self.values[-1] if len(self.values) else None, vals)
+            X = np.column_stack([vals, vals ** 2, r, r ** 2])
+            self.S = np.vstack([self.S, self.S[-1] + np.cumsum(X, axis=0)])
+            prev_peak = self.peak[-1] if len(self.peak) else -np.inf
+            peak = np.maximum.accumulate(np.concatenate([[prev_peak], vals]))[1:]
+            dd = (vals / peak - 1) * 100 if self.kind == "price" else vals - peak
+            prev_worst = self.worst[-1] if len(self.worst) else 0.0
+            self.peak = np.concatenate([self.peak, peak])
+            self.worst = np.concatenate([self.worst, np.minimum.accumulate(np.concatenate([[prev_worst], dd]))[1:]])
+            self.values = np.concatenate([self.values, vals])
+            self.dates = self.dates.append(pd.DatetimeIndex(new['Date']))
+            self.version += 1
+            self._memo = None
+            return len(new)
+
+    def window(self, col, w):
+        # 최근 w개의 평균/표준편차 (누적합 차이 한 번)
+        n = len(self.values)
+        s1 = self.S[n, col] - self.S[n - w, col]
+        s2 = self.S[n, col + 1] - self.S[n - w, col + 1]
+        mean = s1 / w
+        var = max((s2 / w - mean ** 2) * w / (w - 1), 0.0)
+        return mean, np.sqrt(var)
+
+    def latest(self):
+        with self._lock:
+            if self._memo is not None: return self._memo
+            n = len(self.values)
+            if n < 3: return None
+            v = self.values[-1]
+            w = min(self.ppy, n)
+            mean, std = self.window(0, w)
+            recent = self.values[-w:]
+            lo, hi = recent.min(), recent.max()
+            vol = None
+            if n > self.vol_w:
+                _, r_std = self.window(2, self.vol_w)
+                vol = r_std * np.sqrt(self.ppy) * (100 if self.kind == "price" else 1)
+            dd = (v / self.peak[-1] - 1) * 100 if self.kind == "price" else v - self.peak[-1]
+            self._memo = {
+                "asof": self.dates[-1], "version": self.version, "kind": self.kind,
+                "vol": vol,                                            # price: 연율화 %, level: 연율화 %p
+                "drawdown": dd,                                        # 고점 대비 (price: %, level: %p)
+                "max_drawdown": self.worst[-1],
+                "range_pos": (v - lo) / (hi - lo) * 100 if hi > lo else 50.0, # 52주(1년) 범위 안 위치 0~100
+                "zscore": (v - mean) / std if std > 0 else 0.0,        # 1년 평균 대비
+            }
+            return self._memo
+
+@st.cache_resource(show_spinner=False)
+def get_risk_kernels():
+    return {name: RiskKernel(spec['kind'], spec['ppy'], spec['vol_w']) for name, spec in RISK_SERIES.items()}
+
+def load_risk_source(spec):
+    src = spec['src']
+    return get_yahoo_data(src[1])[3] if src[0] == "yahoo" else get_fred_data(src[1], src[2])[3]
+
+def get_risk_stats(name):
+    # 캐시된 히스토리에서 새로 생긴 관측치만 커널에 반영하고 최신 통계를 돌려줍니다. (모르는 이름이면 None)
+    spec = RISK_SERIES.get(name)
+    if spec is None: return None
+    kernel = get_risk_kernels()[name]
+    kernel.extend(load_risk_source(spec))
+    return kernel.latest()
+
+def describe_risk(names):
+    # AI 프롬프트용 한 줄 요약
+    parts = []
+    for name in names:
+        s = get_risk_stats(name)
+        if not s: continue
+        unit = "%" if s['kind'] == "price" else "%p"
+        vol = f"연율화 변동성 {s['vol']:.1f}{unit}, " if s['vol'] is not None else ""
+        parts.append(f"{name}({vol}고점 대비 {s['drawdown']:+.1f}{unit}, 52주 범위 위치 {s['range_pos']:.0f}%, 1년 평균 대비 z {s['zscore']:+.2f})")
+    return ", ".join(parts)
+
+# -----------------------------------------------------------------------------
+# 3-13. 파생 시리즈 그래프 (원천 = 잎, yoy/diff/RSI/이평선/스프레드 = 게으른 메모 노드)
+# -----------------------------------------------------------------------------
+# 💡 노드 이름이 곧 정의입니다.
+#   잎: "fred:CPIAUCSL", "yahoo:^GSPC"  (원천 fetch 는 각자의 epoch 로 캐시)
+#   파생: "yoy(fred:CPIAUCSL)", "diff(fred:PAYEMS)", "rsi14(yahoo:^GSPC)", "ma200(yahoo:^GSPC)",
+#         "spread(fred:DGS10,yoy(fred:CPIAUCSL))"  (숫자 = 창 크기, 생략하면 기본값)
+# 노드는 처음 불릴 때 만들어지고, 부모 버전이 그대로면 계산 없이 메모를 돌려줍니다.
+# 부모가 뒤에 관측치만 붙었으면(또는 마지막 관측치만 바뀌었으면) 바뀐 날짜 + 앞쪽 lookback 칸만 다시 계산합니다.
+SERIES_OPS = {
+    # 이름: (기본 창, lookback(창) -> 앞쪽에 더 필요한 칸 수, 계산 함수)
+    "yoy": (12, lambda n: n, lambda s, n: (s / s.shift(n) - 1) * 100),
+    "pct": (1, lambda n: n, lambda s, n: (s / s.shift(n) - 1) * 100),
+    "diff": (1, lambda n: n, lambda s, n: s.diff(n)),
+    "ma": (20, lambda n: n - 1, lambda s, n: s.rolling(n).mean()),
+    "rsi": (14, lambda n: n, lambda s, n: rsi_values(s, n)),
+    # 두 번째 부모는 첫 번째 부모의 날짜축에 as-of 로 붙입니다. (일간 - 월간 스프레드)
+    "spread": (None, lambda n: 0, lambda s, other, n: s - asof_align(other, s.index)),
+}
+# 화면/프롬프트에서 이름으로 부르는 파생 지표
+DERIVED_SERIES = {
+    "S&P 500 RSI": "rsi14(yahoo:^GSPC)",
+    "코스피 RSI": "rsi14(yahoo:^KS11)",
+    "실질 금리 (10년물 - CPI)": "spread(fred:DGS10,yoy(fred:CPIAUCSL))",
+}
+
+def split_node_args(text):
+    # "a,yoy(b,c)" -> ["a", "yoy(b,c)"] (괄호 안의 쉼표는 무시)
+    parts, depth, cur = [], 0, ""
+    for ch in text:
+        if ch == "," and depth == 0:
+            parts.append(cur.strip()); cur = ""
+            continue
+        depth += (ch == "(") - (ch == ")")
+        cur += ch
+    return parts + [cur.strip()]
+
+def first_change(old, new):
+    # new 가 old 와 처음 달라지는 날짜. 앞부분이 바뀌었거나 뒤가 잘렸으면 None (= 전체 다시 계산)
+    if old is None or old.empty or new.empty: return None
+    m = min(len(old), len(new))
+    same = (old.index[:m] == new.index[:m]) & np.isclose(old.values[:m], new.values[:m], equal_nan=True)
+    i = m if same.all() else int(np.argmin(same))
+    return new.index[i] if 0 < i < len(new) else None
+
+class SeriesNode:
+    def __init__(self, name, loader=None, op=None, deps=(), window=None):
+        self.name, self.loader, self.op, self.deps, self.window = name, loader, op, list(deps), window
+        self.series = None
+        self.version = 0
+        self.sig = None          # 잎: 원천 서명 (행 수, 마지막 날짜, 마지막 값)
+        self.seen = {}           # 파생: 마지막 계산 때 본 부모 버전
+        self.log = deque(maxlen=16) # (버전, 바뀐 시작 날짜 | None)
+
+class SeriesGraph:
+    def __init__(self, loaders):
+        self.loaders = loaders # "fred" -> fn(id) -> (Date, Value) 데이터
+        self.nodes = {}
+        self.lock = threading.RLock()
+        self.counts = {"hit": 0, "tail": 0, "full": 0}
+
+    def node(self, name):
+        with self.lock:
+            if name in self.nodes: return self.nodes[name]
+            if name.endswith(")"):
+                head, args = name[:-1].split("(", 1)
+                op = head.rstrip("0123456789")
+                if op not in SERIES_OPS: raise KeyError(f"모르는 파생 연산: {name}")
+                window = int(head[len(op):]) if head[len(op):] else SERIES_OPS[op][0]
+                deps = [self.node(a).name for a in split_node_args(args)]
+                node = SeriesNode(name, op=op, deps=deps, window=window)
+            else:
+                source, _, key = name.partition(":")
+                if source not in self.loaders or not key: raise KeyError(f"모르는 원천: {name}")
+                node = SeriesNode(name, loader=lambda: self.loaders[source](key))
+            self.nodes[name] = node
+            return node
+
+    def get(self, name):
+        # 노드 이름 -> 날짜 인덱스 Series (데이터가 없으면 빈 Series)
+        with self.lock:
+            node = self.node(name)
+            leaves = list({leaf.name: leaf for leaf in self.leaves(node)}.values())
+        # 💡 원천(잎) 읽기는 잠금 밖에서 합니다. 느린 수집 하나가 다른 시리즈 읽기를 막지 않게 하고,
+        # 같은 원천을 동시에 부르는 세션들은 로더 아래 캐시의 SingleFlight 가 1회로 묶습니다. 잠금은 노드 갱신/계산에만.
+        loaded = {}
+        for leaf in leaves:
+            try: loaded[leaf.name] = to_series(leaf.loader())
+            except Exception: loaded[leaf.name] = pd.Series(dtype=float)
+        with self.lock:
+            for leaf in leaves: self.refresh_leaf(leaf, loaded[leaf.name])
+            self.evaluate(node)
+            return node.series if node.series is not None else pd.Series(dtype=float)
+
+    def leaves(self, node):
+        return [node] if node.op is None else [leaf for d in node.deps for leaf in self.leaves(self.nodes[d])]
+
+    def evaluate(self, node):
+        # 잎은 get() 에서 이미 갱신했으므로 파생 노드만 계산합니다.
+        if node.op is not None: self.refresh_derived(node)
+        return node
+
+    def commit(self, node, s, dirty):
+        node.series = s
+        node.version += 1
+        node.log.append((node.version, dirty))
+
+    def refresh_leaf(self, node, s):
+        sig = (len(s), s.index[-1], float(s.iloc[-1])) if len(s) else (0,)
+        if sig == node.sig: return # 원천 그대로 -> 아래 노드도 전부 메모 그대로
+        node.sig = sig
+        self.commit(node, s, first_change(node.series, s))
+
+    def dirty_since(self, dep, seen):
+        # 내가 마지막으로 본 버전 이후 부모가 바뀐 가장 이른 날짜 (기록이 모자라거나 전체 교체면 None)
+        changes = [d for v, d in dep.log if v > seen]
+        if not seen or len(changes) < dep.version - seen or any(d is None for d in changes): return None
+        return min(changes)
+
+    def refresh_derived(self, node):
+        deps = [self.evaluate(self.nodes[d]) for d in node.deps]
+        versions = {d.name: d.version for d in deps}
+        if versions == node.seen:
+            self.counts['hit'] += 1
+            return
+        _, lookback, fn = SERIES_OPS[node.op]
+        main, others = deps[0].series, [d.series for d in deps[1:]]
+        if main is None or main.empty or any(o is None or o.empty for o in others):
+            node.seen = versions
+            self.commit(node, pd.Series(dtype=float), None)
+            return
+        dirty = None
+        if node.series is not None and not node.series.empty:
+            marks = [self.dirty_since(d, node.seen.get(d.name, 0)) for d in deps if versions[d.name] != node.seen.get(d.name)]
+            dirty = None if any(m is None for m in marks) else min(marks)
+        if dirty is None:
+            out = fn(main, *others, node.window).dropna()
+            self.counts['full'] += 1
+        else:
+            # 💡 바뀐 날짜 앞쪽 lookback 칸까지만 잘라서 계산하고, 그 이전 결과는 그대로 둡니다.
+            start = max(int(main.index.searchsorted(dirty)) - lookback(node.window), 0)
+            part = fn(main.iloc[start:], *others, node.window)
+            out = pd.concat([node.series[node.series.index < dirty], part[part.index >= dirty].dropna()])
+            self.counts['tail'] += 1
+        node.seen = versions
+        self.commit(node, out, dirty)
+
+    def stats(self):
+        with self.lock:
+            return {**self.counts, "nodes": len(self.nodes)}
+
+@st.cache_resource(show_spinner=False)
+def get_series_graph():
+    return SeriesGraph({
+        "fred": get_fred_raw,
+        "yahoo": lambda t: get_yahoo_data(t)[3],
+    })
+
+def fred_node(series_id, calculation_type='raw'):
+    # get_fred_data 의 계산 방식 -> 그래프 노드 이름 ('raw' 는 잎 그대로)
+    leaf = f"fred:{series_id}"
+    return leaf if calculation_type == 'raw' else f"{calculation_type}({leaf})"
+
+def get_series(name):
+    return get_series_graph().get(name)
+
+def series_frame(s):
+    # 날짜 인덱스 Series -> (Date, Value) 데이터프레임 (to_series 의 반대)
+    return s.rename('Value').rename_axis('Date').reset_index()
+
+def get_derived_value(label):
+    # DERIVED_SERIES 이름 -> 최신 값 (데이터가 없으면 None)
+    s = get_series(DERIVED_SERIES[label])
+    return float(s.iloc[-1]) if len(s) else None
+
+# -----------------------------------------------------------------------------
+# 3-14. 사용자 관심 종목 (모든 세션이 함께 쓰는 일괄 수집 + 크기 제한 캐시)
+# -----------------------------------------------------------------------------
+# 💡 세션마다 티커를 따로 받지 않고, 허브 1개가 '지금 화면을 보고 있는 모든 세션'의 관심 종목을 합쳐
+# 중복 없이 yf.download 한 번(chunk 단위)으로 받습니다. 이미 다른 세션이 받는 중이면 끝날 때까지 기다렸다가 결과만 씁니다.
+# 서버에 들고 있는 종목 수는 max_symbols 로 묶고(오래 안 본 종목부터 버림), 사용자당 종목 수는 요금제별로 제한합니다.
+WATCHLIST_LIMITS = {"Free": 10, "Pro": 30}
+WATCHLIST_MAX_SYMBOLS = 300   # 서버 전체 보관 종목 수 (LRU)
+WATCHLIST_PERIOD = "3y"       # 차트 기간 버튼 최대값(3년)까지만 보관
+WATCHLIST_IDLE_SEC = 600      # 이 시간 동안 화면을 안 연 세션은 일괄 수집 대상에서 뺍니다
+WATCHLIST_RETRY_SEC = 60      # 일괄 수집 자체가 실패한 티커는 epoch 끝까지가 아니라 이만큼 뒤에 다시 받습니다
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9^][A-Z0-9.\-=^]{0,14}$")
+
+def normalize_symbols(symbols, limit=None):
+    # "aapl, 005930.ks  AAPL" -> ["AAPL", "005930.KS"] (대문자, 중복/이상한 문자열 제거, 개수 제한)
+    if isinstance(symbols, str): symbols = re.split(r"[,\s]+", symbols)
+    out = []
+    for s in symbols:
+        s = str(s).strip().upper()
+        if SYMBOL_PATTERN.match(s) and s not in out: out.append(s)
+    return out[:limit] if limit else out
+
+def parse_watchlist(cell):
+    # 구글 시트 Watchlist 칸 ("AAPL,MSFT") -> 리스트 (빈칸/NaN 이면 빈 리스트)
+    return normalize_symbols(cell) if isinstance(cell, str) else []
+
+def download_histories(tickers):
+    # 💡 야후가 답한 티커만 결과에 넣습니다. (열은 있는데 값이 없음 = 모르는 티커 -> None)
+    # 묶음(chunk) 다운로드가 실패해 열 자체가 없는 티커는 빼서, 허브가 '일시 실패'로 보고 곧 다시 받게 합니다.
+    panel = download_closes(tickers, period=WATCHLIST_PERIOD)
+    out = {}
+    for t in tickers:
+        if t not in panel.columns: continue
+        s = panel[t].dropna()
+        out[t] = series_frame(s.astype(float)) if len(s) >= 2 else None
+    return out
+
+class WatchlistHub:
+    def __init__(self, fetch, max_symbols=WATCHLIST_MAX_SYMBOLS, idle_sec=WATCHLIST_IDLE_SEC):
+        self.fetch = fetch # fn(tickers) -> {티커: (Date, Value) 데이터 | None(모르는 티커)}, 받지 못한 티커는 키에서 빠짐
+        self.max_symbols = max_symbols
+        self.idle_sec = idle_sec
+        self.entries = OrderedDict() # 티커 -> (epoch, 데이터 | None, 재시도 시각 | None). 모르는 티커는 epoch 동안 다시 안 받습니다.
+        self.sessions = {}           # 세션 id -> (티커들, 마지막으로 본 시각)
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.counts = {"cycles": 0, "fetched": 0, "failed": 0, "evicted": 0}
+
+    def watch(self, session_id, tickers):
+        now = time.time()
+        with self.lock:
+            self.sessions[session_id] = (tuple(tickers), now)
+            for sid in [k for k, (_, seen) in self.sessions.items() if now - seen > self.idle_sec]:
+                del self.sessions[sid]
+
+    def stale(self, tickers):
+        now = time.time()
+        with self.lock:
+            return [t for t in tickers if self.is_stale(self.entries.get(t), t, now)]
+
+    @staticmethod
+    def is_stale(entry, ticker, now):
+        if entry is None: return True
+        epoch, _, retry_at = entry
+        # 일시 실패한 티커는 재시도 시각까지 기다리고, 나머지는 epoch(새 종가)가 바뀌면 다시 받습니다.
+        return now >= retry_at if retry_at is not None else epoch != market_epoch(ticker)
+
+    def refresh(self, first=()):
+        with self.refresh_lock:
+            # 요청한 세션의 티커를 먼저, 나머지는 최근에 본 세션 순서로 합칩니다. (max_symbols 까지만)
+            with self.lock:
+                active = sorted(self.sessions.values(), key=lambda v: -v[1])
+            wanted = list(dict.fromkeys([*first, *(t for tickers, _ in active for t in tickers)]))[:self.max_symbols]
+            todo = self.stale(wanted)
+            if not todo: return 0 # 기다리는 동안 다른 세션이 이미 받아 둠
+            epochs = {t: market_epoch(t) for t in todo}
+            try: frames = self.fetch(todo)
+            except Exception: frames = {}
+            retry_at = time.time() + WATCHLIST_RETRY_SEC
+            with self.lock:
+                for t in todo:
+                    if t in frames: self.entries[t] = (epochs[t], frames[t], None)
+                    else:
+                        # 일시 실패: 직전 데이터가 있으면 그대로 보여 주고, 잠시 뒤 다시 받습니다.
+                        prev = self.entries.get(t)
+                        self.entries[t] = (prev[0] if prev else None, prev[1] if prev else None, retry_at)
+                        self.counts['failed'] += 1
+                    self.entries.move_to_end(t)
+                while len(self.entries) > self.max_symbols:
+                    self.entries.popitem(last=False)
+                    self.counts['evicted'] += 1
+                self.counts['cycles'] += 1
+                self.counts['fetched'] += len(todo)
+            return len(todo)
+
+    def get(self, session_id, tickers):
+        # 세션의 관심 종목 -> {티커: (현재값, 변화, 변화율, 데이터)}
+        self.watch(session_id, tickers)
+        if self.stale(tickers): self.refresh(first=tickers)
+        out = {}
+        with self.lock:
+            for t in tickers:
+                entry = self.entries.get(t)
+                if entry is not None: self.entries.move_to_end(t)
+                out[t] = summarize_series(entry[1] if entry else None)
+        return out
+
+    def stats(self):
+        with self.lock:
+            return {**self.counts, "symbols": len(self.entries), "sessions": len(self.sessions)}
+
+@st.cache_resource(show_spinner=False)
+def get_watchlist_hub():
+    return WatchlistHub(download_histories)
+
+# -----------------------------------------------------------------------------
+# 3-15. 지표 알림 (구독 규칙을 백그라운드에서 한 번에 평가, alerts.py)
+# -----------------------------------------------------------------------------
+# 💡 지표 이름 -> 최신값. 값은 화면과 같은 캐시(epoch)에서 꺼내므로 평가 주기가 짧아도 외부 호출은 늘지 않습니다.
+ALERT_METRICS = {
+    "VIX": lambda: get_yahoo_data("^VIX")[0],
+    "S&P 500 RSI": lambda: get_derived_value("S&P 500 RSI"),
+    "코스피 RSI": lambda: get_derived_value("코스피 RSI"),
+    "미국 10년물 금리": lambda: get_interest_rate_hybrid()[0],
+    "원/달러 환율": lambda: get_yahoo_data("KRW=X")[0],
+    "헤드라인 CPI": lambda: get_fred_data("CPIAUCSL", "yoy")[0],
+    "근원(Core) CPI": lambda: get_fred_data("CPILFESL", "yoy")[0],
+    "실업률": lambda: get_fred_data("UNRATE", "raw")[0],
+}
+# 신호등(3-6)과 같은 기준선을 골라 구독할 수 있는 기본 규칙
+ALERT_PRESETS = {
+    "VIX 경계 (20 이상)": ("VIX", ">=", 20), "VIX 위험 (30 이상)": ("VIX", ">=", 30),
+    "S&P 500 RSI 과열 (70 이상)": ("S&P 500 RSI", ">=", 70), "S&P 500 RSI 침체 (30 이하)": ("S&P 500 RSI", "<=", 30),
+    "10년물 금리 경계 (4.0% 이상)": ("미국 10년물 금리", ">=", 4.0), "10년물 금리 위험 (4.5% 이상)": ("미국 10년물 금리", ">=", 4.5),
+    "환율 경계 (1,350원 이상)": ("원/달러 환율", ">=", 1350), "환율 위험 (1,400원 이상)": ("원/달러 환율", ">=", 1400),
+    "CPI 경계 (3% 이상)": ("헤드라인 CPI", ">=", 3.0), "CPI 위험 (4% 이상)": ("헤드라인 CPI", ">=", 4.0),
+    "실업률 경계 (4% 이상)": ("실업률", ">=", 4.0), "실업률 위험 (5% 이상)": ("실업률", ">=", 5.0),
+}
+ALERT_DB_DEFAULT = os.path.join(BASE_DIR, ".cache", "alerts.db")
+ALERT_SINK_DEFAULT = "file://" + os.path.join(BASE_DIR, ".cache", "alerts.jsonl")
+ALERT_POLL_SEC = 300
+
+def latest_alert_values():
+    values = {}
+    for name, fn in ALERT_METRICS.items():
+        try: v = fn()
+        except Exception: v = None
+        values[name] = float(v) if v is not None else np.nan
+    return values
+
+# 구독은 이 sqlite 파일에 있으므로, 복제본이 여러 개면 alert_db 를 모두가 함께 보는 볼륨 경로로 지정해야 합니다. (alerts.py 머리말)
+@st.cache_resource(show_spinner=False)
+def get_alert_store():
+    return AlertStore(get_secret("alert_db", ALERT_DB_DEFAULT))
+
+@st.cache_resource(show_spinner=False)
+def get_alert_engine():
+    # 서버(복제본)마다 평가 스레드 1개. secrets 의 alert_worker = "off" 면 스레드 없이 snapshot.py alerts 로만 돌립니다.
+    engine = AlertEngine(get_alert_store(), open_sink(get_secret("alert_sink", ALERT_SINK_DEFAULT)),
+                         latest_alert_values, interval=int(get_secret("alert_poll_sec", ALERT_POLL_SEC)))
+    if get_secret("alert_worker", "on") != "off": engine.start()
+    return engine
+
+# -----------------------------------------------------------------------------
+# 3-16. Pro 데일리 다이제스트 (6:40 꼬리표당 1번 렌더링 -> Pro 회원 전원에게 같은 메일)
+# -----------------------------------------------------------------------------
+# 💡 VIP 리포트(3-8)와 핵심 지표는 캐시에서 꺼내 한 번만 HTML/텍스트로 만듭니다.
+# 발송(mailer.fan_out)은 수신자별로 바이트 앞에 To 한 줄만 붙이므로, 회원 수가 늘어도 렌더링 비용은 그대로입니다.
+DIGEST_SINK_DEFAULT = "file://" + os.path.join(BASE_DIR, ".cache", "digest")
+DIGEST_WORKERS = 8
+DIGEST_SENDER = "Market Logic <noreply@marketlogic.co.kr>"
+# 지표 이름 -> (신호등 주제, 값 자리 0/1) : 다이제스트 표의 상태 칸
+DIGEST_LIGHTS = {
+    "VIX": ("VIX", 0), "S&P 500 RSI": ("RSI", 0), "미국 10년물 금리": ("금융 시장", 0), "원/달러 환율": ("금융 시장", 1),
+    "헤드라인 CPI": ("물가 지표", 0), "근원(Core) CPI": ("물가 지표", 1), "실업률": ("고용 지표", 1),
+}
+DIGEST_LIGHT_COLORS = {"위험": "#dc2626", "경계": "#d97706", "안정": "#16a34a"}
+DIGEST_HTML = """<div style="font-family:-apple-system,'Apple SD Gothic Neo','Malgun Gothic',sans-serif; max-width:640px; margin:0 auto; color:#0f172a;">
+<h2 style="margin:0 0 4px; font-size:20px;">Market Logic 데일리 다이제스트</h2>
+<div style="color:#64748b; font-size:13px; margin-bottom:16px;">{asof} 기준</div>
+{headline}
+<table style="width:100%; border-collapse:collapse; font-size:14px; margin-bottom:20px;">{rows}</table>
+{sections}
+<div style="color:#94a3b8; font-size:11px; margin-top:24px; border-top:1px solid #e2e8f0; padding-top:10px;">본 메일은 Pro 멤버십 회원에게 발송됩니다. 투자 판단의 책임은 투자자 본인에게 있습니다.</div>
+</div>"""
+
+def strip_tags(text):
+    return re.sub(r"<[^>]+>", "", text)
+
+def render_daily_digest(freeze_key, api_key_val=None):
+    values = latest_alert_values()
+    report = None
+    if api_key_val:
+        try: report = get_daily_vip_report(freeze_key, api_key_val)
+        except Exception: report = None
+    fields, body = split_vip_report(report) if report else (None, "")
+
+    rows, text_rows = [], []
+    for name, v in values.items():
+        if np.isnan(v): continue
+        light = ""
+        if name in DIGEST_LIGHTS:
+            topic, slot = DIGEST_LIGHTS[name]
+            light = get_traffic_light_status(topic, *((v, None) if slot == 0 else (None, v)))
+        rows.append(f'<tr><td style="padding:6px 0; border-bottom:1px solid #f1f5f9;">{name}</td>'
+                    f'<td style="padding:6px 0; border-bottom:1px solid #f1f5f9; text-align:right; font-weight:700;">{v:,.2f}</td>'
+                    f'<td style="padding:6px 0 6px 12px; border-bottom:1px solid #f1f5f9; color:{DIGEST_LIGHT_COLORS.get(light, "#64748b")}; font-weight:700;">{light}</td></tr>')
+        text_rows.append(f"- {name}: {v:,.2f} {light}".rstrip())
+
+    headline = text_headline = ""
+    if fields:
+        headline = (f'<div style="background:#f8fafc; border:1px solid #e2e8f0; border-radius:8px; padding:12px 16px; margin-bottom:16px; font-size:14px;">'
+                    f'<b>시장 상태: {fields[0]}</b> · 핵심 요인: {fields[1]}<br>미국 {fields[2]} · 한국 {fields[3]} · 권장 현금 비중 {fields[4]}</div>')
+        text_headline = f"시장 상태: {fields[0]} / 핵심 요인: {fields[1]} / 미국 {fields[2]} / 한국 {fields[3]} / 권장 현금 비중 {fields[4]}\n\n"
+    sections = vip_report_sections(body) if body else {}
+    html_sections = "".join(f'<h3 style="font-size:15px; margin:18px 0 6px;">{title}</h3><div style="font-size:14px; line-height:1.7;">{content.replace(chr(10), "<br>")}</div>'
+                            for title, content in sections.items())
+    text_sections = "".join(f"\n[{title}]\n{strip_tags(content)}\n" for title, content in sections.items())
+
+    asof = datetime.strptime(freeze_key, "%Y-%m-%d %H:%M").strftime("%Y년 %m월 %d일 %H:%M")
+    html = DIGEST_HTML.format(asof=asof, headline=headline, rows="".join(rows), sections=html_sections)
+    text = f"Market Logic 데일리 다이제스트 ({asof} 기준)\n\n{text_headline}" + "\n".join(text_rows) + "\n" + text_sections
+    return PreparedMail(f"[Market Logic] {asof} 데일리 다이제스트", text, html, sender=get_secret("digest_sender", DIGEST_SENDER))
+
+def get_pro_recipients():
+    # 구글 시트 Users 에서 Plan 이 Pro 인 이메일 (시트 연결이 안 되면 빈 목록)
+    try:
+        from streamlit_gsheets import GSheetsConnection
+        df = st.connection("gsheets", type=GSheetsConnection).read(worksheet="Users", ttl=0)
+        return df.loc[df['Plan'] == 'Pro', 'Email'].dropna().astype(str).str.strip().unique().tolist()
+    except Exception:
+        return []
+
+def send_daily_digest(api_key_val=None, recipients=None, freeze_key=None, force=False, workers=DIGEST_WORKERS):
+    # 💡 같은 6:40 꼬리표로는 수신자마다 한 번만 보냅니다. (받은 사람 목록을 공유 캐시에 기록, 다시 돌리면 실패한 사람만)
+    freeze_key = freeze_key or get_freeze_key()
+    backend = get_shared_cache()
+    sent_key = make_key("digest_sent", (freeze_key,))
+    delivered = set()
+    if not force and backend is not None:
+        try:
+            found, prev = backend.get(sent_key)
+            if found and prev: delivered = set(prev)
+        except Exception:
+            pass
+    targets = [r for r in (get_pro_recipients() if recipients is None else recipients) if r not in delivered]
+    if not targets: return {"freeze_key": freeze_key, "recipients": 0, "sent": 0, "failed": 0, "skipped": len(delivered)}
+    mailer = open_mailer(get_secret("digest_sink", DIGEST_SINK_DEFAULT))
+    if mailer is None: raise RuntimeError("다이제스트 발송 주소(digest_sink)가 꺼져 있거나 잘못됐습니다.")
+    t0 = time.perf_counter()
+    mail = render_daily_digest(freeze_key, api_key_val)
+    render_sec = round(time.perf_counter() - t0, 3)
+    report = fan_out(mailer, mail, targets, workers=workers)
+    report.update(freeze_key=freeze_key, mail=mail.id, bytes=len(mail.body), render_sec=render_sec, skipped=len(delivered))
+    delivered |= set(targets) - set(report['errors'])
+    if backend is not None:
+        try: backend.set(sent_key, sorted(delivered), 86400 * 2)
+        except Exception: pass
+    return report
+
+# -----------------------------------------------------------------------------
+# 3-17. 사용 기록 / 감사 로그 (events.py, 쓰기는 백그라운드에서 묶어서)
+# -----------------------------------------------------------------------------
+# 💡 종류(kind): page_view(메뉴 진입), ai_call(AI 분석 완료/실패), quota_deduct(횟수 차감), upstream(외부 원천 호출 지연)
+EVENT_LOG_DIR = os.path.join(BASE_DIR, ".cache", "events")
+
+@st.cache_resource(show_spinner=False)
+def get_event_log():
+    return EventLog(get_secret("event_log_dir", EVENT_LOG_DIR))
+
+def log_event(kind, user=None, plan=None, name=None, value=None, **meta):
+    # 기록 실패가 화면 장애로 번지지 않게 예외는 삼킵니다.
+    try: get_event_log().log(kind, user, plan, name, value, **meta)
+    except Exception: pass
+
+def log_upstream(namespace, label, seconds, ok):
+    log_event("upstream", name=namespace, value=seconds, key=label, ok=bool(ok))
+
+def log_http(endpoint, seconds, status, attempt):
+    log_event("upstream", name=f"http:{endpoint}", value=seconds, status=status, retries=attempt, ok=status is not None and status < 400)
+
+def usage_report(days=14):
+    # 관리자 화면용: 요금제별 일간 AI 호출 수, 메뉴별 일간 조회 수, 원천별 지연 시간 (저장된 이벤트만 읽음)
+    log = get_event_log()
+    return {
+        "ai_calls": daily_counts(log, "ai_call", "plan", days),
+        "page_views": daily_counts(log, "page_view", "name", days),
+        "upstream": latency_summary(log, "upstream", 1),
+        "http": pd.DataFrame(get_http().stats()).T,
+        "writer": log.stats(),
+    }
+
+# -----------------------------------------------------------------------------
+# 3-18. 수집 데이터 품질 검사 (quality.py) + 격리
+# -----------------------------------------------------------------------------
+# 💡 야후/FRED 원천을 받을 때마다 캐시에 넣기 전에 검사합니다. 꼬리표는 데이터프레임 attrs['quality'] 에 붙어서
+#    st.cache_data / 공유 캐시 / 스냅샷을 거쳐도 함께 다니고, 화면 카드와 AI 프롬프트가 그대로 읽습니다.
+# 격리: 캐시 함수 안에서는 Quarantined(수집 실패)로 던져서 어떤 캐시에도 남기지 않고, 바깥(get_yahoo_data / get_fred_raw)이
+#       직전 정상본을 대신 내보냅니다. 정상본은 공유 캐시에도 저장되어 재시작한 프로세스도 같은 기준으로 검사합니다.
+QUALITY_RULES = {
+    "yahoo": {},
+    "yahoo:^DJI": {"level": (5000, None)},        # DIA(1/100 크기)로 대체된 값은 직전 정상본이 없어도 격리
+    "yahoo:^VIX": {"max_move": None},             # VIX 는 하루 +50% 도 실제로 나옵니다
+    "yahoo:^TNX": {"price": False, "max_move": None},
+    "yahoo:KRW=X": {"max_move": 0.15},
+    "yahoo:^KS11": {"stale_days": 10}, "yahoo:^KQ11": {"stale_days": 10}, # 설/추석 연휴
+    "fred": {"price": False, "max_move": None, "stale_days": 75},
+    "fred:DGS10": {"stale_days": 7},
+}
+
+class Quarantined(FetchFailed):
+    pass
+
+@st.cache_resource(show_spinner=False)
+def get_last_good():
+    return LastGood(backend=get_shared_cache(), key_fn=lambda slot: make_key("last_good", (slot,)))
+
+def quality_fallback(key, variant=""):
+    # 수집 실패/격리 때 화면에 대신 보여 줄 직전 정상본 (없으면 None)
+    try: return get_last_good().fallback(f"{key}|{variant}")
+    except Exception: return None
+
+def quality_rules(key):
+    return {**QUALITY_RULES.get(key.split(":")[0], {}), **QUALITY_RULES.get(key, {})}
+
+def quality_gate(key, df, variant="", **extra_flags):
+    # variant: 같은 원천의 다른 기간(10y/6mo 등)은 직전 정상본을 따로 둡니다.
+    last_good = get_last_good()
+    slot = f"{key}|{variant}"
+    ref = last_good.get(slot)
+    clean, q = validate_series(df, quality_rules(key), ref, **extra_flags)
+    if q['quarantined']:
+        log_event("quality", name=key, reason=q['quarantined'], detail=describe_issues(q))
+        last_good.quarantined(slot, q)
+        raise Quarantined(f"{key}: {q['quarantined']}")
+    last_good.put(slot, clean)
+    clean.attrs['quality'] = q
+    return clean
+
+def get_quality(key):
+    # "yahoo:^GSPC" / "fred:CPIAUCSL" -> 품질 꼬리표 (캐시된 데이터에서 꺼내기만 합니다)
+    source, _, ident = key.partition(":")
+    df = get_yahoo_data(ident)[3] if source == "yahoo" else get_fred_raw(ident)
+    return getattr(df, "attrs", {}).get('quality')
+
+def quality_notice(q):
+    # 화면/프롬프트에 보여줄 만한 문제만 (자동으로 고친 정렬/중복/시간대는 조용히 넘어감)
+    if not q: return ""
+    shown = {k: v for k, v in q['issues'].items() if k not in ("nan_dropped", "duplicates", "unsorted", "tz_drift")}
+    text = describe_issues({"issues": shown})
+    if q.get('quarantined'): text = "새 데이터 격리, 직전 정상본 표시" + (f" ({text})" if text else "")
+    return text
+
+def series_key(name):
+    # 지표 이름(RISK_SERIES) -> 원천 키
+    src = RISK_SERIES[name]['src']
+    return f"{src[0]}:{src[1]}"
+
+def describe_quality(names):
+    # AI 프롬프트용: 품질 문제가 있는 지표만 한 줄로 ("다우존스(마지막 관측 6일 전)")
+    parts = []
+    for name in names:
+        try: notice = quality_notice(get_quality(series_key(name) if name in RISK_SERIES else name))
+        except Exception: notice = ""
+        if notice: parts.append(f"{name}({notice})")
+    return ", ".join(parts)
+
+# -----------------------------------------------------------------------------
+# 3-19. 섹터 심리 히트맵 (섹터 ETF 전체의 RSI / 이평선 괴리 / 이평선 위 비율을 행렬 연산 한 번으로)
+# -----------------------------------------------------------------------------
+# 💡 티커별로 rsi_series/rolling 을 돌리지 않고, (날짜 x 티커) 종가 패널 하나에 누적합(cumsum) 기반 이동평균을 한 번 걸어
+# 모든 티커의 지표를 같이 구합니다. 티커를 늘려도 열이 늘어날 뿐이라 계산은 수 ms 에 끝납니다. (RSI 정의는 rsi_values 와 같음)
+KOSPI_SECTOR_ETFS = {'091160.KS': '반도체', '091170.KS': '은행', '091180.KS': '자동차', '117460.KS': '에너지화학',
+                     '117680.KS': '철강', '102970.KS': '증권', '266420.KS': '헬스케어', '117700.KS': '건설'}
+BREADTH_GROUPS = {"us": ("미국 섹터 ETF", SECTOR_ETFS), "kr": ("코스피 업종 ETF", KOSPI_SECTOR_ETFS)}
+BREADTH_MAS = (50, 200)
+BREADTH_PERIOD = "2y"   # 200일선 + 추이 구간이 들어갈 만큼
+BREADTH_HISTORY = 20    # 히트맵에 그릴 최근 거래일 수
+
+def trailing_mean(x, window):
+    # (날짜 x 티커) 배열의 열별 이동평균. 창 안에 빈 값이 하나라도 있으면 NaN (rolling(window).mean() 과 같은 규칙)
+    valid = np.isfinite(x)
+    cs = np.vstack([np.zeros((1, x.shape[1])), np.cumsum(np.where(valid, x, 0.0), axis=0)])
+    cnt = np.vstack([np.zeros((1, x.shape[1])), np.cumsum(valid, axis=0)])
+    out = np.full(x.shape, np.nan)
+    if len(x) >= window:
+        full = (cnt[window:] - cnt[:-window]) == window
+        out[window - 1:] = np.where(full, (cs[window:] - cs[:-window]) / window, np.nan)
+    return out
+
+def breadth_matrix(panel, names, rsi_window=14, mas=BREADTH_MAS, history=BREADTH_HISTORY):
+    # 종가 패널 -> 최근 history 거래일의 (Date, Ticker, Sector, RSI, MA50, MA200) 긴 표. MA 열은 이평선 대비 괴리율(%)
+    panel = panel.ffill()
+    prices = panel.to_numpy(dtype=float)
+    delta = np.diff(prices, axis=0, prepend=np.nan)
+    delta = np.where(np.isfinite(delta), delta, 0.0) # rsi_values 처럼 첫 칸/빈 칸의 변화는 0
+    gain = trailing_mean(np.maximum(delta, 0.0), rsi_window)
+    loss = trailing_mean(np.maximum(-delta, 0.0), rsi_window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cols = {"RSI": 100 - 100 / (1 + gain / loss)}
+        for w in mas: cols[f"MA{w}"] = (prices / trailing_mean(prices, w) - 1) * 100
+    rows = slice(-history, None)
+    n_days, tickers = len(panel.index[rows]), list(panel.columns)
+    out = pd.DataFrame({
+        "Date": np.repeat(panel.index[rows].to_numpy(), len(tickers)),
+        "Ticker": np.tile(tickers, n_days),
+        "Sector": np.tile([names.get(t, t) for t in tickers], n_days),
+        **{k: v[rows].ravel() for k, v in cols.items()},
+    })
+    return out.dropna(subset=["RSI"]).reset_index(drop=True)
+
+def breadth_epoch(group):
+    # 묶음 ETF 가 상장된 거래소의 장 꼬리표 (코스피 업종은 15:30 한국 장 마감, 미국 섹터는 미국 장 마감 기준으로 갱신)
+    return market_epoch(next(iter(BREADTH_GROUPS[group][1])))
+
+def get_sector_breadth(group="us"):
+    # 실패는 24시간 캐시에 남기지 않고 잠깐 뒤 다시 시도합니다.
+    return without_failures(fetch_sector_breadth, breadth_epoch(group), group, default=pd.DataFrame())
+
+@st.cache_data(ttl=86400, show_spinner=False)
+@shared("sector_breadth", ttl=86400, accept=non_empty)
+def fetch_sector_breadth(epoch, group):
+    # 장 꼬리표(epoch)당 1번: 섹터 ETF 종가를 배치로 받아 행렬 연산 한 번
+    snap = read_snapshot_object(f"sector_breadth_{group}", epoch)
+    if snap is not None: return snap
+    _, names = BREADTH_GROUPS[group]
+    try:
+        panel = download_closes(list(names), period=BREADTH_PERIOD)
+        out = breadth_matrix(panel, names) if not panel.empty else pd.DataFrame()
+    except Exception as e:
+        raise FetchFailed(f"sector_breadth:{group}: {e}")
+    if out.empty: raise FetchFailed(f"sector_breadth:{group}")
+    return out
+
+def breadth_summary(frame, mas=BREADTH_MAS):
+    # 날짜별 '이평선 위에 있는 섹터 비율(%)' + 평균 RSI (시장 폭 추이)
+    if frame is None or frame.empty: return pd.DataFrame()
+    g = frame.assign(**{f"Above{w}": (frame[f"MA{w}"] > 0).astype(float).where(frame[f"MA{w}"].notna()) for w in mas}).groupby("Date") # 이평선이 아직 없는 티커는 빼고
+    out = pd.DataFrame({f"MA{w} 위 비율": g[f"Above{w}"].mean() * 100 for w in mas})
+    out["평균 RSI"] = g["RSI"].mean()
+    return out.round(1)
+
+# -----------------------------------------------------------------------------
+# 3-20. 지수 비교 (선택한 지수를 기간 시작 = 100 으로 맞춰 한 차트에)
+# -----------------------------------------------------------------------------
+# 💡 히스토리는 get_yahoo_data 캐시에서 꺼내기만 하고, 시장 epoch 묶음당 1번만 (날짜 x 지수) 패널로 정렬합니다.
+# 기간/선택을 바꾸면 그 패널을 잘라서 첫 행으로 나누는 배열 연산 한 번뿐이고, 그 결과도 (선택, 기간)별로 메모해 둡니다.
+COMPARE_SERIES = {"다우존스": "^DJI", "S&P 500": "^GSPC", "나스닥 100": "^IXIC", "코스피": "^KS11", "코스닥": "^KQ11", "원/달러 환율": "KRW=X"}
+COMPARE_USD = {"코스피": "코스피 (USD)", "코스닥": "코스닥 (USD)"} # 원화 지수 -> 달러 환산 이름
+PERIOD_DAYS = {"1개월": 30, "3개월": 90, "6개월": 180, "1년": 365, "3년": 365 * 3, "5년": 365 * 5}
+COMPARE_FFILL_DAYS = 5 # 한국/미국 휴장일이 달라 생기는 빈칸은 최대 이만큼만 직전 값으로 채움
+
+def compare_epochs():
+    return tuple(market_epoch(t) for t in COMPARE_SERIES.values())
+
+@st.cache_data(ttl=86400, max_entries=8, show_spinner=False)
+def get_compare_panel(epochs):
+    # epochs: compare_epochs() (캐시 꼬리표 역할만). 모든 지수를 합집합 날짜축 하나에 as-of 로 정렬합니다.
+    cols = {name: to_series(get_yahoo_data(t)[3]) for name, t in COMPARE_SERIES.items()}
+    panel = pd.DataFrame({k: v for k, v in cols.items() if len(v)})
+    if panel.empty: return panel
+    panel = panel.sort_index().ffill(limit=COMPARE_FFILL_DAYS)
+    if "원/달러 환율" in panel:
+        for name, usd in COMPARE_USD.items():
+            if name in panel: panel[usd] = panel[name] / panel["원/달러 환율"]
+    return panel
+
+def rebase_panel(panel, columns, days=None):
+    # 기간 시작(선택한 지수가 모두 값이 있는 첫 날) = 100. 반환은 Altair 용 긴 표 (Date, Series, Value)
+    cols = [c for c in columns if c in panel.columns]
+    if not cols: return pd.DataFrame(columns=["Date", "Series", "Value"])
+    sub = panel[cols]
+    if days is not None: sub = sub[sub.index >= sub.index.max() - pd.Timedelta(days=days)]
+    sub = sub[sub.notna().all(axis=1).cummax()] # 모두 값이 생긴 날부터
+    if sub.empty: return pd.DataFrame(columns=["Date", "Series", "Value"])
+    rebased = sub.to_numpy(dtype=float) / sub.iloc[0].to_numpy(dtype=float) * 100
+    return pd.DataFrame({"Date": np.repeat(sub.index.to_numpy(), len(cols)), "Series": np.tile(cols, len(sub)), "Value": rebased.ravel()}).dropna()
+
+@st.cache_data(ttl=86400, max_entries=256, show_spinner=False)
+def get_index_comparison(selection, period, usd=False, epochs=None):
+    # (선택 지수 튜플, 기간, 달러 환산 여부)별 메모. epochs 가 바뀌면(새 종가) 새로 계산합니다.
+    panel = get_compare_panel(epochs or compare_epochs())
+    columns = [COMPARE_USD.get(name, name) if usd else name for name in selection]
+    return rebase_panel(panel, columns, PERIOD_DAYS.get(period))
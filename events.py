@@ -0,0 +1,130 @@
+# -----------------------------------------------------------------------------
+# Market Logic 사용 기록 / 감사 로그 (쓰기 지연: 요청 경로에서는 메모리 큐에 넣기만)
+# -----------------------------------------------------------------------------
+# 💡 화면 스레드는 log() 로 튜플 하나를 큐에 넣고 바로 돌아갑니다. 백그라운드 작성자 1개가 flush_sec 마다(또는 batch 개가 차면)
+#    모아서 sqlite 세그먼트에 한 번에 씁니다.
+# 세그먼트: root/events-YYYYmmdd-HHMMSS-<pid>-<순번>.db (프로세스마다 따로). 현재 세그먼트가 max_bytes 를 넘으면 새 파일로 넘어가고,
+#          가장 최근 max_segments 개만 남깁니다. 조회는 읽기 전용으로 열어서 작성자를 막지 않습니다.
+import os
+import glob
+import json
+import time
+import sqlite3
+import threading
+from collections import deque
+
+import pandas as pd
+
+EVENT_COLUMNS = ["ts", "kind", "user", "plan", "name", "value", "meta"]
+
+class EventLog:
+    def __init__(self, root, max_bytes=64 * 1024 * 1024, max_segments=30, flush_sec=2.0, batch=500, max_queue=50000):
+        self.root = root
+        self.max_bytes, self.max_segments = max_bytes, max_segments
+        self.flush_sec, self.batch = flush_sec, batch
+        self.queue = deque(maxlen=max_queue) # 작성자가 못 따라가면 가장 오래된 이벤트부터 버립니다 (요청 경로는 절대 안 막힘)
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.db = None
+        self.path = None
+        self.counts = {"logged": 0, "written": 0, "dropped": 0, "flushes": 0, "rotations": 0}
+        self._thread = None
+        os.makedirs(root, exist_ok=True)
+
+    def log(self, kind, user=None, plan=None, name=None, value=None, **meta):
+        ev = (time.time(), kind, user, plan, name, None if value is None else float(value), json.dumps(meta, ensure_ascii=False, default=str) if meta else None)
+        with self.cond:
+            if len(self.queue) == self.queue.maxlen: self.counts['dropped'] += 1
+            self.queue.append(ev)
+            self.counts['logged'] += 1
+            if len(self.queue) >= self.batch: self.cond.notify()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self.cond: self.cond.wait(timeout=self.flush_sec)
+            try: self.flush()
+            except Exception: pass
+
+    def flush(self):
+        with self.cond:
+            rows = list(self.queue)
+            self.queue.clear()
+        if not rows: return 0
+        with self.write_lock:
+            db = self.segment()
+            with db: db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.counts['written'] += len(rows)
+            self.counts['flushes'] += 1
+            if self.size() >= self.max_bytes: self.rotate()
+        return len(rows)
+
+    def size(self):
+        # WAL 모드라 체크포인트 전까지는 -wal 파일에 쌓이므로 둘을 합쳐서 봅니다.
+        return sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+
+    def segment(self):
+        if self.db is None:
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            self.path = os.path.join(self.root, f"events-{stamp}-{os.getpid()}-{self.counts['rotations']:04d}.db")
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS events (ts REAL, kind TEXT, user TEXT, plan TEXT, name TEXT, value REAL, meta TEXT)")
+        return self.db
+
+    def rotate(self):
+        self.db.close()
+        self.db = None
+        self.counts['rotations'] += 1
+        for old in self.segments()[:-self.max_segments]:
+            for path in (old, old + "-wal", old + "-shm"):
+                try: os.remove(path)
+                except OSError: pass
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.root, "events-*.db")))
+
+    def frame(self, since=None, kinds=None):
+        # 저장된 이벤트 -> DataFrame (since: 유닉스 시각, kinds: 종류 목록). 마지막으로 쓴 시각이 since 보다 이른 세그먼트는 건너뜁니다.
+        # (세그먼트는 프로세스마다 따로라 파일 이름 순서가 시간 순서가 아니므로, 이름 대신 파일 수정 시각으로 판단)
+        where, params = [], []
+        if since is not None: where.append("ts >= ?"); params.append(since)
+        if kinds: where.append(f"kind IN ({','.join('?' * len(kinds))})"); params.extend(kinds)
+        sql = "SELECT * FROM events" + (" WHERE " + " AND ".join(where) if where else "")
+        frames = []
+        for path in self.segments():
+            if since is not None and segment_mtime(path) < since - 60: continue
+            try:
+                with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as db:
+                    frames.append(pd.read_sql_query(sql, db, params=params))
+            except Exception:
+                continue
+        frames = [f for f in frames if not f.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=EVENT_COLUMNS)
+
+    def stats(self):
+        with self.cond: return {**self.counts, "queued": len(self.queue), "segments": len(self.segments())}
+
+def segment_mtime(path):
+    # 세그먼트에 마지막으로 쓴 시각 (WAL 모드라 -wal 파일 쪽이 더 최근일 수 있음). 모르면 0 이 아니라 '지금'으로 보고 읽습니다.
+    times = [os.path.getmtime(p) for p in (path, path + "-wal") if os.path.exists(p)]
+    return max(times) if times else time.time()
+
+def daily_counts(log, kind, by="plan", days=30, tz="Asia/Seoul"):
+    # 날짜 x by(plan/name/...) 이벤트 수. 예: daily_counts(log, "ai_call") -> 요금제별 일간 AI 호출 수
+    df = log.frame(since=time.time() - days * 86400, kinds=[kind])
+    if df.empty: return pd.DataFrame()
+    df['day'] = pd.to_datetime(df['ts'], unit='s', utc=True).dt.tz_convert(tz).dt.date
+    return df.pivot_table(index='day', columns=df[by].fillna("-"), values='ts', aggfunc='count', fill_value=0).sort_index(ascending=False)
+
+def latency_summary(log, kind="upstream", days=1):
+    # 이름별 호출 수 / 실패 수 / 지연 시간 p50, p95, 최대 (value = 초)
+    df = log.frame(since=time.time() - days * 86400, kinds=[kind])
+    if df.empty: return pd.DataFrame()
+    df['failed'] = df['meta'].fillna("").str.contains('"ok": false')
+    g = df.groupby('name')
+    out = pd.DataFrame({"calls": g.size(), "failed": g['failed'].sum(), "p50_ms": g['value'].median() * 1000,
+                        "p95_ms": g['value'].quantile(0.95) * 1000, "max_ms": g['value'].max() * 1000})
+    return out.round(1).sort_values("calls", ascending=False)
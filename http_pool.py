@@ -0,0 +1,102 @@
+# -----------------------------------------------------------------------------
+# Market Logic 외부 HTTP 호출 (연결 재사용 + 호스트별 제한 시간 + 재시도 + 엔드포인트별 지연/오류 집계)
+# -----------------------------------------------------------------------------
+# 💡 프로세스당 requests.Session 1개를 모든 화면/스레드가 같이 씁니다. (urllib3 연결 풀이라 TLS 연결을 호스트별로 재사용)
+# 제한 시간은 (연결, 읽기) 초. 느린 서버가 로그인 화면을 무한정 붙잡지 못하게 모든 호출에 반드시 걸립니다.
+# 재시도: 연결 실패/제한 시간/429·5xx 응답이면 점점 길게(지터 포함) 쉬었다가 다시 보냅니다.
+#         단, GET 이 아닌 호출(구글 토큰 교환처럼 한 번만 써야 하는 요청)은 '연결 자체가 안 된 경우'에만 다시 보냅니다.
+import time
+import random
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+DEFAULT_TIMEOUT = (3.05, 10)
+HOST_TIMEOUTS = {
+    "oauth2.googleapis.com": (3.05, 8),
+    "www.googleapis.com": (3.05, 8),
+    "api.stlouisfed.org": (3.05, 10),
+    "en.wikipedia.org": (3.05, 15),
+}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT = {"GET", "HEAD", "OPTIONS"}
+
+def not_sent(e):
+    # 요청이 서버에 닿기 전에 실패했는지 (연결 제한 시간 / 연결 거부 / DNS 실패). 원인 사슬을 따라가며 확인합니다.
+    if isinstance(e, requests.ConnectTimeout): return True
+    seen = set()
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        if isinstance(e, NewConnectionError): return True # NameResolutionError 도 여기 하위 클래스
+        e = getattr(e, "reason", None) or (e.args[0] if e.args and isinstance(e.args[0], BaseException) else None) or e.__cause__
+    return False
+
+class HttpClient:
+    def __init__(self, timeouts=None, retries=2, backoff=0.5, pool_size=16, observe=None):
+        self.timeouts = {**HOST_TIMEOUTS, **(timeouts or {})}
+        self.retries, self.backoff = retries, backoff
+        self.observe = observe # fn(엔드포인트, 초, 상태 코드 또는 None, 시도 횟수) / 호출마다 1번
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.lock = threading.Lock()
+        self.metrics = {} # 엔드포인트 -> {"calls", "errors", "retries", "latency": 최근 지연(초)}
+
+    def request(self, method, url, endpoint=None, retries=None, **kwargs):
+        method = method.upper()
+        u = urlparse(url)
+        endpoint = endpoint or f"{u.hostname}{u.path}" # 쿼리(키 포함)는 집계 이름에 넣지 않습니다
+        kwargs.setdefault("timeout", self.timeouts.get(u.hostname, DEFAULT_TIMEOUT))
+        retries = self.retries if retries is None else retries
+        t0 = time.perf_counter()
+        res, attempt = None, 0
+        try:
+            while True:
+                res = None
+                try:
+                    res = self.session.request(method, url, **kwargs)
+                    if res.status_code not in RETRY_STATUS or method not in IDEMPOTENT or attempt >= retries: return res
+                    res.close() # 다시 보낼 응답은 연결을 풀에 바로 돌려줍니다
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    # 읽기 단계에서 끊긴 요청은 서버가 이미 처리했을 수 있으므로 GET 만 다시 보냅니다.
+                    safe = method in IDEMPOTENT or not_sent(e)
+                    if not safe or attempt >= retries: raise
+                attempt += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+        finally:
+            self.record(endpoint, time.perf_counter() - t0, res.status_code if res is not None else None, attempt)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def record(self, endpoint, seconds, status, attempt):
+        with self.lock:
+            m = self.metrics.setdefault(endpoint, {"calls": 0, "errors": 0, "retries": 0, "latency": deque(maxlen=512)})
+            m['calls'] += 1
+            m['retries'] += attempt
+            if status is None or status >= 400: m['errors'] += 1
+            m['latency'].append(seconds)
+        if self.observe is not None:
+            try: self.observe(endpoint, seconds, status, attempt)
+            except Exception: pass
+
+    def stats(self):
+        # 엔드포인트별 호출/오류/재시도 수 + 최근 지연 p50/p95 (ms)
+        with self.lock:
+            rows = {k: (m['calls'], m['errors'], m['retries'], np.array(m['latency'])) for k, m in self.metrics.items()}
+        return {k: {"calls": c, "errors": e, "retries": r,
+                    "p50_ms": round(float(np.percentile(lat, 50)) * 1000, 1) if len(lat) else None,
+                    "p95_ms": round(float(np.percentile(lat, 95)) * 1000, 1) if len(lat) else None}
+                for k, (c, e, r, lat) in rows.items()}
+
+    def close(self):
+        self.session.close()
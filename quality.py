@@ -0,0 +1,156 @@
+# -----------------------------------------------------------------------------
+# Market Logic 데이터 품질 검사 (수집/추가되는 시리즈마다 배열 연산으로 한 번에)
+# -----------------------------------------------------------------------------
+# 💡 validate_series(df, rules, ref) -> (정리된 df, 품질 꼬리표)
+#   고칠 수 있는 문제(중복 날짜, 정렬, 시간대 어긋남, 숫자 아닌 값)는 고치고 꼬리표에 기록하고,
+#   고칠 수 없는 문제(미래 날짜, 0 이하 가격, 직전 정상본과 단위가 달라짐, 비정상 급변)는 격리(quarantine)합니다.
+#   격리된 데이터는 캐시/공유 캐시/AI 프롬프트에 들어가지 않고, 호출하는 쪽이 직전 정상본(ref)을 대신 씁니다.
+import time
+from collections import OrderedDict
+import threading
+
+import numpy as np
+import pandas as pd
+
+# 기본 규칙. stale_days: 마지막 관측이 이보다 오래되면 '끊김' 표시, price: 0 이하 금지 + 로그 수익률로 급변 검사
+# max_move: 새로 붙은 관측치의 한 칸 변화가 이보다 크면 격리 (None 이면 검사 안 함), spike_z: 경고만 하는 강건 z-score 기준
+# scale_tol: 직전 정상본과 겹치는 날짜의 값 비율이 이만큼 어긋나면 단위가 바뀐 것으로 보고 격리
+# spike_recent: 급변 경고는 최근 이 칸 수 안에서만 셉니다 (2020년 폭락 같은 과거 급변이 계속 경고로 뜨지 않게)
+# level: (하한, 상한) 마지막 값이 이 범위를 벗어나면 격리. 직전 정상본이 없는 첫 수집에서도 단위 바뀜(^DJI -> DIA 등)을 잡습니다.
+DEFAULT_RULES = {"stale_days": 7, "price": True, "max_move": 0.25, "spike_z": 12.0, "spike_recent": 5, "scale_tol": 0.2, "min_rows": 2, "level": None}
+
+ISSUE_TEXT = {
+    "nan_dropped": "숫자가 아닌 값 {}개 제거", "duplicates": "중복 날짜 {}개 정리", "unsorted": "날짜 순서 정렬",
+    "tz_drift": "시간대 어긋남 보정", "stale": "마지막 관측 {}일 전", "spikes": "급변 관측치 {}개", "substitute": "대체 데이터({}) 사용",
+    "future_dates": "미래 날짜 {}개", "non_positive": "0 이하 값 {}개", "scale_break": "직전 데이터와 단위 불일치({:+.0%})",
+    "jump": "새 관측치 비정상 급변({:+.1%})", "too_short": "관측치 부족({}개)", "out_of_range": "값 범위 벗어남({:,.2f})",
+}
+FATAL = {"future_dates", "non_positive", "scale_break", "jump", "too_short", "out_of_range"}
+
+def validate_series(df, rules=None, ref=None, now=None, **extra_flags):
+    rules = {**DEFAULT_RULES, **(rules or {})}
+    now = pd.Timestamp(now or time.time(), unit='s') if not isinstance(now, pd.Timestamp) else now
+    issues = dict(extra_flags)
+    if df is None or df.empty: return None, {"issues": {"too_short": 0}, "quarantined": "too_short", "checked": time.time()}
+
+    dates = pd.DatetimeIndex(pd.to_datetime(df['Date']))
+    if dates.tz is not None: dates = dates.tz_localize(None)
+    values = pd.to_numeric(df['Value'], errors='coerce').to_numpy(dtype=float)
+
+    # 1) 숫자 아닌 값 / 무한대
+    bad = ~np.isfinite(values)
+    if bad.any(): issues['nan_dropped'] = int(bad.sum())
+    dates, values = dates[~bad], values[~bad]
+    # 2) 시간대 어긋남: 일봉인데 자정이 아닌 시각이 섞여 있으면 날짜로 내림
+    day = dates.normalize()
+    if (dates != day).any():
+        issues['tz_drift'] = int((dates != day).sum())
+        dates = day
+    # 3) 정렬 + 중복 날짜 (마지막 값 유지)
+    if not dates.is_monotonic_increasing:
+        issues['unsorted'] = 1
+        order = np.argsort(dates.values, kind='stable')
+        dates, values = dates[order], values[order]
+    dup = dates.duplicated(keep='last')
+    if dup.any():
+        issues['duplicates'] = int(dup.sum())
+        dates, values = dates[~dup], values[~dup]
+
+    if len(values) < rules['min_rows']: issues['too_short'] = len(values)
+    future = dates > now + pd.Timedelta(days=1)
+    if future.any(): issues['future_dates'] = int(future.sum())
+    if rules['price'] and (values <= 0).any(): issues['non_positive'] = int((values <= 0).sum())
+
+    if rules['level'] is not None and len(values):
+        lo, hi = rules['level']
+        if (lo is not None and values[-1] < lo) or (hi is not None and values[-1] > hi): issues['out_of_range'] = float(values[-1])
+
+    if len(values) >= 2 and not (rules['price'] and (values <= 0).any()):
+        moves = np.diff(np.log(values)) if rules['price'] else np.diff(values)
+        # 급변 경고: 중앙값/MAD 기반 강건 z-score (과거 폭락장처럼 진짜 급변도 있으므로 경고만)
+        mad = np.median(np.abs(moves - np.median(moves))) * 1.4826
+        if mad > 0:
+            z = np.abs(moves[-rules['spike_recent']:] - np.median(moves)) / mad
+            if (z > rules['spike_z']).any(): issues['spikes'] = int((z > rules['spike_z']).sum())
+
+    if ref is not None and not ref.empty and len(values):
+        # 직전 정상본과 겹치는 날짜: 값 비율의 중앙값이 크게 벗어나면 단위가 바뀐 것 (^DJI -> DIA 대체 등)
+        ref_s = pd.Series(ref['Value'].to_numpy(dtype=float), index=pd.DatetimeIndex(ref['Date']))
+        common = ref_s.index.intersection(dates[:-1]) # 마지막 칸은 장중에 바뀌므로 제외
+        if len(common):
+            a, b = pd.Series(values, index=dates)[common].to_numpy(), ref_s[common].to_numpy()
+            if (a > 0).all() and (b > 0).all(): # 양수 시리즈만 (금리 ^TNX 처럼 수준 값도 단위 x10 변경을 잡음)
+                ratio = float(np.median(a / b) - 1)
+                if abs(ratio) > rules['scale_tol']: issues['scale_break'] = ratio
+        # 새로 붙은 관측치의 비정상 급변 (직전 정상본의 마지막 값 대비)
+        if rules['max_move'] is not None and rules['price']:
+            tail = values[dates > ref_s.index[-1]] if len(ref_s) else values[:0]
+            if len(tail):
+                chain = np.concatenate([[ref_s.iloc[-1]], tail])
+                step = chain[1:] / chain[:-1] - 1
+                worst = step[np.argmax(np.abs(step))]
+                if abs(worst) > rules['max_move'] and 'scale_break' not in issues: issues['jump'] = float(worst)
+
+    if len(dates):
+        age = (now.normalize() - dates[-1]).days
+        if age > rules['stale_days']: issues['stale'] = int(age)
+    fatal = [k for k in issues if k in FATAL]
+    clean = pd.DataFrame({'Date': dates, 'Value': values})
+    return clean, {"issues": issues, "quarantined": fatal[0] if fatal else None,
+                   "asof": dates[-1] if len(dates) else None, "checked": time.time()}
+
+def describe_issues(q):
+    # 품질 꼬리표 -> "마지막 관측 6일 전, 중복 날짜 2개 정리"
+    if not q: return ""
+    parts = []
+    for k, v in q.get('issues', {}).items():
+        text = ISSUE_TEXT.get(k, k)
+        try: parts.append(text.format(v))
+        except (ValueError, IndexError): parts.append(text)
+    return ", ".join(parts)
+
+class LastGood:
+    """키별 '마지막으로 검사를 통과한 데이터' (격리 때 대신 내보낼 값 + 다음 검사의 기준). 오래 안 쓴 키부터 밀려납니다.
+    backend(shared_cache 저장소)를 주면 거기에도 써 두어서, 재시작한 프로세스나 다른 복제본도 같은 기준을 씁니다."""
+    def __init__(self, max_keys=256, backend=None, key_fn=None, ttl=86400 * 60):
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.quarantine = {} # 키 -> 마지막 격리 꼬리표 (대신 내보낼 때 붙임)
+        self.max_keys = max_keys
+        self.backend, self.key_fn, self.ttl = backend, key_fn or (lambda k: k), ttl
+
+    def get(self, key):
+        with self.lock:
+            df = self.items.get(key)
+            if df is not None: self.items.move_to_end(key)
+        if df is None and self.backend is not None:
+            try: found, df = self.backend.get(self.key_fn(key))
+            except Exception: found = False
+            if not found: return None
+            self.remember(key, df)
+        return df
+
+    def put(self, key, df):
+        self.remember(key, df)
+        with self.lock: self.quarantine.pop(key, None)
+        if self.backend is not None:
+            try: self.backend.set(self.key_fn(key), df, self.ttl)
+            except Exception: pass
+
+    def remember(self, key, df):
+        with self.lock:
+            self.items[key] = df
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_keys: self.items.popitem(last=False)
+
+    def quarantined(self, key, q):
+        with self.lock: self.quarantine[key] = q
+
+    def fallback(self, key):
+        # 격리/수집 실패 때 대신 내보낼 복사본 (격리였으면 그 꼬리표를 붙여서). 정상본이 없으면 None
+        df = self.get(key)
+        if df is None: return None
+        out = df.copy()
+        with self.lock: q = self.quarantine.get(key)
+        if q is not None: out.attrs['quality'] = q
+        return out
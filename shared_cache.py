@@ -0,0 +1,334 @@
+# -----------------------------------------------------------------------------
+# Market Logic 공유 캐시 (여러 앱 복제본이 수집 데이터/AI 결과를 함께 씀)
+# 주소(URL)로 저장소를 고릅니다:
+#   sqlite:///경로/cache.db   디스크 한 파일 (같은 서버의 복제본끼리)  <- 기본값
+#   disk:///경로/디렉터리      키마다 파일 하나
+#   redis://host:6379/0       Redis 호환 서버 (여러 서버의 복제본끼리, redis 패키지 필요)
+#   memory://                 프로세스 안 대역 (테스트용)
+#   off                       공유 캐시 사용 안 함
+# -----------------------------------------------------------------------------
+import os
+import time
+import pickle
+import hashlib
+import sqlite3
+import threading
+import functools
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+
+KEY_PREFIX = "ml1:" # 저장 형식이 바뀌면 올려서 예전 항목을 통째로 무시합니다.
+
+def make_key(namespace, parts):
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    return f"{KEY_PREFIX}{namespace}:{digest}"
+
+# 💡 모든 저장소는 같은 5개 동작만 구현합니다.
+#   get(key) -> (찾음 여부, 값) / set(key, value, ttl) / acquire(key, lease) -> 토큰 또는 None
+#   release(key, token) / clear()
+# acquire 는 '이 키는 내가 받아오는 중' 표시(임대, lease 초 뒤 자동 만료)라서 프로세스가 죽어도 영원히 잠기지 않습니다.
+class MemoryBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.leases = {}
+
+    def get(self, key):
+        with self.lock:
+            hit = self.values.get(key)
+            if hit is None or hit[0] < time.time(): return False, None
+            return True, hit[1]
+
+    def set(self, key, value, ttl):
+        with self.lock: self.values[key] = (time.time() + ttl, value)
+
+    def acquire(self, key, lease):
+        with self.lock:
+            held = self.leases.get(key)
+            if held and held[1] > time.time(): return None
+            token = uuid.uuid4().hex
+            self.leases[key] = (token, time.time() + lease)
+            return token
+
+    def release(self, key, token):
+        with self.lock:
+            if self.leases.get(key, (None,))[0] == token: del self.leases[key]
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+            self.leases.clear()
+
+class DiskBackend:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key, ext):
+        return os.path.join(self.root, hashlib.sha1(key.encode("utf-8")).hexdigest() + ext)
+
+    def get(self, key):
+        try:
+            with open(self.path(key, ".pkl"), "rb") as f: expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        return (True, value) if expires >= time.time() else (False, None)
+
+    def set(self, key, value, ttl):
+        # 임시 파일에 다 쓴 뒤 os.replace -> 다른 프로세스는 반쯤 쓰인 파일을 보지 않습니다.
+        path = self.path(key, ".pkl")
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f: pickle.dump((time.time() + ttl, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def acquire(self, key, lease):
+        path = self.path(key, ".lock")
+        token = uuid.uuid4().hex
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # 임대 시간이 지난 잠금 파일은 주인이 죽은 것으로 보고 치웁니다.
+                try:
+                    if time.time() - os.path.getmtime(path) <= lease: return None
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f: f.write(token)
+            return token
+        return None
+
+    def release(self, key, token):
+        path = self.path(key, ".lock")
+        try:
+            with open(path) as f: owner = f.read()
+            if owner == token: os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.root):
+            if name.endswith((".pkl", ".lock", ".tmp")):
+                try: os.remove(os.path.join(self.root, name))
+                except OSError: pass
+
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.local = threading.local()
+        db = self.conn()
+        db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, value BLOB)")
+        db.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, token TEXT, expires REAL)")
+
+    def conn(self):
+        # sqlite 연결은 스레드끼리 공유할 수 없어서 스레드마다 하나씩 엽니다. (WAL: 읽기와 쓰기가 서로 안 막힘)
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    def get(self, key):
+        row = self.conn().execute("SELECT expires, value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] < time.time(): return False, None
+        return True, pickle.loads(row[1])
+
+    def set(self, key, value, ttl):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        db = self.conn()
+        db.execute("INSERT OR REPLACE INTO cache (key, expires, value) VALUES (?, ?, ?)", (key, time.time() + ttl, blob))
+        db.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+
+    def acquire(self, key, lease):
+        token, now = uuid.uuid4().hex, time.time()
+        db = self.conn()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM leases WHERE key = ? AND expires < ?", (key, now))
+            cur = db.execute("INSERT OR IGNORE INTO leases (key, token, expires) VALUES (?, ?, ?)", (key, token, now + lease))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return token if cur.rowcount == 1 else None
+
+    def release(self, key, token):
+        self.conn().execute("DELETE FROM leases WHERE key = ? AND token = ?", (key, token))
+
+    def clear(self):
+        db = self.conn()
+        db.execute("DELETE FROM cache")
+        db.execute("DELETE FROM leases")
+
+class RedisBackend:
+    # 토큰이 내 것일 때만 지우는 스크립트 (남의 임대를 지우지 않도록)
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, url):
+        import redis # 선택 의존성: Redis 를 쓸 때만 필요합니다.
+        self.r = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=5)
+        self.r.ping()
+
+    def get(self, key):
+        blob = self.r.get(key)
+        return (False, None) if blob is None else (True, pickle.loads(blob))
+
+    def set(self, key, value, ttl):
+        self.r.set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ex=max(1, int(ttl)))
+
+    def acquire(self, key, lease):
+        token = uuid.uuid4().hex
+        return token if self.r.set(f"{key}:lease", token, nx=True, px=int(lease * 1000)) else None
+
+    def release(self, key, token):
+        self.r.eval(self.RELEASE_SCRIPT, 1, f"{key}:lease", token)
+
+    def clear(self):
+        for k in self.r.scan_iter(match=f"{KEY_PREFIX}*", count=500): self.r.delete(k)
+
+def open_backend(url):
+    # 💡 주소가 잘못됐거나 서버에 못 붙으면 None -> 앱은 프로세스 캐시만으로 그대로 돌아갑니다.
+    if not url or url in ("off", "none"): return None
+    try:
+        if url.startswith("memory://"): return MemoryBackend()
+        if url.startswith("sqlite://"): return SQLiteBackend(url[len("sqlite://"):])
+        if url.startswith("disk://"): return DiskBackend(url[len("disk://"):])
+        if url.startswith(("redis://", "rediss://", "unix://")): return RedisBackend(url)
+    except Exception:
+        return None
+    return None
+
+# -----------------------------------------------------------------------------
+# 단일 비행(single-flight): 같은 키를 동시에 찾는 세션들은 첫 번째 호출 1개의 결과를 함께 기다립니다.
+# -----------------------------------------------------------------------------
+# 💡 5분 epoch 가 넘어가거나 6:40 동결이 바뀌는 순간에는 모든 세션이 한꺼번에 캐시를 놓칩니다.
+# 그때 세션마다 야후/gpt-4o 를 부르지 않도록, 진행 중인 호출의 Future 를 키별로 걸어 둡니다.
+class SingleFlight:
+    def __init__(self, max_keys=512):
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.stats = OrderedDict() # 라벨 -> 통계 (오래된 키부터 밀려남)
+        self.max_keys = max_keys
+
+    def do(self, key, label, fn):
+        with self.lock:
+            fut = self.inflight.get(key)
+            leader = fut is None
+            if leader: fut = self.inflight[key] = Future()
+        if not leader:
+            t0 = time.perf_counter()
+            try:
+                return fut.result()
+            finally:
+                self.record(label, joined=1, wait=time.perf_counter() - t0)
+        self.record(label, lead=1)
+        try:
+            fut.set_result(fn())
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with self.lock: self.inflight.pop(key, None)
+        return fut.result()
+
+    def record(self, label, **counts):
+        with self.lock:
+            st = self.stats.pop(label, None) or {"lead": 0, "upstream": 0, "joined": 0, "remote": 0, "wait_sum": 0.0, "wait_max": 0.0, "last": 0.0}
+            for k in ("lead", "upstream", "joined", "remote"): st[k] += counts.get(k, 0)
+            wait = counts.get("wait", 0.0)
+            st["wait_sum"] += wait
+            st["wait_max"] = max(st["wait_max"], wait)
+            st["last"] = time.time()
+            self.stats[label] = st
+            while len(self.stats) > self.max_keys: self.stats.popitem(last=False)
+
+    def snapshot(self):
+        # 화면 표시용: 키별 호출 수 / 원천 호출 수 / 절약한 중복 호출 수 / 대기 시간
+        with self.lock: items = list(self.stats.items())
+        rows = []
+        for label, st in items:
+            waited = st["joined"] + st["remote"]
+            rows.append({"key": label, "calls": st["lead"] + st["joined"], "upstream": st["upstream"], "saved": waited,
+                         "avg_wait_ms": round(1000 * st["wait_sum"] / waited, 1) if waited else 0.0,
+                         "max_wait_ms": round(1000 * st["wait_max"], 1), "last": st["last"]})
+        return sorted(rows, key=lambda r: -r["last"])
+
+FLIGHTS = SingleFlight()
+
+def flight_stats():
+    return FLIGHTS.snapshot()
+
+def key_label(namespace, parts):
+    text = ", ".join(str(p) for p in parts)
+    return f"{namespace}({text[:80]})"
+
+def shared_cached(get_backend, namespace, ttl, lease=120, poll=0.25, key=None, accept=None, observe=None):
+    """공유 캐시 데코레이터. st.cache_data 안쪽에 붙여서 '프로세스 캐시 -> 공유 캐시 -> 원천' 순서로 찾습니다.
+
+    get_backend: 저장소를 돌려주는 함수 (None 이면 그냥 원천 호출)
+    key: 인자 -> 캐시 키에 넣을 값 (API 키처럼 키에서 빼야 할 인자가 있을 때)
+    accept: 결과 -> 저장 여부 (실패/빈 결과는 공유하지 않고 다음 호출이 다시 시도)
+    observe: 원천 호출 1회마다 observe(namespace, label, 걸린 초, 성공 여부) (사용 기록용, 예외는 무시)
+    같은 프로세스 안의 동시 호출은 SingleFlight 로, 복제본끼리는 저장소 임대(lease)로 묶습니다.
+    """
+    key = key or (lambda *a, **k: a + tuple(sorted(k.items())))
+    accept = accept or (lambda v: v is not None)
+
+    def deco(fn):
+        def upstream(label, args, kwargs):
+            FLIGHTS.record(label, upstream=1)
+            if observe is None: return fn(*args, **kwargs)
+            t0, ok = time.perf_counter(), False
+            try:
+                value = fn(*args, **kwargs)
+                ok = accept(value)
+                return value
+            finally:
+                try: observe(namespace, label, time.perf_counter() - t0, ok)
+                except Exception: pass
+
+        def lookup(ck, label, args, kwargs):
+            backend = get_backend()
+            if backend is None: return upstream(label, args, kwargs)
+            t0 = time.perf_counter()
+            try:
+                found, value = backend.get(ck)
+                if found: return value
+                # 💡 같은 키를 다른 복제본이 받아오는 중이면 기다렸다가 그 결과를 씁니다. (키당 원천 호출 1회)
+                deadline = time.time() + lease
+                token = backend.acquire(ck, lease)
+                while token is None and time.time() < deadline:
+                    time.sleep(poll)
+                    found, value = backend.get(ck)
+                    if found:
+                        FLIGHTS.record(label, remote=1, wait=time.perf_counter() - t0)
+                        return value
+                    token = backend.acquire(ck, lease)
+            except Exception:
+                token = None # 저장소 장애는 화면 장애로 번지지 않게
+            if token is None: return upstream(label, args, kwargs) # 장애 또는 임대 주인이 응답 없음 -> 직접 받아옴
+            try:
+                try: found, value = backend.get(ck) # 임대를 얻는 사이에 다른 쪽이 채웠을 수 있음
+                except Exception: found = False
+                if found: return value
+                value = upstream(label, args, kwargs)
+                if accept(value):
+                    try: backend.set(ck, value, ttl)
+                    except Exception: pass
+                return value
+            finally:
+                try: backend.release(ck, token)
+                except Exception: pass
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            parts = key(*args, **kwargs)
+            ck = make_key(namespace, parts)
+            label = key_label(namespace, parts)
+            return FLIGHTS.do(ck, label, lambda: lookup(ck, label, args, kwargs))
+        return wrapper
+    return deco
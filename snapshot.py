@@ -0,0 +1,194 @@
+# -----------------------------------------------------------------------------
+# Market Logic 헤드리스 스냅샷 빌더
+# 사용법:
+#   python snapshot.py build [--out DIR] [--no-ai] [--keep N]   # 크론/스케줄러에서 6:40 KST 이후 실행
+#   python snapshot.py show [--out DIR]                         # 최신 번들 요약 출력
+#   python snapshot.py pregen [--mode batch|local] [--wait SEC] # 4개 섹션 AI 분석 사전 생성 (공유 캐시에 저장)
+#   python snapshot.py alerts                                   # 지표 알림 구독을 1회 평가/발송 (앱 밖 크론용)
+#   python snapshot.py digest [--to a@x.com,b@y.com] [--force]  # Pro 회원 데일리 다이제스트 발송 (6:40 이후 1회)
+# 💡 화면 없이 data_engine 만으로 시세/지표/시장 지도/VIP 리포트를 미리 만들어 두면,
+#    앱은 epoch(또는 6:40 꼬리표)가 같은 동안 외부 API 대신 이 번들을 읽습니다.
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import data_engine as de
+
+def series_file(key):
+    # "yahoo:^GSPC" -> "series/yahoo_GSPC.parquet"
+    safe = "".join(c if c.isalnum() else "_" for c in key).strip("_")
+    return f"series/{safe}.parquet"
+
+def write_series(root, meta, key, epoch, period, res):
+    _, _, _, df = res
+    if df is None or len(df) < 2:
+        print(f"  ! {key}: 데이터 없음 (건너뜀)")
+        return
+    rel = series_file(key)
+    df[['Date', 'Value']].to_parquet(os.path.join(root, rel), engine="pyarrow", index=False)
+    meta['series'][key] = {"file": rel, "epoch": epoch, "period": period, "rows": len(df)}
+    print(f"  - {key}: {len(df)}행 (epoch {epoch})")
+
+def write_object(root, meta, name, obj, freeze_key):
+    if obj is None or (hasattr(obj, "empty") and obj.empty) or (isinstance(obj, list) and not obj):
+        print(f"  ! {name}: 비어 있음 (건너뜀)")
+        return
+    if hasattr(obj, "to_parquet"):
+        rel = f"objects/{name}.parquet"
+        obj.to_parquet(os.path.join(root, rel), engine="pyarrow", index=False)
+    elif isinstance(obj, str):
+        rel = f"objects/{name}.txt"
+        with open(os.path.join(root, rel), "w", encoding="utf-8") as f: f.write(obj)
+    else:
+        rel = f"objects/{name}.json"
+        with open(os.path.join(root, rel), "w", encoding="utf-8") as f: json.dump(obj, f, ensure_ascii=False)
+    meta['objects'][name] = {"file": rel, "freeze_key": freeze_key}
+    print(f"  - {name}: {rel}")
+
+def write_latest(out, name):
+    # LATEST 포인터도 임시 파일 -> os.replace 로 바꿔서 앱이 반쯤 쓰인 이름을 읽지 않게 합니다.
+    tmp = os.path.join(out, ".LATEST.tmp")
+    with open(tmp, "w", encoding="utf-8") as f: f.write(name)
+    os.replace(tmp, os.path.join(out, "LATEST"))
+
+def prune(out, keep):
+    bundles = sorted(d for d in os.listdir(out) if os.path.isfile(os.path.join(out, d, "meta.json")))
+    for d in bundles[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(out, d), ignore_errors=True)
+
+def build(out, use_ai=True, keep=3):
+    # 💡 빌더는 스냅샷을 '쓰는' 쪽이므로 이전 스냅샷을 읽지 않고 항상 원천에서 새로 받습니다.
+    de.SNAPSHOT_READS = False
+    freeze_key = de.get_freeze_key()
+    name = datetime.now(ZoneInfo("Asia/Seoul")).strftime("%Y%m%d-%H%M%S")
+    tmp = os.path.join(out, f".{name}.tmp")
+    os.makedirs(os.path.join(tmp, "series"), exist_ok=True)
+    os.makedirs(os.path.join(tmp, "objects"), exist_ok=True)
+    meta = {"schema": de.SNAPSHOT_SCHEMA, "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "freeze_key": freeze_key, "series": {}, "objects": {}, "metrics": {}}
+
+    print(f"[1/3] 시세/지표 수집 (동결 꼬리표 {freeze_key})")
+    for t in de.SNAPSHOT_YAHOO:
+        epoch = de.market_epoch(t)
+        write_series(tmp, meta, f"yahoo:{t}", epoch, "10y", de.without_failures(de.fetch_yahoo_data, t, "10y", epoch, default=(None, None, None, None)))
+    for sid, calc in de.SNAPSHOT_FRED:
+        epoch = de.fred_epoch(sid)
+        write_series(tmp, meta, f"fred:{sid}:{calc}", epoch, None, de.without_failures(de.fetch_fred_data, sid, calc, epoch, default=(None, None, None, None)))
+
+    print("[2/3] 시장 지도 / VIP 리포트")
+    write_object(tmp, meta, "market_map", de.get_frozen_market_map(freeze_key), freeze_key)
+    write_object(tmp, meta, "constituent_map", de.get_frozen_constituent_map(freeze_key), freeze_key)
+    for group in de.BREADTH_GROUPS:
+        epoch = de.breadth_epoch(group) # 섹터 표는 묶음 거래소의 장 꼬리표로 (read_snapshot_object 가 같은 값과 비교)
+        write_object(tmp, meta, f"sector_breadth_{group}", de.without_failures(de.fetch_sector_breadth, epoch, group), epoch)
+    api_key = de.get_secret("openai_api_key")
+    if use_ai and api_key:
+        try:
+            write_object(tmp, meta, "vip_report", de.get_daily_vip_report(freeze_key, api_key), freeze_key)
+        except Exception as e:
+            print(f"  ! vip_report: 생성 실패 ({e})")
+    else:
+        print("  - vip_report: 건너뜀 (--no-ai 또는 OpenAI 키 없음)")
+
+    for label in de.DERIVED_SERIES:
+        val = de.get_derived_value(label)
+        if val is not None: meta['metrics'][label] = round(val, 2)
+
+    print("[3/3] 번들 저장")
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f: json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(out, name))
+    write_latest(out, name)
+    prune(out, keep)
+    print(f"완료: {os.path.join(out, name)} (시리즈 {len(meta['series'])}개, 객체 {len(meta['objects'])}개)")
+    return 0 if meta['series'] else 1
+
+def show(out):
+    try:
+        with open(os.path.join(out, "LATEST"), encoding="utf-8") as f: name = f.read().strip()
+        with open(os.path.join(out, name, "meta.json"), encoding="utf-8") as f: meta = json.load(f)
+    except OSError:
+        print(f"스냅샷 없음: {out}")
+        return 1
+    print(f"{name}  (생성 {meta['created_at']}, 동결 꼬리표 {meta['freeze_key']})")
+    for k, v in meta['series'].items(): print(f"  {k:<24} {v['rows']:>6}행  epoch {v['epoch']}")
+    for k, v in meta['objects'].items(): print(f"  {k:<24} {v['file']}")
+    for k, v in meta['metrics'].items(): print(f"  {k:<24} {v}")
+    return 0
+
+def pregen(mode, wait):
+    # 💡 6:40 동결 직후 실행. batch 가 wait 안에 안 끝나면 다음 실행(예: 10분 뒤 크론)이 결과만 거둬 갑니다.
+    api_key = de.get_secret("openai_api_key")
+    if not api_key:
+        print("OpenAI 키 없음 (secrets 의 openai_api_key 또는 환경변수 OPENAI_API_KEY)")
+        return 1
+    if de.get_shared_cache() is None:
+        print("공유 캐시가 꺼져 있어 결과를 앱과 나눌 수 없습니다. (shared_cache_url 확인)")
+        return 1
+    freeze_key = de.get_freeze_key()
+    print(f"섹션 분석 사전 생성 (동결 꼬리표 {freeze_key}, 방식 {mode})")
+    res = de.pregenerate_section_analyses(api_key, mode=mode, wait=wait, freeze_key=freeze_key)
+    for topic in de.AI_SECTION_TOPICS:
+        state = "완료" if de.get_pregenerated_analysis(freeze_key, topic) else ("실패: " + res['errors'][topic] if topic in res['errors'] else "대기")
+        print(f"  - {topic}: {state}")
+    if res['pending']: print(f"batch {res['pending']} 진행 중 -> 나중에 다시 실행하면 결과를 거둬 갑니다.")
+    return 1 if res['errors'] else 0
+
+def alerts():
+    engine = de.AlertEngine(de.get_alert_store(), de.open_sink(de.get_secret("alert_sink", de.ALERT_SINK_DEFAULT)), de.latest_alert_values)
+    notes = engine.run_once()
+    stats = engine.stats()
+    print(f"규칙 {stats['rules']}개 평가, 알림 {len(notes)}건 (발송 {stats['sent']} / 실패 {stats['failed']})")
+    return 1 if stats['failed'] else 0
+
+def digest(to=None, force=False, workers=de.DIGEST_WORKERS):
+    api_key = de.get_secret("openai_api_key")
+    recipients = [t.strip() for t in to.split(",") if t.strip()] if to else None
+    try:
+        r = de.send_daily_digest(api_key, recipients, force=force, workers=workers)
+    except RuntimeError as e:
+        print(e)
+        return 1
+    if not r['recipients']:
+        print(f"보낼 대상 없음 (동결 꼬리표 {r['freeze_key']}, 이미 받은 회원 {r['skipped']}명)")
+        return 0
+    print(f"다이제스트 {r['mail']} ({r['bytes']:,}바이트, 렌더링 {r['render_sec']}초) -> {r['recipients']}명")
+    print(f"  발송 {r['sent']} / 실패 {r['failed']} / 재시도 {r['retried']}  ({r['seconds']}초, 초당 {r['per_sec']}통, 이미 받은 회원 {r['skipped']}명)")
+    for addr, err in r['errors'].items(): print(f"  ! {addr}: {err}")
+    return 1 if r['failed'] else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Market Logic 스냅샷 번들 빌더")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="원천 데이터를 받아 새 번들을 만듭니다")
+    b.add_argument("--out", default=de.SNAPSHOT_DIR)
+    b.add_argument("--no-ai", action="store_true", help="VIP 리포트(OpenAI 호출) 생략")
+    b.add_argument("--keep", type=int, default=3, help="보관할 번들 개수")
+    s = sub.add_parser("show", help="최신 번들 요약")
+    s.add_argument("--out", default=de.SNAPSHOT_DIR)
+    g = sub.add_parser("pregen", help="4개 섹션 AI 분석을 미리 만들어 공유 캐시에 저장")
+    g.add_argument("--mode", choices=["batch", "local"], default="batch", help="batch: OpenAI Batch API, local: 바로 동시 호출")
+    g.add_argument("--wait", type=int, default=1800, help="batch 결과를 기다릴 최대 초")
+    sub.add_parser("alerts", help="지표 알림 구독을 1회 평가하고 발송")
+    d = sub.add_parser("digest", help="Pro 회원에게 데일리 다이제스트 발송")
+    d.add_argument("--to", help="수신자를 직접 지정 (쉼표로 구분, 생략하면 구글 시트의 Pro 회원)")
+    d.add_argument("--force", action="store_true", help="이미 받은 회원에게도 다시 발송")
+    d.add_argument("--workers", type=int, default=de.DIGEST_WORKERS, help="동시 발송 작업자 수")
+    args = parser.parse_args(argv)
+    if args.cmd == "build":
+        os.makedirs(args.out, exist_ok=True)
+        return build(args.out, use_ai=not args.no_ai, keep=args.keep)
+    if args.cmd == "pregen":
+        return pregen(args.mode, args.wait)
+    if args.cmd == "alerts":
+        return alerts()
+    if args.cmd == "digest":
+        return digest(args.to, args.force, args.workers)
+    return show(args.out)
+
+if __name__ == "__main__":
+    sys.exit(main())